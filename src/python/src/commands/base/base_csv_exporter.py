@@ -7,7 +7,6 @@ from typing import List, Dict, Union
 
 from MySQLdb.cursors import DictCursor
 from sqlalchemy import select, Table
-from sqlalchemy.dialects.mysql import dialect
 from sqlalchemy.sql import update
 from sqlalchemy.sql.base import Executable as SQLAlchemyExecutable
 from twisted.enterprise import adbapi
@@ -15,6 +14,7 @@ from twisted.enterprise.adbapi import Transaction
 from twisted.internet import reactor, defer
 
 from commands.base import BaseCommand
+from rmq.utils.sql_expressions import compile_expression
 
 
 class BaseCSVExporter(BaseCommand):
@@ -48,8 +48,7 @@ class BaseCSVExporter(BaseCommand):
             chunk_size = self.chunk_size
         stmt = self.build_select_query_stmt(chunk_size)
         if isinstance(stmt, SQLAlchemyExecutable):
-            stmt_compiled = stmt.compile(compile_kwargs={"literal_binds": True}, dialect=dialect())
-            transaction.execute(str(stmt_compiled))
+            transaction.execute(*compile_expression(stmt))
         if chunk_size == 1:
             return transaction.fetchone()
         return transaction.fetchall()
@@ -108,8 +107,7 @@ class BaseCSVExporter(BaseCommand):
     def update(self, transaction: Transaction, row: Dict) -> None:
         stmt = self.build_update_query_stmt(row)
         if isinstance(stmt, SQLAlchemyExecutable):
-            stmt_compiled = stmt.compile(compile_kwargs={"literal_binds": True})
-            transaction.execute(str(stmt_compiled))
+            transaction.execute(*compile_expression(stmt))
 
     def build_update_query_stmt(self, row: Dict) -> SQLAlchemyExecutable:
         export_date = {self.export_date_column: date.today().strftime("%Y-%m-%d")}
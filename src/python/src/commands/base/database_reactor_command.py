@@ -2,12 +2,12 @@ from abc import ABC
 from typing import Any, Union
 
 from MySQLdb.cursors import DictCursor
-from sqlalchemy.dialects import mysql
 from sqlalchemy.sql.base import Executable as SQLAlchemyExecutable
 from twisted.enterprise.adbapi import Transaction, ConnectionPool
 from twisted.internet.defer import Deferred
 
 from commands.base import BaseReactorCommand
+from rmq.utils.sql_expressions import compile_expression
 
 
 class DatabaseReactorCommand(BaseReactorCommand, ABC):
@@ -34,8 +34,7 @@ class DatabaseReactorCommand(BaseReactorCommand, ABC):
     def process_message(self, transaction: Transaction, message_body: Any):
         stmt = self.build_stmt(message_body)
         if isinstance(stmt, SQLAlchemyExecutable):
-            stmt_compiled = stmt.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True})
-            transaction.execute(str(stmt_compiled))
+            transaction.execute(*compile_expression(stmt))
         else:
             transaction.execute(stmt)
         return True
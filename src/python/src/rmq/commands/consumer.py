@@ -1,8 +1,11 @@
 import functools
-import json
 import logging
+import os
+import sys
+import time
 from argparse import Namespace
 from enum import Enum
+from itertools import chain, groupby
 
 import pika
 from MySQLdb import OperationalError
@@ -12,13 +15,23 @@ from scrapy.utils.log import configure_logging
 from scrapy.utils.project import get_project_settings
 from sqlalchemy.dialects import mysql
 from sqlalchemy.sql import ClauseElement
+from sqlalchemy.sql.dml import Insert
 from twisted.enterprise import adbapi
-from twisted.internet import reactor
-
-from rmq.connections import PikaSelectConnection
-from rmq.utils import RMQConstants, RMQDefaultOptions
+from twisted.internet import defer, reactor, task
+
+from rmq.connections import get_connection_class, start_connection
+from rmq.utils import (
+    PrefetchController,
+    RMQConstants,
+    RMQDefaultOptions,
+    StagingTableLoader,
+    WorkerSupervisor,
+    decode_message_body,
+    get_connection_options,
+    split_budget,
+)
 from rmq.utils.decorators import call_once
-from rmq.utils.sql_expressions import compile_expression
+from rmq.utils.sql_expressions import compile_expression, compiled_expression_cache
 
 
 class Consumer(ScrapyCommand):
@@ -29,6 +42,8 @@ class Consumer(ScrapyCommand):
 
     _DEFAULT_CHECK_INTERACT_READY_DELAY = 3  # seconds
     _DEFAULT_PREFETCH_COUNT = 4
+    _DEFAULT_BATCH_TIMEOUT = 100  # milliseconds
+    _DEFAULT_PREFETCH_ADJUST_INTERVAL = 5  # seconds
 
     def __init__(self):
         super().__init__()
@@ -41,6 +56,24 @@ class Consumer(ScrapyCommand):
         ]
         self.mode = Consumer.CommandModes.DEFAULT.value
         self.prefetch_count = self._DEFAULT_PREFETCH_COUNT
+        # messages are stored by batches of up to batch_size messages in single transaction, 0 - disabled
+        self.batch_size = 0
+        self.batch_timeout = Consumer._DEFAULT_BATCH_TIMEOUT
+        self._batch = []
+        self._batch_flush_timer = None
+        self.batches_count = 0
+        self.batch_bisections_count = 0
+        # batches are stored with LOAD DATA LOCAL INFILE through staging table, None - with INSERT statements
+        self.staging_table_loader = None
+        # adjusts prefetch count by DB latency and pool saturation, None - prefetch count is fixed
+        self.prefetch_controller = None
+        self._prefetch_adjust_loop = None
+        self._unacked_count = 0
+        self._running_interactions = 0
+        # runs --workers consumer processes, set only in the supervisor process
+        self.worker_supervisor = None
+        self._worker_prefetch_counts = []
+        self._worker_max_prefetch_counts = []
 
         self.delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
@@ -48,6 +81,9 @@ class Consumer(ScrapyCommand):
         self.queue_name = None
 
         self.rmq_connection = None
+        self.connection_class = get_connection_class(self.project_settings)
+        # the latest connection stats snapshot, pushed periodically by connection
+        self.connection_stats = {}
         self._can_interact = False
         self._can_get_next_message = False
 
@@ -87,6 +123,44 @@ class Consumer(ScrapyCommand):
             dest="prefetch_count",
             help="RabbitMQ consumer prefetch count setting",
         )
+        parser.add_argument(
+            "--adaptive-prefetch",
+            action="store_true",
+            default=False,
+            dest="adaptive_prefetch",
+            help="Adjust prefetch count at runtime by DB latency and connection pool saturation",
+        )
+        parser.add_argument(
+            "--load-data",
+            action="store_true",
+            default=False,
+            dest="load_data",
+            help="Store batches with LOAD DATA LOCAL INFILE into staging table, merged into "
+            "target table, implies batches of prefetch count messages unless --batch-size is set",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            dest="workers",
+            help="Run this number of consumer processes, each with own connection and DB pool. "
+            "Prefetch count is split between them, crashed ones are restarted",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=0,
+            dest="batch_size",
+            help="Store up to this number of messages in single transaction "
+            "and acknowledge them at once",
+        )
+        parser.add_argument(
+            "--batch-timeout",
+            type=int,
+            default=Consumer._DEFAULT_BATCH_TIMEOUT,
+            dest="batch_timeout",
+            help="Milliseconds to wait for batch to fill before storing it",
+        )
 
     def init_queue_name(self, opts: Namespace):
         queue_name = getattr(opts, "queue_name", None)
@@ -125,14 +199,35 @@ class Consumer(ScrapyCommand):
             use_unicode=True,
             cursorclass=DictCursor,
             cp_reconnect=True,
+            # LOAD DATA LOCAL INFILE of --load-data
+            local_infile=self.staging_table_loader is not None,
         )
 
     def execute(self, _args: list[str], opts: Namespace):
         self.init_queue_name(opts)
         self.init_prefetch_count(opts)
         self.mode = opts.mode
+        self.batch_size = opts.batch_size if opts.batch_size > 1 else 0
+        self.batch_timeout = opts.batch_timeout
+        if opts.load_data:
+            self.batch_size = self.batch_size or self.prefetch_count
+            self.staging_table_loader = StagingTableLoader(
+                self.project_settings.get("CONSUMER_LOAD_DATA_SPILL_DIR") or None
+            )
+            if self._is_process_message_overridden():
+                self.logger.warning(
+                    "--load-data stores rows of build_message_store_stmt, "
+                    "overridden process_message is not called"
+                )
+        if self.batch_size > self.prefetch_count:
+            self.logger.warning(
+                f"Batch size {self.batch_size} exceeds prefetch count {self.prefetch_count}, "
+                f"batches are flushed by timeout"
+            )
 
         self.init_db_connection_pool()
+        if opts.adaptive_prefetch:
+            self.init_prefetch_controller()
 
         parameters = pika.ConnectionParameters(
             host=self.project_settings.get("RABBITMQ_HOST"),
@@ -144,15 +239,64 @@ class Consumer(ScrapyCommand):
             ),
             heartbeat=RMQDefaultOptions.CONNECTION_HEARTBEAT.value,
         )
-        reactor.callInThread(self.connect, parameters, self.queue_name)
+        start_connection(self.connection_class, self.connect, parameters, self.queue_name)
+
+    def init_prefetch_controller(self):
+        self.prefetch_controller = PrefetchController.from_settings(
+            self.project_settings, self.prefetch_count
+        )
+        interval = self.project_settings.getfloat(
+            "CONSUMER_PREFETCH_ADJUST_INTERVAL", Consumer._DEFAULT_PREFETCH_ADJUST_INTERVAL
+        )
+        self._prefetch_adjust_loop = task.LoopingCall(self._adjust_prefetch_count)
+        self._prefetch_adjust_loop.start(interval, now=False)
+
+    def _adjust_prefetch_count(self):
+        pool_size = self.db_connection_pool.max
+        prefetch_count = self.prefetch_controller.update(self._running_interactions, pool_size)
+        if prefetch_count is None or self.rmq_connection is None or not self._can_interact:
+            return
+        self.prefetch_count = prefetch_count
+        self.rmq_connection.add_callback_threadsafe(
+            functools.partial(self.rmq_connection.set_prefetch_count, prefetch_count)
+        )
+
+    def _run_interaction(self, interaction, *args):
+        """Runs DB interaction tracking its latency and number of running interactions"""
+        started_at = time.monotonic()
+        self._running_interactions += 1
+
+        def on_interaction_done(result):
+            self._running_interactions -= 1
+            if self.prefetch_controller is not None:
+                self.prefetch_controller.on_processed(time.monotonic() - started_at)
+            return result
+
+        d = self.db_connection_pool.runInteraction(interaction, *args)
+        return d.addBoth(on_interaction_done)
+
+    def _on_message_delivered(self):
+        self._unacked_count += 1
+        if self.prefetch_controller is not None:
+            self.prefetch_controller.on_unacked_count(self._unacked_count)
+
+    def _on_messages_completed(self, result=None, count=1):
+        self._unacked_count -= count
+        return result
 
     def on_basic_get_message(self, message):
         delivery_tag = message.get("method").delivery_tag
+        self._on_message_delivered()
+        if self.batch_size:
+            message_body = decode_message_body(message["body"], message["properties"])
+            self._add_to_batch(delivery_tag, message_body)
+            self._can_get_next_message = True
+            return
         ack_cb = nack_cb = None
-        if isinstance(self.rmq_connection.connection, pika.SelectConnection):
+        if self.rmq_connection.connection is not None:
             ack_cb = call_once(
                 functools.partial(
-                    self.rmq_connection.connection.ioloop.add_callback_threadsafe,
+                    self.rmq_connection.add_callback_threadsafe,
                     functools.partial(
                         self.rmq_connection.acknowledge_message, delivery_tag=delivery_tag
                     ),
@@ -160,19 +304,21 @@ class Consumer(ScrapyCommand):
             )
             nack_cb = call_once(
                 functools.partial(
-                    self.rmq_connection.connection.ioloop.add_callback_threadsafe,
+                    self.rmq_connection.add_callback_threadsafe,
                     functools.partial(
                         self.rmq_connection.negative_acknowledge_message, delivery_tag=delivery_tag
                     ),
                 )
             )
 
-        message_body = json.loads(message["body"])
+        message_body = decode_message_body(message["body"], message["properties"])
 
-        d = self.db_connection_pool.runInteraction(self.process_message, message_body)
+        d = self._run_interaction(self.process_message, message_body)
         d.addCallback(
             self.on_message_processed, ack_callback=ack_cb, nack_callback=nack_cb,
         ).addErrback(self.on_message_process_failure, nack_callback=nack_cb).addBoth(
+            self._on_messages_completed
+        ).addBoth(
             self._check_mode
         )
 
@@ -194,6 +340,133 @@ class Consumer(ScrapyCommand):
             transaction.execute(stmt)
         return True
 
+    def _add_to_batch(self, delivery_tag, message_body):
+        self._batch.append((delivery_tag, message_body))
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._batch_flush_timer is None:
+            self._batch_flush_timer = reactor.callLater(
+                self.batch_timeout / 1000, self._flush_batch
+            )
+
+    def _flush_batch(self):
+        if self._batch_flush_timer is not None:
+            if self._batch_flush_timer.active():
+                self._batch_flush_timer.cancel()
+            self._batch_flush_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self.batches_count += 1
+            self._store_batch(batch).addBoth(self._check_mode)
+
+    def _store_batch(self, batch):
+        message_bodies = [message_body for _delivery_tag, message_body in batch]
+        d = self._run_interaction(self.process_messages, message_bodies)
+        d.addCallbacks(
+            self.on_batch_processed,
+            self.on_batch_process_failure,
+            callbackArgs=(batch,),
+            errbackArgs=(batch,),
+        )
+        return d
+
+    def on_batch_processed(self, batch_store_result, batch):
+        """Acks or nacks the whole batch by boolean result, or each message by its item of results list"""
+        self._on_messages_completed(count=len(batch))
+        if not isinstance(batch_store_result, list):
+            batch_store_result = [batch_store_result] * len(batch)
+        acked_tags = []
+        nacked_tags = []
+        for (delivery_tag, _message_body), is_stored in zip(batch, batch_store_result):
+            (acked_tags if is_stored else nacked_tags).append(delivery_tag)
+        if acked_tags:
+            self.rmq_connection.add_callback_threadsafe(
+                functools.partial(self.rmq_connection.acknowledge_messages, acked_tags)
+            )
+        if nacked_tags:
+            self.rmq_connection.add_callback_threadsafe(
+                functools.partial(self.rmq_connection.negative_acknowledge_messages, nacked_tags)
+            )
+
+    def on_batch_process_failure(self, failure, batch):
+        """Failed batch is split in halves which are stored separately, until the failing message is found"""
+        failure.trap(Exception)
+        if len(batch) == 1 or failure.check(NotImplementedError):
+            self.on_message_process_failure(failure)
+            self.on_batch_processed(False, batch)
+            return
+        self.batch_bisections_count += 1
+        self.logger.warning(
+            f"Failed to store batch of {len(batch)} messages, bisecting: {failure.value}"
+        )
+        middle = len(batch) // 2
+        return defer.DeferredList(
+            [self._store_batch(batch[:middle]), self._store_batch(batch[middle:])]
+        )
+
+    def process_messages(self, transaction, message_bodies):
+        """Stores batch of messages in single transaction. Statement of self.build_messages_store_stmt is used
+        if implemented, otherwise statements of self.build_message_store_stmt which compile to the same SQL
+        are sent with single executemany (MySQLdb rewrites INSERT ... VALUES into multi-row insert).
+        If subclass overrides self.process_message, it is called for each message of batch instead.
+        Like self.process_message this method must return boolean result which determines to ack or nack batch,
+        or list of such results, one per message, to ack or nack messages separately
+        """
+        if self.staging_table_loader is not None:
+            return self.load_messages(transaction, message_bodies)
+        if self._is_process_message_overridden():
+            # custom processing of subclass is kept, messages of batch share single transaction,
+            # each message is acked or nacked by its own result as without batching
+            return [
+                bool(self.process_message(transaction, message_body))
+                for message_body in message_bodies
+            ]
+        stmt = self.build_messages_store_stmt(message_bodies)
+        if stmt is not None:
+            if isinstance(stmt, ClauseElement):
+                transaction.execute(*compile_expression(stmt))
+            else:
+                transaction.execute(stmt)
+            return True
+        statements = [
+            compile_expression(stmt) if isinstance(stmt, ClauseElement) else (stmt, None)
+            for stmt in map(self.build_message_store_stmt, message_bodies)
+        ]
+        for sql, same_statements in groupby(statements, key=lambda statement: statement[0]):
+            params = [statement_params for _sql, statement_params in same_statements]
+            if len(params) > 1 and params[0] is not None:
+                transaction.executemany(sql, params)
+            else:
+                for statement_params in params:
+                    transaction.execute(sql, statement_params)
+        return True
+
+    def _is_process_message_overridden(self) -> bool:
+        return type(self).process_message is not Consumer.process_message
+
+    def load_messages(self, transaction, message_bodies):
+        """Stores batch of messages with LOAD DATA (--load-data). Rows are values of self.build_message_store_stmt
+        INSERT statements, they are merged into the table of the first statement with its ON DUPLICATE KEY UPDATE
+        """
+        statements = map(self.build_message_store_stmt, message_bodies)
+        first_stmt = next(statements)
+        if not isinstance(first_stmt, Insert):
+            raise NotImplementedError(
+                "--load-data requires build_message_store_stmt to return INSERT statement"
+            )
+        rows = map(StagingTableLoader.get_row, chain((first_stmt,), statements))
+        self.staging_table_loader.load(transaction, first_stmt, rows)
+        return True
+
+    def build_messages_store_stmt(self, message_bodies):
+        """Could return single statement storing the whole batch of messages, None by default
+
+        Example:
+        stmt = insert(SearchEngineQuery).values(message_bodies)
+        return stmt.on_duplicate_key_update({'status': stmt.inserted.status})
+        """
+        return None
+
     def build_message_store_stmt(self, message_body):
         """If processing message task requires several queries to db or single query has extreme difficulty
         then this self.process_message method could be overridden.
@@ -260,20 +533,73 @@ class Consumer(ScrapyCommand):
         self._can_interact = can_interact
         self._can_get_next_message = can_interact
 
+    def on_connection_stats(self, stats):
+        self.connection_stats = stats
+        self.logger.info("RabbitMQ connection stats: {}".format(stats))
+        if self.prefetch_controller is not None:
+            self.logger.info(
+                "Prefetch controller stats: {}".format(self.prefetch_controller.get_stats())
+            )
+        if self.batch_size:
+            self.logger.info(
+                f"Stored {self.batches_count} batches, {self.batch_bisections_count} bisections"
+            )
+        if self.staging_table_loader is not None:
+            self.logger.info(
+                "Staging table loader stats: {}".format(self.staging_table_loader.get_stats())
+            )
+        self.logger.info(
+            "Compiled SQL cache stats: {}".format(compiled_expression_cache.get_stats())
+        )
+
     def connect(self, parameters, queue_name):
-        c = PikaSelectConnection(
+        c = self.connection_class(
             parameters,
             queue_name,
             owner=self,
-            options={
-                "enable_delivery_confirmations": False,
-                "prefetch_count": self.prefetch_count,
-            },
+            options=get_connection_options(
+                self.project_settings,
+                enable_delivery_confirmations=False,
+                prefetch_count=self.prefetch_count,
+            ),
             is_consumer=True,
         )
         c.run()
 
+    def start_workers(self, opts: Namespace):
+        """Starts opts.workers copies of this command, each consumes with its share of prefetch count"""
+        self.init_prefetch_count(opts)
+        self._worker_prefetch_counts = split_budget(self.prefetch_count, opts.workers)
+        self._worker_max_prefetch_counts = split_budget(
+            self.project_settings.getint("CONSUMER_MAX_PREFETCH_COUNT", 256), opts.workers
+        )
+        self.logger.info(
+            f"Starting {opts.workers} workers with prefetch counts {self._worker_prefetch_counts}"
+        )
+        self.worker_supervisor = WorkerSupervisor(opts.workers, self.build_worker_command)
+        self.worker_supervisor.start()
+
+    def build_worker_command(self, worker_index: int):
+        """Command line and environment of worker process, the last occurrence of an option wins"""
+        args = [
+            sys.executable,
+            "-m",
+            "scrapy.cmdline",
+            *sys.argv[1:],
+            "--workers",
+            "1",
+            "--prefetch_count",
+            str(self._worker_prefetch_counts[worker_index]),
+        ]
+        env = dict(os.environ)
+        env["CONSUMER_WORKER_INDEX"] = str(worker_index)
+        env["CONSUMER_MAX_PREFETCH_COUNT"] = str(self._worker_max_prefetch_counts[worker_index])
+        return args, env
+
     def run(self, args: list[str], opts: Namespace):
         self.set_logger(self.__class__.__name__, self.project_settings.get("LOG_LEVEL"))
-        reactor.callLater(0, self.execute, args, opts)
+        if opts.workers > 1:
+            reactor.callLater(0, self.start_workers, opts)
+        else:
+            reactor.callLater(0, self.execute, args, opts)
         reactor.run()
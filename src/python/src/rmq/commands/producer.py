@@ -1,23 +1,35 @@
-import datetime
 import functools
 import json
 import logging
+import os
 from argparse import Namespace
 from enum import Enum
 
+import MySQLdb
 import pika
 from MySQLdb import OperationalError
-from MySQLdb.cursors import DictCursor
+from MySQLdb.cursors import DictCursor, SSDictCursor
 from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
 from scrapy.utils.log import configure_logging
 from scrapy.utils.project import get_project_settings
 from sqlalchemy.sql import ClauseElement
 from twisted.enterprise import adbapi
 from twisted.internet import reactor, defer
 
-from rmq.connections import PikaSelectConnection
-from rmq.utils import RMQConstants, RMQDefaultOptions, TaskStatusCodes
-from rmq.utils.sql_expressions import compile_expression
+from rmq.connections import get_connection_class, start_connection
+from rmq.utils import (
+    MessageCodec,
+    PacingController,
+    RMQConstants,
+    RMQDefaultOptions,
+    TaskStatusCodes,
+    TaskStream,
+    get_connection_options,
+    get_shard_queue_name,
+    get_task_queue_options,
+)
+from rmq.utils.sql_expressions import compile_expression, compiled_expression_cache
 
 
 class Producer(ScrapyCommand):
@@ -29,6 +41,7 @@ class Producer(ScrapyCommand):
     _DEFAULT_CHUNK_SIZE = 100
     _DEFAULT_CHECK_INTERACT_READY_DELAY = 3  # seconds
     _DEFAULT_DELAY_TIMEOUT = 15
+    _DEFAULT_PIPELINE_DEPTH = 1
 
     def __init__(self):
         super().__init__()
@@ -41,6 +54,29 @@ class Producer(ScrapyCommand):
         ]
         self.mode = Producer.CommandModes.DEFAULT.value
         self.chunk_size = Producer._DEFAULT_CHUNK_SIZE
+        # select and mark chunk of tasks in the same transaction, so several producers could share a table
+        self.claim_tasks = False
+        # select tasks with id greater than the last produced one instead of re-running the same query
+        self.keyset_cursor = False
+        self.task_id_key = "id"
+        # row column mapped to message priority if task queue is declared with x-max-priority
+        self.task_priority_key = "priority"
+        self.max_priority = 0
+        # tasks are spread over <task_queue_name>.0 ... <task_queue_name>.N-1 by hash of task_shard_key column
+        self.shards_count = 0
+        self.task_shard_key = "id"
+        self.task_shard_queue_names = None
+        self.last_task_id = None
+        # mark tasks IN_QUEUE only after broker confirms their publishes, nacked tasks are re-published
+        self.confirm_publishes = False
+        self._nacked_tasks = []
+        # max chunks being published and updated at once in worker mode, next chunk is fetched meanwhile
+        self.pipeline_depth = Producer._DEFAULT_PIPELINE_DEPTH
+        self._chunks_in_progress = 0
+        self._is_fetching = False
+        # read task rows with server-side cursor instead of buffering the whole result set on client
+        self.stream_tasks = False
+        self.task_stream = None
 
         self.delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
@@ -49,9 +85,15 @@ class Producer(ScrapyCommand):
         self.reply_to_queue_name = None
 
         self.rmq_connection = None
+        self.connection_class = get_connection_class(self.project_settings)
+        self.message_codec = MessageCodec.from_settings(self.project_settings)
+        # the latest connection stats snapshot, pushed periodically by connection
+        self.connection_stats = {}
         self._can_interact = False
 
         self.db_connection_pool = None
+        # adjusts chunk size and poll interval to hold task queue depth around target
+        self.pacing_controller = None
 
         self.check_interact_ready_delay = Producer._DEFAULT_CHECK_INTERACT_READY_DELAY
 
@@ -102,6 +144,53 @@ class Producer(ScrapyCommand):
             dest="delay",
             help="Default delay timeout in seconds",
         )
+        parser.add_argument(
+            "--claim",
+            action="store_true",
+            default=False,
+            dest="claim_tasks",
+            help="Claim tasks atomically with SELECT ... FOR UPDATE SKIP LOCKED, "
+            "allows several producers to process the same table",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=None,
+            dest="shards_count",
+            help="Number of task queue shards, defaults to RABBITMQ_TASK_QUEUE_SHARDS",
+        )
+        parser.add_argument(
+            "--pipeline-depth",
+            type=int,
+            default=Producer._DEFAULT_PIPELINE_DEPTH,
+            dest="pipeline_depth",
+            help="Max chunks published at once in worker mode, next chunk is fetched "
+            "while they are published (requires --claim or --keyset)",
+        )
+        parser.add_argument(
+            "--confirmed",
+            action="store_true",
+            default=False,
+            dest="confirm_publishes",
+            help="Update status of tasks only after broker confirms their messages, "
+            "nacked tasks stay eligible and are re-published (could not be used with --claim)",
+        )
+        parser.add_argument(
+            "--keyset",
+            action="store_true",
+            default=False,
+            dest="keyset_cursor",
+            help="Select tasks by primary key greater than the last produced one, "
+            "the cursor is persisted between runs",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            default=False,
+            dest="stream_tasks",
+            help="Read tasks of single unlimited query in chunks from server-side cursor (SSDictCursor) "
+            "of dedicated DB connection",
+        )
 
     def init_task_queue_name(self, opts: Namespace):
         task_queue_name = getattr(opts, "task_queue_name", None)
@@ -121,10 +210,19 @@ class Producer(ScrapyCommand):
         self.reply_to_queue_name = reply_to_queue_name
         return reply_to_queue_name
 
-    def init_db_connection_pool(self):
-        """In case of using non mysql database or if pymysql is preferred this method must be overridden"""
-        self.db_connection_pool = adbapi.ConnectionPool(
-            "MySQLdb",
+    def init_pipeline_depth(self, opts: Namespace):
+        pipeline_depth = max(getattr(opts, "pipeline_depth", self.pipeline_depth), 1)
+        if pipeline_depth > 1 and not (self.claim_tasks or self.keyset_cursor):
+            # chunk fetched before statuses of previous one are updated would contain the same tasks
+            self.logger.warning(
+                "--pipeline-depth requires --claim or --keyset, tasks are produced sequentially"
+            )
+            pipeline_depth = 1
+        self.pipeline_depth = pipeline_depth
+        return pipeline_depth
+
+    def get_db_connection_kwargs(self) -> dict:
+        return dict(
             host=self.project_settings.get("DB_HOST"),
             port=self.project_settings.getint("DB_PORT"),
             user=self.project_settings.get("DB_USERNAME"),
@@ -132,9 +230,37 @@ class Producer(ScrapyCommand):
             db=self.project_settings.get("DB_DATABASE"),
             charset="utf8mb4",
             use_unicode=True,
+        )
+
+    def init_db_connection_pool(self):
+        """In case of using non mysql database or if pymysql is preferred this method must be overridden"""
+        self.db_connection_pool = adbapi.ConnectionPool(
+            "MySQLdb",
             cursorclass=DictCursor,
             cp_reconnect=True,
+            **self.get_db_connection_kwargs(),
+        )
+
+    def init_task_stream(self):
+        """Dedicated connection with server-side cursor for --stream, must be overridden together with
+        init_db_connection_pool"""
+        self.task_stream = TaskStream(
+            functools.partial(
+                MySQLdb.connect,
+                cursorclass=SSDictCursor,
+                autocommit=True,
+                **self.get_db_connection_kwargs(),
+            ),
+            self._build_stream_query,
         )
+        self.task_stream.start()
+
+    def process_options(self, args: list[str], opts: Namespace):
+        ScrapyCommand.process_options(self, args, opts)
+        if opts.confirm_publishes and opts.claim_tasks:
+            # claimed tasks are marked IN_QUEUE before publishing, so nacked ones would be left
+            # IN_QUEUE in DB and kept for re-publishing only in memory of this process
+            raise UsageError("--confirmed could not be used with --claim", print_help=False)
 
     def execute(self, _args: list[str], opts: Namespace):
         self.init_task_queue_name(opts)
@@ -142,8 +268,32 @@ class Producer(ScrapyCommand):
         self.mode = opts.mode
         self.chunk_size = opts.chunk_size
         self.default_delay_timeout = opts.delay
+        self.claim_tasks = opts.claim_tasks
+        self.keyset_cursor = opts.keyset_cursor
+        self.confirm_publishes = opts.confirm_publishes
+        self.init_pipeline_depth(opts)
+        self.stream_tasks = opts.stream_tasks
+        if self.stream_tasks and self.claim_tasks:
+            # claimed rows are locked till the end of transaction, it could not span the whole stream
+            self.logger.warning("--stream could not be used with --claim, tasks are read by chunks")
+            self.stream_tasks = False
+        self.shards_count = opts.shards_count
+        if self.shards_count is None:
+            self.shards_count = self.project_settings.getint("RABBITMQ_TASK_QUEUE_SHARDS", 0)
+        task_queue_options = get_task_queue_options(
+            self.project_settings, self.task_queue_name, self.shards_count
+        )
+        self.max_priority = task_queue_options["max_priority"]
+        self.task_shard_queue_names = task_queue_options["shard_queues"]
+        self.pacing_controller = PacingController.from_settings(
+            self.project_settings, self.chunk_size
+        )
+        if self.keyset_cursor:
+            self.last_task_id = self.load_task_cursor()
 
         self.init_db_connection_pool()
+        if self.stream_tasks:
+            self.init_task_stream()
 
         parameters = pika.ConnectionParameters(
             host=self.project_settings.get("RABBITMQ_HOST"),
@@ -155,9 +305,17 @@ class Producer(ScrapyCommand):
             ),
             heartbeat=RMQDefaultOptions.CONNECTION_HEARTBEAT.value,
         )
-        reactor.callInThread(self.connect, parameters, self.task_queue_name)
+        start_connection(self.connection_class, self.connect, parameters, self.task_queue_name)
+        self._is_fetching = True
         reactor.callLater(self.check_interact_ready_delay, self.produce_tasks)
 
+    def _start_next_chunk(self):
+        """Starts producing of the next chunk unless it is already being fetched or pipeline is full"""
+        if self._is_fetching or self._chunks_in_progress >= self.pipeline_depth:
+            return
+        self._is_fetching = True
+        reactor.callLater(0, self.produce_tasks)
+
     def produce_tasks(self, is_message_count_validated=False):
         if self._can_interact is False:
             """Wait until connection is ready to interaction"""
@@ -168,30 +326,57 @@ class Producer(ScrapyCommand):
         if is_message_count_validated is False:
             cb = functools.partial(
                 self.rmq_connection.get_ready_messages_count,
-                self.task_queue_name,
+                self.task_shard_queue_names or self.task_queue_name,
                 functools.partial(reactor.callFromThread, self.validate_queue_message_count),
             )
-            self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
+            self.rmq_connection.add_callback_threadsafe(cb)
             return
 
         """get chunk of records from db which represents tasks and produce to queue"""
-        d = self.db_connection_pool.runInteraction(self.get_tasks_interaction, self.chunk_size)
+        chunk_size = self.pacing_controller.chunk_size
+        if self.task_stream is not None:
+            d = self.task_stream.fetch(chunk_size)
+            d.addCallback(self._on_tasks_streamed)
+        else:
+            d = self.db_connection_pool.runInteraction(self.fetch_tasks_interaction, chunk_size)
         d.addCallback(self.process_tasks).addErrback(self.on_get_tasks_error)
 
+    def _on_tasks_streamed(self, rows):
+        if self.keyset_cursor:
+            self._advance_task_cursor(rows)
+        if not rows:
+            return None
+        return self.db_connection_pool.runInteraction(self.build_fetched_tasks_interaction, rows)
+
+    def _build_stream_query(self):
+        stmt = self.build_stream_task_query_stmt()
+        if isinstance(stmt, ClauseElement):
+            return compile_expression(stmt)
+        return stmt, None
+
+    def build_stream_task_query_stmt(self):
+        """Task query read by --stream: the chunk query without limit (chunk_size is None).
+        Could be overridden if the chunk query could not be built without limit"""
+        if self.keyset_cursor:
+            return self.build_keyset_task_query_stmt(self.last_task_id, None)
+        return self.build_task_query_stmt(None)
+
     def validate_queue_message_count(self, message_count=None):
-        delay_timeout = self._delay(message_count)
-        reactor.callLater(delay_timeout, self.produce_tasks, True)
-
-    def _delay(self, current_count=None) -> int:
-        if current_count is None:
-            return self.default_delay_timeout
-        return {
-            0 <= current_count < 5000: 0,
-            5000 <= current_count < 15000: 15,
-            15000 <= current_count < 30000: 300,
-            30000 <= current_count < 100000: 3600,
-            100000 <= current_count: 43200,
-        }[True]
+        if message_count is None:
+            reactor.callLater(self.default_delay_timeout, self.produce_tasks, True)
+            return
+        self.pacing_controller.observe(message_count)
+        if self.pacing_controller.should_produce:
+            reactor.callLater(0, self.produce_tasks, True)
+            return
+        interval = self.pacing_controller.interval
+        self.logger.info(
+            f"Queue {self.task_queue_name} has {message_count} ready messages "
+            f"(target {self.pacing_controller.target_depth}, "
+            f"drain rate {self.pacing_controller.drain_rate} msg/s), "
+            f"waiting for {interval:.2f} seconds..."
+        )
+        reactor.callLater(interval, self.produce_tasks)
 
     def get_tasks_interaction(self, transaction, chunk_size=None):
         """If building task requires several queries to db or single query has extreme difficulty
@@ -200,15 +385,54 @@ class Producer(ScrapyCommand):
         and could be overridden with pass statement"""
         if chunk_size is None:
             chunk_size = self.chunk_size
-        stmt = self.build_task_query_stmt(chunk_size)
+        if self.keyset_cursor:
+            stmt = self.build_keyset_task_query_stmt(self.last_task_id, chunk_size)
+        else:
+            stmt = self.build_task_query_stmt(chunk_size)
+        if self.claim_tasks:
+            stmt = self.lock_task_query_stmt(stmt)
         if isinstance(stmt, ClauseElement):
             # parameter passing method describes here: https://peps.python.org/pep-0249/#id20
             transaction.execute(*compile_expression(stmt))
         else:
             transaction.execute(stmt)
         if chunk_size == 1:
-            return transaction.fetchone()
-        return transaction.fetchall()
+            rows = transaction.fetchone()
+        else:
+            rows = transaction.fetchall()
+        if self.keyset_cursor:
+            self._advance_task_cursor(rows)
+        return rows
+
+    def _advance_task_cursor(self, rows):
+        if rows is None or not len(rows):
+            if self.last_task_id is not None:
+                # end of table is reached, tasks returned to processing behind the cursor are picked up
+                # on the next pass
+                self.logger.info("Task cursor reached the end of table, rewinding")
+            self.last_task_id = None
+            return
+        last_row = rows[-1] if isinstance(rows, (list, tuple)) else rows
+        self.last_task_id = last_row[self.task_id_key]
+
+    def claim_tasks_interaction(self, transaction, chunk_size=None):
+        """Selects chunk of tasks locking its rows and marks them IN_QUEUE in the same transaction.
+        Rows locked by concurrent producers are skipped, so every task is claimed by single producer"""
+        rows = self.get_tasks_interaction(transaction, chunk_size)
+        if rows is None or not len(rows):
+            return rows
+        db_tasks = rows if isinstance(rows, (list, tuple)) else [rows]
+        self.update_tasks_interaction(transaction, db_tasks, TaskStatusCodes.IN_QUEUE.value)
+        return rows
+
+    def lock_task_query_stmt(self, stmt):
+        """Adds FOR UPDATE SKIP LOCKED (MySQL 8.0+) to task query statement in claim mode.
+        Must be overridden if task query statement could not be locked this way"""
+        if isinstance(stmt, str):
+            return stmt.rstrip().rstrip(";") + " FOR UPDATE SKIP LOCKED"
+        if hasattr(stmt, "with_for_update"):
+            return stmt.with_for_update(skip_locked=True)
+        raise NotImplementedError("Task query statement could not be locked for claiming tasks")
 
     def on_get_tasks_error(self, failure):
         self.logger.error("failure: {}".format(failure))
@@ -240,6 +464,7 @@ class Producer(ScrapyCommand):
 
     def build_task_query_stmt(self, chunk_size):
         """This method must returns sqlalchemy Executable or string that represents valid raw SQL select query
+        chunk_size is None for --stream, then the query must not be limited (limit(None) removes LIMIT)
 
         stmt = select([DBModel]).where(
             DBModel.status == TaskStatusCodes.NOT_PROCESSED.value,
@@ -248,6 +473,82 @@ class Producer(ScrapyCommand):
         """
         raise NotImplementedError
 
+    def build_keyset_task_query_stmt(self, last_task_id, chunk_size):
+        """This method must return sqlalchemy Executable or string that represents valid raw SQL select query
+        of tasks with primary key greater than last_task_id ordered by primary key (used with --keyset)
+
+        stmt = select(DBModel).where(
+            DBModel.status == TaskStatusCodes.NOT_PROCESSED.value,
+        ).order_by(DBModel.id.asc()).limit(chunk_size)
+        if last_task_id is not None:
+            stmt = stmt.where(DBModel.id > last_task_id)
+        return stmt
+        """
+        raise NotImplementedError
+
+    def build_message_priority(self, db_task):
+        """Returns AMQP priority of task message, by default priority column of MysqlPriorityAttemptMixin
+        capped with RABBITMQ_MAX_PRIORITY. None if task queue has no priorities or task has no priority"""
+        if not self.max_priority or not isinstance(db_task, dict):
+            return None
+        priority = db_task.get(self.task_priority_key)
+        if priority is None:
+            return None
+        return min(int(priority), self.max_priority)
+
+    def get_task_queue_name(self, db_task):
+        """Returns queue the task is published to, shard by task_shard_key column if queue is sharded"""
+        if self.task_shard_queue_names is None:
+            return self.task_queue_name
+        return get_shard_queue_name(
+            self.task_queue_name, self.shards_count, db_task[self.task_shard_key]
+        )
+
+    def get_task_cursor_path(self):
+        storage_path = self.project_settings.get("PRODUCER_CURSOR_STORAGE_PATH") or "storage"
+        return os.path.join(storage_path, f"producer_cursor_{self.task_queue_name}.json")
+
+    def load_task_cursor(self):
+        cursor_path = self.get_task_cursor_path()
+        if not os.path.exists(cursor_path):
+            return None
+        with open(cursor_path) as cursor_file:
+            last_task_id = json.load(cursor_file).get("last_task_id")
+        self.logger.info(f"Task cursor loaded from {cursor_path}: {last_task_id}")
+        return last_task_id
+
+    def save_task_cursor(self, last_task_id):
+        cursor_path = self.get_task_cursor_path()
+        os.makedirs(os.path.dirname(cursor_path) or ".", exist_ok=True)
+        tmp_cursor_path = f"{cursor_path}.tmp"
+        with open(tmp_cursor_path, "w") as cursor_file:
+            json.dump({"last_task_id": last_task_id}, cursor_file)
+        os.replace(tmp_cursor_path, cursor_path)
+
+    def fetch_tasks_interaction(self, transaction, chunk_size=None):
+        """Selects (or claims) chunk of tasks and builds their message bodies in the same transaction.
+        Returns tuple of rows list and message bodies list or None if there are no tasks"""
+        if self.claim_tasks:
+            rows = self.claim_tasks_interaction(transaction, chunk_size)
+        else:
+            rows = self.get_tasks_interaction(transaction, chunk_size)
+        if rows is None or not len(rows):
+            return None
+        return self.build_fetched_tasks_interaction(transaction, rows)
+
+    def build_fetched_tasks_interaction(self, transaction, rows):
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        return rows, self.build_message_bodies(transaction, rows)
+
+    def build_message_bodies(self, transaction, rows):
+        """Returns list of message bodies for the chunk of task rows, runs in the fetch transaction.
+
+        Could be overridden to load related data of the whole chunk at once instead of query per task:
+        transaction.execute(*compile_expression(select(Child).where(Child.task_id.in_([row["id"] for row in rows]))))
+        children = transaction.fetchall()
+        """
+        return [self.build_message_body(row) for row in rows]
+
     def build_message_body(self, db_task):
         return dict(db_task)
 
@@ -258,57 +559,169 @@ class Producer(ScrapyCommand):
         """
         raise NotImplementedError
 
-    def process_tasks(self, rows):
-        if rows is None or not len(rows):
-            delay = self._delay(None)
+    def build_bulk_task_update_stmt(self, db_tasks, status):
+        """This method could return sqlalchemy Executable or string that represents valid raw SQL update query
+        which updates status of the whole chunk of tasks at once
+
+        return update(DBModel).where(DBModel.id.in_([db_task['id'] for db_task in db_tasks])).values({'status': status})
+
+        By default returns None, then tasks are updated one by one with update_task_interaction
+        """
+        return None
+
+    def bulk_update_tasks_interaction(self, transaction, stmt):
+        if isinstance(stmt, ClauseElement):
+            # parameter passing method describes here: https://peps.python.org/pep-0249/#id20
+            transaction.execute(*compile_expression(stmt))
+        else:
+            transaction.execute(stmt)
+
+    def update_tasks_interaction(self, transaction, db_tasks, status):
+        """Updates status of chunk of tasks within given transaction"""
+        stmt = self.build_bulk_task_update_stmt(db_tasks, status)
+        if stmt is not None:
+            self.bulk_update_tasks_interaction(transaction, stmt)
+            return
+        for db_task in db_tasks:
+            self.update_task_interaction(transaction, db_task, status)
+
+    def update_tasks_status(self, db_tasks, status):
+        """Updates status of chunk of tasks in a single transaction if bulk update statement is implemented,
+        otherwise each task is updated in separate transaction"""
+        stmt = self.build_bulk_task_update_stmt(db_tasks, status)
+        if stmt is not None:
+            return self.db_connection_pool.runInteraction(self.bulk_update_tasks_interaction, stmt)
+        deferred_interactions = [
+            self.db_connection_pool.runInteraction(self.update_task_interaction, db_task, status)
+            for db_task in db_tasks
+        ]
+        return defer.DeferredList(deferred_interactions, consumeErrors=True)
+
+    def process_tasks(self, fetched_tasks):
+        if fetched_tasks is None:
+            if self.keyset_cursor:
+                self.save_task_cursor(self.last_task_id)
+            delay = self.default_delay_timeout
             self.logger.info(f"DB is empty. waiting for {delay} seconds...")
             reactor.callLater(delay, self.produce_tasks, True)
             return
-        if self.chunk_size == 1 and not isinstance(rows, list):
-            rows = [rows]
-        deferred_interactions = []
-        for row in rows:
-            msg_body = self.build_message_body(row)
-            self._send_message(msg_body)
-            deferred_update_task_interaction = self.db_connection_pool.runInteraction(
-                self.update_task_interaction, row, TaskStatusCodes.IN_QUEUE.value
+        rows, msg_bodies = fetched_tasks
+        if self.keyset_cursor:
+            self.save_task_cursor(self.last_task_id)
+        self._is_fetching = False
+        self._chunks_in_progress += 1
+        self._send_tasks(rows, msg_bodies)
+        if self.mode == Producer.CommandModes.WORKER.value:
+            self._start_next_chunk()
+
+    def _send_tasks(self, rows, msg_bodies, position=0, confirmations=None):
+        """Sends rows starting from position. If publish window is full or connection is blocked by broker,
+        waits until publishing is allowed again and continues from the same position"""
+        if self.confirm_publishes and confirmations is None:
+            confirmations = []
+        while position < len(rows):
+            if not self.rmq_connection.has_publish_capacity:
+                d = self.rmq_connection.wait_for_publish_capacity()
+                d.addCallback(
+                    lambda _: self._send_tasks(rows, msg_bodies, position, confirmations)
+                )
+                return
+            msg_body = msg_bodies[position]
+            priority = self.build_message_priority(rows[position])
+            position += 1
+            on_confirm = None
+            if confirmations is not None:
+                confirmation = defer.Deferred()
+                confirmations.append(confirmation)
+                on_confirm = confirmation.callback
+            queue_name = self.get_task_queue_name(rows[position - 1])
+            self._send_message(msg_body, on_confirm, priority, queue_name)
+        self.pacing_controller.on_published(len(rows))
+        if confirmations is not None:
+            d = defer.gatherResults(confirmations, consumeErrors=True)
+            d.addCallbacks(
+                self._on_tasks_confirmed,
+                self._on_tasks_confirm_error,
+                callbackArgs=(rows, msg_bodies),
+                errbackArgs=(rows,),
+            )
+            return
+        if self.claim_tasks:
+            # tasks are already marked IN_QUEUE by claim_tasks_interaction
+            self._on_task_update_completed()
+            return
+        d = self.update_tasks_status(rows, TaskStatusCodes.IN_QUEUE.value)
+        d.addCallbacks(self._on_task_update_completed, self._on_task_update_error)
+
+    def _on_tasks_confirmed(self, confirmations, rows, msg_bodies):
+        """Marks IN_QUEUE only tasks acked by broker, nacked ones are kept for re-publishing"""
+        acked_rows = [row for row, is_ack in zip(rows, confirmations) if is_ack]
+        nacked_tasks = [
+            (row, msg_body)
+            for row, msg_body, is_ack in zip(rows, msg_bodies, confirmations)
+            if not is_ack
+        ]
+        if nacked_tasks:
+            self.logger.warning(
+                f"{len(nacked_tasks)} of {len(rows)} tasks were not confirmed by broker"
             )
-            deferred_interactions.append(deferred_update_task_interaction)
-        deferred_list = defer.DeferredList(deferred_interactions, consumeErrors=True)
-        deferred_list.addCallback(self._on_task_update_completed).addErrback(self._on_task_update_error)
+            self._nacked_tasks.extend(nacked_tasks)
+        if not acked_rows:
+            self._on_task_update_completed()
+            return
+        d = self.update_tasks_status(acked_rows, TaskStatusCodes.IN_QUEUE.value)
+        d.addCallbacks(self._on_task_update_completed, self._on_task_update_error)
+
+    def _on_tasks_confirm_error(self, failure, rows):
+        """Confirmations of the chunk are lost. Tasks keep their status and are fetched again,
+        chunk slot is released"""
+        self.logger.error(f"Failed to confirm {len(rows)} published tasks: {failure}")
+        self._on_task_update_completed()
 
     def _on_task_update_completed(self, _result=None):
+        if self._nacked_tasks:
+            rows = [row for row, _msg_body in self._nacked_tasks]
+            msg_bodies = [msg_body for _row, msg_body in self._nacked_tasks]
+            self._nacked_tasks = []
+            delay = self.check_interact_ready_delay
+            self.logger.info(
+                f"Re-publishing {len(rows)} not confirmed tasks in {delay} seconds..."
+            )
+            reactor.callLater(delay, self._send_tasks, rows, msg_bodies)
+            return
+        self._chunks_in_progress -= 1
         if self.mode == Producer.CommandModes.ACTION.value:
             reactor.callLater(0, self.crawler_process._graceful_stop_reactor)
         elif self.mode == Producer.CommandModes.WORKER.value:
-            reactor.callLater(0, self.produce_tasks)
+            self._start_next_chunk()
 
     def _on_task_update_error(self, failure):
         self.logger.error("failure: {}".format(failure))
         failure.trap(Exception)
+        # tasks which were not marked IN_QUEUE keep their status and are fetched again later,
+        # chunk slot is released the same way as on success, so producing does not stall
+        self._on_task_update_completed()
 
-    def _send_message(self, msg_body):
+    def _send_message(self, msg_body, on_confirm=None, priority=None, queue_name=None):
         if not isinstance(msg_body, dict):
             raise ValueError("Built message body is not a dictionary")
         msg_body = self._convert_unserializable_values(msg_body)
-        cb = functools.partial(
-            self.rmq_connection.publish_message,
-            message=json.dumps(msg_body),
-            queue_name=self.task_queue_name,
+        body, codec_properties = self.message_codec.encode(msg_body)
+        self.rmq_connection.publish_message_threadsafe(
+            message=body,
+            queue_name=queue_name or self.task_queue_name,
             properties=pika.BasicProperties(
-                content_type="application/json", delivery_mode=2, reply_to=self.reply_to_queue_name
+                delivery_mode=2,
+                reply_to=self.reply_to_queue_name,
+                priority=priority,
+                **codec_properties,
             ),
+            on_confirm=on_confirm,
         )
-        self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
 
     def _convert_unserializable_values(self, data):
-        for key, val in data.items():
-            if isinstance(val, dict):
-                data[key] = self._convert_unserializable_values(val)
-            elif isinstance(val, datetime.datetime):
-                data[key] = int(val.timestamp())
-            else:
-                data[key] = val
+        """Hook to convert values of message body before encoding. Values which codec does not support
+        natively (e.g. datetimes) are converted by its default hook, so the body is returned as is"""
         return data
 
     def set_connection_handle(self, connection):
@@ -318,12 +731,28 @@ class Producer(ScrapyCommand):
     def set_can_interact(self, can_interact):
         self._can_interact = can_interact
 
+    def on_connection_stats(self, stats):
+        self.connection_stats = stats
+        self.logger.info("RabbitMQ connection stats: {}".format(stats))
+        self.logger.info("Producer pacing stats: {}".format(self.pacing_controller.get_stats()))
+        if self.task_stream is not None:
+            self.logger.info("Task stream stats: {}".format(self.task_stream.get_stats()))
+        self.logger.info(
+            "Compiled SQL cache stats: {}".format(compiled_expression_cache.get_stats())
+        )
+
     def connect(self, parameters, queue_name):
-        c = PikaSelectConnection(
+        c = self.connection_class(
             parameters,
             queue_name,
             owner=self,
-            options={"enable_delivery_confirmations": True, "prefetch_count": 1, },
+            options=get_connection_options(
+                self.project_settings,
+                enable_delivery_confirmations=True,
+                prefetch_count=1,
+                max_priority=self.max_priority,
+                shard_queues=self.task_shard_queue_names,
+            ),
             is_consumer=False,
         )
         c.run()
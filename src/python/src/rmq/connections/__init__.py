@@ -1 +1,3 @@
 from .pika_select_connection import PikaSelectConnection
+from .pika_asyncio_connection import PikaAsyncioConnection
+from .connection_class import get_connection_class, start_connection
@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class AcknowledgementAggregator:
+    """Aggregates consumer acknowledgements of a single channel.
+
+    Every delivery is registered in delivery tag order. Completed deliveries are held until they form
+    a contiguous prefix of outstanding deliveries, which is acknowledged with a single basic_ack(multiple=True).
+    Completions which can not become contiguous in time are released for individual acknowledgement.
+    """
+
+    def __init__(self):
+        # delivery tag -> completion timestamp (None while delivery is still in progress)
+        self._outstanding: "OrderedDict[int, Optional[float]]" = OrderedDict()
+        self._completed_count = 0
+
+    def reset(self):
+        """Delivery tags are restarted by broker on each new channel, outstanding deliveries are dropped"""
+        self._outstanding.clear()
+        self._completed_count = 0
+
+    def register_delivery(self, delivery_tag: int):
+        self._outstanding[delivery_tag] = None
+
+    def complete(self, delivery_tag: int) -> bool:
+        """Marks delivery as completed. Returns False if delivery is unknown and must be acked directly"""
+        if delivery_tag not in self._outstanding:
+            return False
+        if self._outstanding[delivery_tag] is None:
+            self._outstanding[delivery_tag] = time.monotonic()
+            self._completed_count += 1
+        return True
+
+    def discard(self, delivery_tag: int):
+        """Removes delivery which is settled outside of aggregator (e.g. nacked)"""
+        if self._outstanding.pop(delivery_tag, None) is not None:
+            self._completed_count -= 1
+
+    def pop_contiguous(self) -> Optional[int]:
+        """Pops completed deliveries from the head. Returns the highest popped tag or None"""
+        upto = None
+        while self._outstanding:
+            delivery_tag, completed_at = next(iter(self._outstanding.items()))
+            if completed_at is None:
+                break
+            self._outstanding.popitem(last=False)
+            self._completed_count -= 1
+            upto = delivery_tag
+        return upto
+
+    def pop_expired(self, max_age: float) -> List[int]:
+        """Pops completed deliveries held longer than max_age seconds"""
+        if not self._completed_count:
+            return []
+        deadline = time.monotonic() - max_age
+        expired = [
+            delivery_tag
+            for delivery_tag, completed_at in self._outstanding.items()
+            if completed_at is not None and completed_at <= deadline
+        ]
+        for delivery_tag in expired:
+            del self._outstanding[delivery_tag]
+        self._completed_count -= len(expired)
+        return expired
+
+    @property
+    def held_count(self) -> int:
+        return self._completed_count
+
+    @property
+    def outstanding_count(self) -> int:
+        return len(self._outstanding)
@@ -0,0 +1,26 @@
+from typing import Tuple
+
+# Delivery tags are unique per channel only. Tags handed to owners are extended with index of the channel
+# and generation of the channel (number of times it was reopened) in the upper bits, so tags from different
+# channels of one connection never collide and tags of a closed channel are never mistaken for tags of the
+# reopened one. Channel index 0 of the first generation keeps tags unchanged, so single channel connections
+# expose raw broker delivery tags until the first reconnect.
+_CHANNEL_INDEX_SHIFT = 40
+_GENERATION_SHIFT = 56
+_DELIVERY_TAG_MASK = (1 << _CHANNEL_INDEX_SHIFT) - 1
+_CHANNEL_INDEX_MASK = (1 << (_GENERATION_SHIFT - _CHANNEL_INDEX_SHIFT)) - 1
+
+
+def compose_delivery_tag(channel_index: int, delivery_tag: int, generation: int = 0) -> int:
+    return (
+        (generation << _GENERATION_SHIFT) | (channel_index << _CHANNEL_INDEX_SHIFT) | delivery_tag
+    )
+
+
+def split_delivery_tag(delivery_tag: int) -> Tuple[int, int, int]:
+    """Returns channel index, channel generation and broker delivery tag of composed delivery tag"""
+    return (
+        (delivery_tag >> _CHANNEL_INDEX_SHIFT) & _CHANNEL_INDEX_MASK,
+        delivery_tag >> _GENERATION_SHIFT,
+        delivery_tag & _DELIVERY_TAG_MASK,
+    )
@@ -0,0 +1,23 @@
+from typing import Callable, Type
+
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
+from twisted.internet import reactor
+
+from .pika_select_connection import PikaSelectConnection
+
+
+def get_connection_class(settings: Settings) -> Type[PikaSelectConnection]:
+    """Returns connection class configured by RABBITMQ_CONNECTION_CLASS setting"""
+    connection_class = settings.get("RABBITMQ_CONNECTION_CLASS") or PikaSelectConnection
+    if isinstance(connection_class, str):
+        connection_class = load_object(connection_class)
+    return connection_class
+
+
+def start_connection(connection_class: Type[PikaSelectConnection], connect: Callable, *args):
+    """Runs owner's connect method in a separate thread or in the reactor thread depending on connection class"""
+    if connection_class.RUNS_IN_REACTOR_THREAD:
+        reactor.callLater(0, connect, *args)
+    else:
+        reactor.callInThread(connect, *args)
@@ -0,0 +1,53 @@
+import time
+
+
+class ConnectionMetrics:
+    """Counters of PikaSelectConnection events. Updated in the ioloop thread only.
+
+    Rates are calculated between two successive get_stats calls.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.deliveries = 0
+        # deliveries acknowledged/rejected by owner and basic_ack frames actually sent
+        self.acked = 0
+        self.nacked = 0
+        self.ack_frames = 0
+        self.stale_acknowledgements = 0
+        # nacked deliveries moved to delayed retry queues and to parking queue
+        self.retried = 0
+        self.parked = 0
+        self.reconnects = 0
+        self.channel_reopens = 0
+        self.consumer_cancels = 0
+        self.connection_blocks = 0
+
+        self._rate_published = 0
+        self._rate_deliveries = 0
+        self._rate_measured_at = time.monotonic()
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        elapsed = now - self._rate_measured_at
+        publish_rate = (self.published - self._rate_published) / elapsed if elapsed else 0
+        delivery_rate = (self.deliveries - self._rate_deliveries) / elapsed if elapsed else 0
+        self._rate_published = self.published
+        self._rate_deliveries = self.deliveries
+        self._rate_measured_at = now
+        return {
+            "published": self.published,
+            "publish_rate": round(publish_rate, 2),
+            "deliveries": self.deliveries,
+            "delivery_rate": round(delivery_rate, 2),
+            "acked": self.acked,
+            "nacked": self.nacked,
+            "ack_frames": self.ack_frames,
+            "stale_acknowledgements": self.stale_acknowledgements,
+            "retried": self.retried,
+            "parked": self.parked,
+            "reconnects": self.reconnects,
+            "channel_reopens": self.channel_reopens,
+            "consumer_cancels": self.consumer_cancels,
+            "connection_blocks": self.connection_blocks,
+        }
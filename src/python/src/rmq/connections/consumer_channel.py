@@ -0,0 +1,61 @@
+from .acknowledgement_aggregator import AcknowledgementAggregator
+
+
+class ConsumerChannel:
+    """State of a single channel of PikaSelectConnection which receives deliveries"""
+
+    def __init__(self, index: int, prefetch_count: int = 1, is_consumer: bool = True):
+        # position of channel in connection, used to compose channel-aware delivery tags
+        self.index = index
+        self.prefetch_count = prefetch_count
+        # False for primary channel used for publishing only (basic_get is still allowed)
+        self.is_consumer = is_consumer
+
+        self.channel = None
+        # incremented on each attach, deliveries of previous generations are stale
+        self.generation = -1
+        self.is_opening = False
+        # consumer tags by consumed queue name, channel consumes from several queues if they are sharded
+        self.consumer_tags = {}
+        self.consuming = False
+
+        self.acknowledgements = AcknowledgementAggregator()
+        self.is_ack_flush_scheduled = False
+        self.ack_flush_timer = None
+
+    def attach(self, channel):
+        """Binds state to newly opened pika channel, delivery tags of the previous channel are dropped"""
+        self.channel = channel
+        self.generation += 1
+        self.is_opening = False
+        self.consumer_tags = {}
+        self.consuming = False
+        self.acknowledgements.reset()
+        self.is_ack_flush_scheduled = False
+        self.ack_flush_timer = None
+
+    def detach(self, remove_timeout=None):
+        """remove_timeout cancels pending ack flush timer in the ioloop which created it"""
+        self.channel = None
+        self.is_opening = False
+        self.consuming = False
+        if self.ack_flush_timer is not None and remove_timeout is not None:
+            remove_timeout(self.ack_flush_timer)
+        self.ack_flush_timer = None
+        self.is_ack_flush_scheduled = False
+
+    def remove_consumer_tag(self, consumer_tag) -> bool:
+        """Forgets cancelled consumer, returns True if it belonged to this channel"""
+        for queue_name, queue_consumer_tag in list(self.consumer_tags.items()):
+            if queue_consumer_tag == consumer_tag:
+                del self.consumer_tags[queue_name]
+                return True
+        return False
+
+    @property
+    def is_open(self) -> bool:
+        return self.channel is not None and self.channel.is_open
+
+    @property
+    def channel_number(self):
+        return self.channel.channel_number if self.channel is not None else None
@@ -0,0 +1,99 @@
+import bisect
+import time
+from collections import OrderedDict
+from typing import List
+
+# upper bounds (seconds) of confirm latency histogram buckets, the last bucket is unbounded
+_LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+class DeliveryConfirmationTracker:
+    """Tracks publisher confirms of a single channel.
+
+    Publish delivery tags are sequential per channel, so unconfirmed tags are stored in insertion order.
+    Single confirm is removed by key in O(1), confirm with multiple=True pops the ordered head
+    up to the confirmed tag, which is amortized O(1) per tag.
+    """
+
+    def __init__(self):
+        self._unconfirmed: "OrderedDict[int, float]" = OrderedDict()
+
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+        self.latency_histogram = [0] * (len(_LATENCY_BUCKETS) + 1)
+
+    def reset(self):
+        """Delivery tags are restarted by broker on each new channel, unconfirmed tags are dropped"""
+        self._unconfirmed.clear()
+
+    def add(self, delivery_tag: int):
+        self._unconfirmed[delivery_tag] = time.monotonic()
+        self.published += 1
+
+    def confirm(self, delivery_tag: int, multiple: bool = False, is_ack: bool = True) -> List[int]:
+        """Removes confirmed tags and returns them"""
+        now = time.monotonic()
+        confirmed = []
+        if multiple:
+            while self._unconfirmed:
+                tag = next(iter(self._unconfirmed))
+                if tag > delivery_tag:
+                    break
+                _, published_at = self._unconfirmed.popitem(last=False)
+                self._register_confirm(now - published_at, is_ack)
+                confirmed.append(tag)
+        else:
+            published_at = self._unconfirmed.pop(delivery_tag, None)
+            if published_at is not None:
+                self._register_confirm(now - published_at, is_ack)
+                confirmed.append(delivery_tag)
+        return confirmed
+
+    def _register_confirm(self, latency: float, is_ack: bool):
+        if is_ack:
+            self.acked += 1
+        else:
+            self.nacked += 1
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_last = latency
+        self.latency_histogram[bisect.bisect_left(_LATENCY_BUCKETS, latency)] += 1
+        if latency > self.latency_max:
+            self.latency_max = latency
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._unconfirmed)
+
+    @property
+    def oldest_unconfirmed_age(self) -> float:
+        if not self._unconfirmed:
+            return 0.0
+        return time.monotonic() - next(iter(self._unconfirmed.values()))
+
+    def get_latency_histogram(self) -> dict:
+        histogram = {
+            "le_{}".format(bound): count
+            for bound, count in zip(_LATENCY_BUCKETS, self.latency_histogram)
+        }
+        histogram["gt_{}".format(_LATENCY_BUCKETS[-1])] = self.latency_histogram[-1]
+        return histogram
+
+    def get_stats(self) -> dict:
+        return {
+            "published": self.published,
+            "in_flight": self.in_flight,
+            "acked": self.acked,
+            "nacked": self.nacked,
+            "latency_avg": (
+                round(self.latency_total / self.latency_count, 6) if self.latency_count else 0
+            ),
+            "latency_max": round(self.latency_max, 6),
+            "latency_last": round(self.latency_last, 6),
+        }
@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Tuple
+
+
+class OutboundCommandBuffer:
+    """Thread-safe FIFO of callables which must be executed in the pika ioloop thread.
+
+    Producers from any thread put commands into the buffer, the ioloop drains them in batches.
+    Only the first put after a drain requires an ioloop wakeup, all the following ones are coalesced
+    into the same wakeup until the buffer is drained again.
+    """
+
+    def __init__(self, max_batch_size: int = 500):
+        self.max_batch_size = max_batch_size
+
+        self._commands: Deque[Callable] = deque()
+        self._lock = threading.Lock()
+        self._is_drain_scheduled = False
+
+        self.commands_count = 0
+        self.batches_count = 0
+        self.max_batch_size_seen = 0
+        self.max_depth_seen = 0
+
+    def put(self, command: Callable) -> bool:
+        """Adds command to the buffer. Returns True if caller must schedule ioloop wakeup"""
+        with self._lock:
+            self._commands.append(command)
+            depth = len(self._commands)
+            if depth > self.max_depth_seen:
+                self.max_depth_seen = depth
+            if self._is_drain_scheduled:
+                return False
+            self._is_drain_scheduled = True
+            return True
+
+    def pop_batch(self) -> Tuple[List[Callable], bool]:
+        """Pops up to max_batch_size commands. Returns batch and flag if more commands are left.
+
+        When the buffer is emptied, drain flag is reset and the next put will request a wakeup again
+        """
+        with self._lock:
+            batch_size = min(len(self._commands), self.max_batch_size or len(self._commands))
+            batch = [self._commands.popleft() for _ in range(batch_size)]
+            has_more = len(self._commands) > 0
+            if not has_more:
+                self._is_drain_scheduled = False
+        if batch:
+            self.commands_count += len(batch)
+            self.batches_count += 1
+            if len(batch) > self.max_batch_size_seen:
+                self.max_batch_size_seen = len(batch)
+        return batch, has_more
+
+    def reset_drain_schedule(self) -> bool:
+        """Must be called when ioloop is replaced, pending wakeups of the previous ioloop are lost.
+        Returns True if buffer is not empty and a new wakeup must be scheduled"""
+        with self._lock:
+            self._is_drain_scheduled = len(self._commands) > 0
+            return self._is_drain_scheduled
+
+    def __len__(self):
+        return len(self._commands)
+
+    def get_stats(self) -> dict:
+        return {
+            "depth": len(self._commands),
+            "max_depth": self.max_depth_seen,
+            "commands": self.commands_count,
+            "batches": self.batches_count,
+            "max_batch_size": self.max_batch_size_seen,
+            "avg_batch_size": (
+                round(self.commands_count / self.batches_count, 2) if self.batches_count else 0
+            ),
+        }
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+from pika.adapters.asyncio_connection import AsyncioConnection
+from twisted.internet import defer, reactor
+
+from rmq.utils.decorators import log_current_thread
+
+from .pika_select_connection import PikaSelectConnection
+
+logger = logging.getLogger(__name__)
+
+
+class PikaAsyncioConnection(PikaSelectConnection):
+    """PikaSelectConnection which runs pika on the asyncio event loop of the installed AsyncioSelectorReactor.
+
+    Owner callbacks are invoked directly, there is no dedicated pika thread and no thread hops per message.
+    Owner callback contract is the same, but run() must be called from the reactor thread and returns at once.
+    """
+
+    RUNS_IN_REACTOR_THREAD = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # fired when connection is finally closed, reactor shutdown waits for it
+        self._stopped_deferred = defer.Deferred()
+
+    @staticmethod
+    def _get_event_loop() -> asyncio.AbstractEventLoop:
+        event_loop = getattr(reactor, "_asyncioEventloop", None)
+        if event_loop is None:
+            raise RuntimeError(
+                f"{PikaAsyncioConnection.__name__} requires "
+                f"twisted.internet.asyncioreactor.AsyncioSelectorReactor to be installed"
+            )
+        return event_loop
+
+    @log_current_thread
+    def connect(self):
+        logger.info("Connecting to rabbitmq")
+        return AsyncioConnection(
+            self.parameters,
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_open_error,
+            on_close_callback=self.on_connection_closed,
+            custom_ioloop=self._get_event_loop(),
+        )
+
+    def _call_in_owner_thread(self, f, *args):
+        f(*args)
+
+    def _call_in_ioloop_threadsafe(self, callback):
+        # ioloop of AsyncioConnection is the raw asyncio event loop
+        self.connection.ioloop.call_soon_threadsafe(callback)
+
+    def _remove_timeout(self, timer):
+        # asyncio call_later returns TimerHandle, which is cancelled by itself
+        timer.cancel()
+
+    @log_current_thread
+    def run(self):
+        if self._can_reconnect() and not self._stopping:
+            self._start_connection()
+        else:
+            logger.info("Stopped")
+            if not self._stopped_deferred.called:
+                self._stopped_deferred.callback(None)
+
+    def _stop_ioloop(self):
+        # ioloop is the reactor's event loop and must never be stopped, next connection attempt is started
+        # instead (or connection is reported as stopped)
+        reactor.callLater(0, self.run)
+
+    def _on_reactor_shutdown(self):
+        super()._on_reactor_shutdown()
+        if self.connection is None or self._stopped_deferred.called:
+            return None
+        # the same limit as graceful stop waits for outstanding delivery confirmations
+        timeout = (
+            self._MAX_GRACEFUL_STOP_ATTEMPTS * self._CHECK_DELIVERY_CONFIRMATION_DELAY
+            + self._get_option("reconnect_backoff_max")
+        )
+        self._stopped_deferred.addTimeout(timeout, reactor)
+        self._stopped_deferred.addErrback(self._on_graceful_stop_timeout)
+        return self._stopped_deferred
+
+    def _on_graceful_stop_timeout(self, failure):
+        failure.trap(defer.TimeoutError)
+        logger.warning("Connection was not closed gracefully before reactor shutdown")
@@ -1,7 +1,8 @@
 import functools
 import logging
+import random
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import pika
 from pika.exceptions import ChannelWrongStateError, ConnectionWrongStateError
@@ -9,17 +10,66 @@ from twisted.internet import reactor
 
 from rmq.utils.decorators import log_current_thread
 
+from .channel_delivery_tag import compose_delivery_tag, split_delivery_tag
+from .connection_metrics import ConnectionMetrics
+from .consumer_channel import ConsumerChannel
+from .delivery_confirmation_tracker import DeliveryConfirmationTracker
+from .outbound_command_buffer import OutboundCommandBuffer
+from .publish_window import PublishWindow
+from .retry_topology import RETRY_ATTEMPTS_HEADER, RetryTopology
+
 logger = logging.getLogger(__name__)
 
 
 class PikaSelectConnection:
-    _MAX_CONNECT_ATTEMPTS = 3
+    # pika ioloop of this class runs in a separate thread, owners must start it with reactor.callInThread
+    RUNS_IN_REACTOR_THREAD = False
+
     _MAX_GRACEFUL_STOP_ATTEMPTS = 60
-    _RECONNECT_TIMEOUT = 5
     _EMPTY_QUEUE_DELAY = 5
     _CHECK_DELIVERY_CONFIRMATION_DELAY = 1
 
-    _DEFAULT_OPTIONS = {"enable_delivery_confirmations": True, "prefetch_count": 1}
+    _DEFAULT_OPTIONS = {
+        "enable_delivery_confirmations": True,
+        "prefetch_count": 1,
+        # seconds to wait after wakeup before draining outbound commands, lets more commands join the batch
+        "outbound_linger": 0,
+        # max commands executed per one ioloop iteration, the rest are drained on the next iteration
+        "outbound_max_batch_size": 500,
+        # acknowledge contiguous completed deliveries with single basic_ack(multiple=True)
+        "batch_acknowledgements": True,
+        # seconds to hold out of order completed deliveries before acknowledging them one by one
+        "ack_flush_interval": 1,
+        # number of channels consuming from queue, each with own prefetch
+        "consumer_channels_count": 1,
+        # if True primary channel is used for publishing/declarations only and never consumes
+        "dedicated_publish_channel": False,
+        # prefetch count per consuming channel, falls back to prefetch_count
+        "consumer_prefetch_counts": None,
+        # reopen closed channel/connection, redeclare queue and resume consuming instead of closing spider
+        "auto_reconnect": True,
+        # max consecutive failed reconnect attempts before shutdown, 0 - unlimited
+        "reconnect_max_attempts": 10,
+        # reconnect delay doubles from base up to max seconds, half of it is random jitter
+        "reconnect_backoff_base": 1,
+        "reconnect_backoff_max": 30,
+        # max publishes scheduled with publish_message_threadsafe and not confirmed yet, 0 - unlimited
+        "publish_window": 0,
+        # seconds between connection stats pushes to owner's on_connection_stats, 0 - disabled
+        "stats_interval": 60,
+        # declare own queue with x-max-priority argument, 0 - queue without priorities
+        "max_priority": 0,
+        # names of queue shards, they are declared like own queue and consumed instead of it
+        "shard_queues": None,
+        # nacked deliveries of consumer are moved to delayed retry queues and, after this number of attempts,
+        # to parking queue, see RetryTopology. Enables delivery confirmations, nacked delivery is acked once
+        # its copy is confirmed. 0 - nacked deliveries are requeued immediately
+        "retry_max_attempts": 0,
+        # delay of the first retry tier in seconds, each next tier waits delay_factor times longer
+        "retry_base_delay": 5,
+        "retry_delay_factor": 2,
+        "retry_tiers": 5,
+    }
 
     def __init__(
         self,
@@ -55,21 +105,93 @@ class PikaSelectConnection:
 
         # status of stopping connection
         self._stopping = False
+        # consumers are being cancelled by stop_consuming, they must not be restarted
+        self._stopping_consumers = False
         self._current_connect_attempts_count = 0
         self._current_graceful_stop_attempts_count = 0
 
         self._message_number = 0
-        self._deliveries: List[int] = []
-        self._acked = 0
-        self._nacked = 0
+        # publisher confirms tracking, filled only if delivery confirmations are enabled on channel
+        self._confirmations = DeliveryConfirmationTracker()
+        self._is_delivery_confirmations_enabled = False
+        # publish delivery tags which hold a slot of publish window until confirmed
+        self._reserved_publish_tags = set()
+        # owner thread callbacks of publishes which wait for confirm, by delivery tag
+        self._publish_confirm_callbacks = {}
+        # owner thread state, see publish_message_threadsafe
+        self._publish_window = PublishWindow(self._get_option("publish_window") or 0)
+        self._is_connection_blocked = False
+
+        # queues already declared on current channel and publishes waiting for the first declare of queue
+        self._declared_queues = set()
+        self._pending_queue_publishes = {}
+
+        self._retry_topology = self._build_retry_topology()
+        # consumed deliveries which are moved to retry queue when nacked: delivery tag -> (queue, properties, body)
+        self._retry_deliveries = {}
+        # publish delivery tag -> consumed delivery tag which is acknowledged when its retry copy is confirmed
+        self._retry_publishes = {}
 
-        self._consumer_tag = None
         self._consuming = False
 
+        # channels receiving deliveries. Index 0 is the primary channel (self._channel), which also carries
+        # publishes, declarations and basic_get. Additional channels are opened for consuming only
+        self._channels: List[ConsumerChannel] = self._build_consumer_channels()
+        self._channels_by_number = {}
+
         self.__ignore_ack_after = None
 
         self.shutdown_event_handler = None
 
+        self._metrics = ConnectionMetrics()
+        self._stats_timer = None
+
+        # commands scheduled from other threads (publish, ack, nack, stop) to be executed in ioloop thread
+        self._outbound_commands = OutboundCommandBuffer(
+            max_batch_size=self._get_option("outbound_max_batch_size")
+        )
+
+    def _get_option(self, name):
+        return self.options.get(name, self._DEFAULT_OPTIONS.get(name))
+
+    def _build_retry_topology(self) -> Optional[RetryTopology]:
+        max_attempts = self._get_option("retry_max_attempts")
+        if not self.is_consumer or not max_attempts:
+            return None
+        return RetryTopology(
+            self.queue_name,
+            max_attempts,
+            base_delay=self._get_option("retry_base_delay"),
+            delay_factor=self._get_option("retry_delay_factor"),
+            tiers_count=self._get_option("retry_tiers"),
+        )
+
+    @property
+    def _requires_delivery_confirmations(self) -> bool:
+        # nacked delivery is acknowledged only after broker confirms its copy in retry queue
+        return bool(self._get_option("enable_delivery_confirmations")) or (
+            self._retry_topology is not None
+        )
+
+    def _build_consumer_channels(self) -> List[ConsumerChannel]:
+        default_prefetch_count = (
+            self._get_option("prefetch_count") or self._DEFAULT_OPTIONS["prefetch_count"]
+        )
+        if not self.is_consumer:
+            return [ConsumerChannel(0, default_prefetch_count, is_consumer=False)]
+
+        is_primary_consumer = not self._get_option("dedicated_publish_channel")
+        consumer_channels_count = max(self._get_option("consumer_channels_count") or 1, 1)
+        prefetch_counts = self._get_option("consumer_prefetch_counts") or []
+
+        channels = [] if is_primary_consumer else [ConsumerChannel(0, default_prefetch_count, False)]
+        for position in range(consumer_channels_count):
+            prefetch_count = (
+                prefetch_counts[position] if position < len(prefetch_counts) else None
+            ) or default_prefetch_count
+            channels.append(ConsumerChannel(len(channels), prefetch_count))
+        return channels
+
     @log_current_thread
     def connect(self):
         logger.info("Connecting to rabbitmq")
@@ -82,42 +204,72 @@ class PikaSelectConnection:
 
     def on_connection_open(self, _unused_connection):
         logger.info("Connection opened")
-        self._current_connect_attempts_count = 0
+        self._is_connection_blocked = False
+        self.connection.add_on_connection_blocked_callback(self.on_connection_blocked)
+        self.connection.add_on_connection_unblocked_callback(self.on_connection_unblocked)
         self.__owner_update_connection_handle()
+        self._schedule_stats_dump()
         self.open_channel()
 
+    def on_connection_blocked(self, _unused_connection, method_frame):
+        logger.warning("Connection blocked by broker: {}".format(method_frame.method.reason))
+        self._is_connection_blocked = True
+        self._metrics.connection_blocks += 1
+        self._call_in_owner_thread(self._publish_window.set_blocked, True)
+
+    def on_connection_unblocked(self, _unused_connection, _unused_method_frame):
+        logger.info("Connection unblocked by broker")
+        self._is_connection_blocked = False
+        if self.can_interact:
+            self._call_in_owner_thread(self._publish_window.set_blocked, False)
+
     # section for describing owner flow controlling
+    def _call_in_owner_thread(self, f, *args):
+        """Owners live in the reactor thread, pika ioloop runs in separate one"""
+        reactor.callFromThread(f, *args)
+
     def __owner_update_connection_handle(self):
         set_connection_handle = getattr(self.owner, "set_connection_handle", None)
         if callable(set_connection_handle):
-            reactor.callFromThread(self.owner.set_connection_handle, self)
+            self._call_in_owner_thread(self.owner.set_connection_handle, self)
 
     def __owner_update_can_interact_value(self):
         owner_set_can_interact = getattr(self.owner, "set_can_interact", None)
         if callable(owner_set_can_interact):
-            reactor.callFromThread(self.owner.set_can_interact, self.can_interact)
+            self._call_in_owner_thread(self.owner.set_can_interact, self.can_interact)
 
     def __owner_schedule_graceful_shutdown(self):
         raise_close_spider = getattr(self.owner, "raise_close_spider", None)
         if callable(raise_close_spider):
-            reactor.callFromThread(self.owner.raise_close_spider)
+            self._call_in_owner_thread(self.owner.raise_close_spider)
 
     @log_current_thread
     def __owner_call_on_msg_consumed_handler(self, msg_object):
         owner_on_message_consumed = getattr(self.owner, "on_message_consumed", None)
         if callable(owner_on_message_consumed):
-            reactor.callFromThread(self.owner.on_message_consumed, msg_object)
+            self._call_in_owner_thread(self.owner.on_message_consumed, msg_object)
 
     @log_current_thread
     def __owner_call_on_basic_get_msg_handler(self, msg_object):
         owner_on_basic_get_message = getattr(self.owner, "on_basic_get_message", None)
         if callable(owner_on_basic_get_message):
-            reactor.callFromThread(self.owner.on_basic_get_message, msg_object)
+            self._call_in_owner_thread(self.owner.on_basic_get_message, msg_object)
 
     def __owner_call_on_basic_get_empty_handler(self):
         owner_on_basic_get_empty = getattr(self.owner, "on_basic_get_empty", None)
         if callable(owner_on_basic_get_empty):
-            reactor.callFromThread(self.owner.on_basic_get_empty)
+            self._call_in_owner_thread(self.owner.on_basic_get_empty)
+
+    def __owner_update_stats(self, stats):
+        owner_on_connection_stats = getattr(self.owner, "on_connection_stats", None)
+        if callable(owner_on_connection_stats):
+            self._call_in_owner_thread(self.__owner_call_on_connection_stats_handler, stats)
+
+    def __owner_call_on_connection_stats_handler(self, stats):
+        # publish window lives in the owner thread
+        for key, value in self._publish_window.get_stats().items():
+            stats[f"publish_window/{key}"] = value
+        self.owner.on_connection_stats(stats)
 
     def _init_graceful_shutdown(self, with_stop=False):
         # Note: skipping ack/nack for all events after channel closed event received. Schedule graceful
@@ -131,31 +283,63 @@ class PikaSelectConnection:
         self.can_interact = False
         self.__owner_update_can_interact_value()
 
-        self._current_connect_attempts_count += 1
-        if self._current_connect_attempts_count < self._MAX_CONNECT_ATTEMPTS:
+        if self._register_reconnect_attempt():
             self.reconnect(err)
         else:
             logger.error("Connection open max attempts count exceeded. Shutting down")
             self._init_graceful_shutdown(True)
 
+    def _can_reconnect(self) -> bool:
+        max_attempts = self._get_option("reconnect_max_attempts")
+        return not max_attempts or self._current_connect_attempts_count < max_attempts
+
+    def _register_reconnect_attempt(self) -> bool:
+        """Counts failed attempt. Returns False if max attempts count is exceeded"""
+        self._current_connect_attempts_count += 1
+        return self._can_reconnect()
+
+    def _get_reconnect_delay(self) -> float:
+        """Exponential backoff with jitter, so owners of many processes do not reconnect all at once"""
+        delay = min(
+            self._get_option("reconnect_backoff_base")
+            * 2 ** max(self._current_connect_attempts_count - 1, 0),
+            self._get_option("reconnect_backoff_max"),
+        )
+        return delay / 2 + random.uniform(0, delay / 2)
+
     @log_current_thread
     def reconnect(self, reason):
+        delay = self._get_reconnect_delay()
+        self._metrics.reconnects += 1
         logger.warning(
-            f"Connection open failed, reopening in {self._RECONNECT_TIMEOUT} seconds: {reason}"
+            "Reconnecting in {:.2f} seconds (attempt {}): {}".format(
+                delay, self._current_connect_attempts_count, reason
+            )
         )
-        self.connection.ioloop.call_later(self._RECONNECT_TIMEOUT, self.connection.ioloop.stop)
+        self.connection.ioloop.call_later(delay, self._stop_ioloop)
 
     def on_connection_closed(self, _unused_connection, reason):
         self._channel = None
+        self._detach_channels()
         self.can_interact = False
         self.__owner_update_can_interact_value()
+        self._reset_confirmations()
+        self._cancel_stats_dump()
+        self._dump_stats()
 
         if self._stopping:
-            self.connection.ioloop.stop()
-        else:
-            self.can_interact = False
-            self.__owner_update_can_interact_value()
+            self._call_in_owner_thread(self._publish_window.reset)
+            self._stop_ioloop()
+        elif not self._get_option("auto_reconnect"):
+            self._call_in_owner_thread(self._publish_window.reset)
             self._init_graceful_shutdown()
+        elif self._register_reconnect_attempt():
+            # publishers wait until connection is recovered
+            self._call_in_owner_thread(self._publish_window.set_blocked, True)
+            self.reconnect(reason)
+        else:
+            logger.error("Reconnect max attempts count exceeded. Shutting down")
+            self._init_graceful_shutdown(True)
 
     def open_channel(self):
         logger.info("Creating a new channel")
@@ -165,63 +349,278 @@ class PikaSelectConnection:
     def on_channel_open(self, channel):
         logger.info("Channel opened")
         self._channel = channel
+        # publish delivery tags are restarted on each channel
+        self._message_number = 0
+        self._reset_confirmations()
+        self._is_delivery_confirmations_enabled = False
+        # declarations are cached per channel, queues could be deleted while channel was closed
+        self._declared_queues = set()
+        dropped_count = 0
+        for pending_publishes in self._pending_queue_publishes.values():
+            for _message, _properties, reserved, on_confirm in pending_publishes:
+                dropped_count += reserved
+                self._notify_publish_confirmed(on_confirm, False)
+        self._release_publish_slots(dropped_count)
+        self._pending_queue_publishes = {}
+        self._attach_channel(self._channels[0], channel)
         self._channel.add_on_close_callback(self.on_channel_closed)
+        self._channel.add_on_cancel_callback(self.on_consumer_cancelled)
         self._channel.add_callback(
             self.on_basic_get_empty, [pika.spec.Basic.GetEmpty], one_shot=False
         )
         self.__ignore_ack_after = None
         self.setup_queue(self.queue_name)
 
+    def open_consumer_channel(self, consumer_channel: ConsumerChannel):
+        logger.info("Creating consumer channel #{}".format(consumer_channel.index))
+        consumer_channel.is_opening = True
+        self.connection.channel(
+            on_open_callback=functools.partial(
+                self.on_consumer_channel_open, consumer_channel=consumer_channel
+            )
+        )
+
+    def on_consumer_channel_open(self, channel, consumer_channel: ConsumerChannel):
+        logger.info("Consumer channel #{} opened".format(consumer_channel.index))
+        self._attach_channel(consumer_channel, channel)
+        channel.add_on_close_callback(self.on_channel_closed)
+        channel.add_on_cancel_callback(self.on_consumer_cancelled)
+        channel.basic_qos(
+            prefetch_count=consumer_channel.prefetch_count,
+            callback=functools.partial(
+                self.on_consumer_channel_qos_ok, consumer_channel=consumer_channel
+            ),
+        )
+
+    def on_consumer_channel_qos_ok(self, _unused_frame, consumer_channel: ConsumerChannel):
+        self._current_connect_attempts_count = 0
+        if self.is_consumer and not self._stopping:
+            self._basic_consume(consumer_channel)
+
+    def _attach_channel(self, consumer_channel: ConsumerChannel, channel):
+        self._channels_by_number.pop(consumer_channel.channel_number, None)
+        consumer_channel.attach(channel)
+        self._channels_by_number[channel.channel_number] = consumer_channel
+
+    def _detach_channel(self, consumer_channel: ConsumerChannel):
+        # timers of a closed connection belong to its ioloop, they are only forgotten
+        consumer_channel.detach(self._remove_timeout if self.connection is not None else None)
+
+    def _detach_channels(self):
+        for consumer_channel in self._channels:
+            self._detach_channel(consumer_channel)
+        self._channels_by_number = {}
+
     def on_channel_closed(self, channel, reason):
         logger.warning("Channel {} was closed: {}".format(channel, reason))
-        self._channel = None
+        consumer_channel = self._channels_by_number.get(channel.channel_number)
+        if consumer_channel is not None and consumer_channel.channel is channel:
+            del self._channels_by_number[channel.channel_number]
+            self._detach_channel(consumer_channel)
+        is_primary_channel = channel is self._channel
+        if is_primary_channel:
+            self._channel = None
         if self._stopping:
-            self.close_connection()
-        else:
+            # consumer channels are closed before primary one, connection is closed after primary channel
+            if is_primary_channel:
+                self.close_connection()
+        elif not self._get_option("auto_reconnect"):
             self.can_interact = False
             self.__owner_update_can_interact_value()
             self._init_graceful_shutdown()
+        elif self.connection is None or not self.connection.is_open:
+            # channels are closed together with connection, it is reopened by on_connection_closed
+            return
+        elif not self._register_reconnect_attempt():
+            logger.error("Channel reopen max attempts count exceeded. Shutting down")
+            self._init_graceful_shutdown(True)
+        elif is_primary_channel:
+            self.can_interact = False
+            self.__owner_update_can_interact_value()
+            self._call_in_owner_thread(self._publish_window.set_blocked, True)
+            delay = self._get_reconnect_delay()
+            self._metrics.channel_reopens += 1
+            logger.warning("Reopening channel in {:.2f} seconds".format(delay))
+            # queue is declared again on the new channel and consumers are restarted by start_interacting
+            self.connection.ioloop.call_later(delay, self.open_channel)
+        elif consumer_channel is not None:
+            delay = self._get_reconnect_delay()
+            self._metrics.channel_reopens += 1
+            logger.warning(
+                "Reopening consumer channel #{} in {:.2f} seconds".format(
+                    consumer_channel.index, delay
+                )
+            )
+            self.connection.ioloop.call_later(delay, self.start_consuming)
 
     def setup_queue(self, queue_name):
         """If queue require some specific properties at declaration subclass of this class should be created and
         this method should be overridden"""
         logger.info("Declaring queue {}".format(queue_name))
         self._channel.queue_declare(
-            queue=queue_name, callback=self.on_queue_declare_ok, durable=True
+            queue=queue_name,
+            callback=self.on_queue_declare_ok,
+            durable=True,
+            arguments=self._get_queue_arguments(),
         )
 
+    def _get_queue_arguments(self):
+        max_priority = self._get_option("max_priority")
+        if max_priority:
+            return {"x-max-priority": max_priority}
+        return None
+
+    @property
+    def consume_queue_names(self):
+        return self._get_option("shard_queues") or [self.queue_name]
+
     def on_queue_declare_ok(self, _unused_frame):
         logger.info("Queue declared")
+        self._declared_queues.add(self.queue_name)
+        self.declare_shard_queues()
+
+    def declare_shard_queues(self, _unused_frame=None, queue_name=None):
+        """Declares shard queues one by one with the same arguments as own queue, then sets qos"""
+        if queue_name is not None:
+            self._declared_queues.add(queue_name)
+        for shard_queue_name in self._get_option("shard_queues") or []:
+            if shard_queue_name not in self._declared_queues:
+                logger.info("Declaring queue shard {}".format(shard_queue_name))
+                cb = functools.partial(self.declare_shard_queues, queue_name=shard_queue_name)
+                self._channel.queue_declare(
+                    queue=shard_queue_name,
+                    callback=cb,
+                    durable=True,
+                    arguments=self._get_queue_arguments(),
+                )
+                return
+        self.declare_retry_queues()
+
+    def declare_retry_queues(self, _unused_frame=None, queue_name=None):
+        """Declares retry tiers of consumed queues and parking queue one by one, then sets qos"""
+        if queue_name is not None:
+            self._declared_queues.add(queue_name)
+        if self._retry_topology is not None:
+            for retry_queue_name, arguments in self._retry_topology.get_queue_declarations(
+                self.consume_queue_names
+            ):
+                if retry_queue_name not in self._declared_queues:
+                    logger.info("Declaring retry queue {}".format(retry_queue_name))
+                    cb = functools.partial(self.declare_retry_queues, queue_name=retry_queue_name)
+                    self._channel.queue_declare(
+                        queue=retry_queue_name, callback=cb, durable=True, arguments=arguments
+                    )
+                    return
         self.set_qos()
 
     def set_qos(self):
         self._channel.basic_qos(
-            prefetch_count=self.options["prefetch_count"]
-            or self._DEFAULT_OPTIONS["prefetch_count"],
+            prefetch_count=self._channels[0].prefetch_count,
             callback=self.start_interacting,
         )
 
+    def set_prefetch_count(self, prefetch_count):
+        """Changes prefetch count of all consuming channels at runtime, must be called in the ioloop thread.
+        Per-consumer prefetch count applies only to consumers started after basic_qos, so active consumers
+        of the channel are cancelled and started again once the new prefetch count is set"""
+        for consumer_channel in self._channels:
+            if not consumer_channel.is_consumer:
+                continue
+            if consumer_channel.prefetch_count == prefetch_count:
+                continue
+            consumer_channel.prefetch_count = prefetch_count
+            if consumer_channel.is_open:
+                consumer_channel.channel.basic_qos(
+                    prefetch_count=prefetch_count,
+                    callback=functools.partial(
+                        self.on_prefetch_count_qos_ok,
+                        consumer_channel=consumer_channel,
+                        generation=consumer_channel.generation,
+                    ),
+                )
+
+    def on_prefetch_count_qos_ok(
+        self, _unused_frame, consumer_channel: ConsumerChannel, generation
+    ):
+        if self._stopping_consumers:
+            return
+        if generation != consumer_channel.generation or not consumer_channel.is_open:
+            return
+        # consumer tags are kept until cancel is confirmed, stop_consuming could still cancel them
+        for consumer_tag in list(consumer_channel.consumer_tags.values()):
+            consumer_channel.channel.basic_cancel(
+                consumer_tag,
+                functools.partial(
+                    self.on_prefetch_count_cancel_ok,
+                    consumer_channel=consumer_channel,
+                    consumer_tag=consumer_tag,
+                    generation=generation,
+                ),
+            )
+
+    def on_prefetch_count_cancel_ok(
+        self, frame, consumer_channel: ConsumerChannel, consumer_tag, generation
+    ):
+        if self._stopping_consumers:
+            # cancel sent by stop_consuming was ignored by pika, consumer was already cancelling
+            self.on_cancel_ok(frame, consumer_tag)
+            return
+        if generation != consumer_channel.generation or not consumer_channel.is_open:
+            return
+        consumer_channel.remove_consumer_tag(consumer_tag)
+        if self.is_consumer:
+            # deliveries in flight to the cancelled consumer are rejected by pika and redelivered
+            self._basic_consume(consumer_channel)
+
     def start_interacting(self, _unused_frame):
         logger.info("Issuing consumer related RPC commands")
-        if self.options.get(
-            "enable_delivery_confirmations", self._DEFAULT_OPTIONS["enable_delivery_confirmations"]
-        ):
+        # topology is declared and qos is set, connection is recovered
+        self._current_connect_attempts_count = 0
+        if self._requires_delivery_confirmations and not self._is_delivery_confirmations_enabled:
             self.enable_delivery_confirmations()
         self.can_interact = True
         self.__owner_update_can_interact_value()
+        self._call_in_owner_thread(self._publish_window.set_blocked, self._is_connection_blocked)
 
         if self.is_consumer is True:
-            self._channel.add_on_cancel_callback(self.on_consumer_cancelled)
-            self._consumer_tag = self._channel.basic_consume(self.queue_name, self.on_message)
-            self._consuming = True
+            self.start_consuming()
+
+    def start_consuming(self):
+        """Starts consumers on all consuming channels which are not consuming yet"""
+        if self._stopping or self._channel is None or not self._channel.is_open:
+            return
+        for consumer_channel in self._channels:
+            if not consumer_channel.is_consumer or consumer_channel.consuming:
+                continue
+            if consumer_channel.is_open:
+                self._basic_consume(consumer_channel)
+            elif consumer_channel.index > 0 and not consumer_channel.is_opening:
+                self.open_consumer_channel(consumer_channel)
+
+    def _basic_consume(self, consumer_channel: ConsumerChannel):
+        for queue_name in self.consume_queue_names:
+            if queue_name not in consumer_channel.consumer_tags:
+                consumer_channel.consumer_tags[queue_name] = consumer_channel.channel.basic_consume(
+                    queue_name, self.on_message
+                )
+        consumer_channel.consuming = True
+        self._consuming = True
 
     def on_consumer_cancelled(self, method_frame):
         logger.info("Consumer was cancelled remotely, reopen consumer: {}".format(method_frame))
+        self._metrics.consumer_cancels += 1
+        consumer_channel = self._channels_by_number.get(method_frame.channel_number)
         if (
             self.is_consumer
-            and method_frame.channel_number == self._channel.channel_number
+            and consumer_channel is not None
+            and consumer_channel.is_open
+            and self._channel is not None
             and self._channel.is_open
         ):
+            consumer_channel.remove_consumer_tag(method_frame.method.consumer_tag)
+            consumer_channel.consuming = False
+            # queue is declared again on primary channel, then all cancelled consumers are restarted
+            self._declared_queues.difference_update(self.consume_queue_names)
             cb = functools.partial(self.setup_queue, queue_name=self.queue_name)
             self.connection.ioloop.call_later(self._EMPTY_QUEUE_DELAY, cb)
         else:
@@ -229,7 +628,7 @@ class PikaSelectConnection:
                 self.connection.ioloop.call_later(
                     self._EMPTY_QUEUE_DELAY, functools.partial(self.open_channel)
                 )
-            else:
+            elif not self._get_option("auto_reconnect"):
                 # Note: skipping ack/nack for all events after channel closed event received. Schedule graceful
                 # shutdown of spider. Restart spider must be handled externally (pm2/docker swarm)
                 self.__ignore_ack_after = datetime.now().microsecond
@@ -237,10 +636,14 @@ class PikaSelectConnection:
 
     @log_current_thread
     def stop_consuming(self):
-        if self._channel and self._consuming:
-            logger.info("Sending a Basic.Cancel RPC command to RabbitMQ")
-            cb = functools.partial(self.on_cancel_ok, consumer_tag=self._consumer_tag)
-            self._channel.basic_cancel(self._consumer_tag, cb)
+        self._stopping_consumers = True
+        consuming_channels = [c for c in self._channels if c.consuming and c.is_open]
+        if consuming_channels:
+            for consumer_channel in consuming_channels:
+                for consumer_tag in consumer_channel.consumer_tags.values():
+                    logger.info("Sending a Basic.Cancel RPC command to RabbitMQ")
+                    cb = functools.partial(self.on_cancel_ok, consumer_tag=consumer_tag)
+                    consumer_channel.channel.basic_cancel(consumer_tag, cb)
         else:
             self.on_cancel_ok(None, None)
 
@@ -249,72 +652,208 @@ class PikaSelectConnection:
             logger.info(
                 "RabbitMQ acknowledged the cancellation of the consumer: {}".format(consumer_tag)
             )
+            for consumer_channel in self._channels:
+                if consumer_channel.remove_consumer_tag(consumer_tag):
+                    consumer_channel.consuming = bool(consumer_channel.consumer_tags)
+            if any(c.consuming and c.is_open for c in self._channels):
+                return
         self._consuming = False
         self.stop()
 
     def enable_delivery_confirmations(self):
         logger.info("Issuing Confirm.Select RPC command")
         self._channel.confirm_delivery(self.on_delivery_confirmation)
+        self._is_delivery_confirmations_enabled = True
 
     def on_delivery_confirmation(self, method_frame):
         confirmation_type = method_frame.method.NAME.split(".")[1].lower()
         logger.debug(
-            "Received {} for delivery tag: {}".format(
-                confirmation_type, method_frame.method.delivery_tag
+            "Received {} for delivery tag: {} (multiple: {})".format(
+                confirmation_type, method_frame.method.delivery_tag, method_frame.method.multiple
             )
         )
-        if confirmation_type == "ack":
-            self._acked += 1
-        elif confirmation_type == "nack":
-            self._nacked += 1
-        self._deliveries.remove(method_frame.method.delivery_tag)
+        confirmed = self._confirmations.confirm(
+            method_frame.method.delivery_tag,
+            multiple=method_frame.method.multiple,
+            is_ack=confirmation_type == "ack",
+        )
+        if self._publish_confirm_callbacks:
+            for delivery_tag in confirmed:
+                on_confirm = self._publish_confirm_callbacks.pop(delivery_tag, None)
+                self._notify_publish_confirmed(on_confirm, confirmation_type == "ack")
+        if self._retry_publishes:
+            for delivery_tag in confirmed:
+                retried_delivery_tag = self._retry_publishes.pop(delivery_tag, None)
+                if retried_delivery_tag is None:
+                    continue
+                if confirmation_type == "ack":
+                    self.acknowledge_message(retried_delivery_tag)
+                else:
+                    self._requeue_delivery(retried_delivery_tag)
+        if self._reserved_publish_tags:
+            released_count = 0
+            for delivery_tag in confirmed:
+                if delivery_tag in self._reserved_publish_tags:
+                    self._reserved_publish_tags.remove(delivery_tag)
+                    released_count += 1
+            self._release_publish_slots(released_count)
         logger.debug(
             "Published {} messages, {} have yet to be confirmed, {} were acked and {} were nacked".format(
-                self._message_number, len(self._deliveries), self._acked, self._nacked
+                self._message_number,
+                self._confirmations.in_flight,
+                self._confirmations.acked,
+                self._confirmations.nacked,
             )
         )
 
+    def _reset_confirmations(self):
+        """Unconfirmed publishes of closed channel will never be confirmed, their window slots are released
+        and their confirm callbacks are called as for nacked publishes"""
+        self._confirmations.reset()
+        for on_confirm in self._publish_confirm_callbacks.values():
+            self._notify_publish_confirmed(on_confirm, False)
+        self._publish_confirm_callbacks = {}
+        # retry copies could be lost, deliveries of still open consumer channels are returned to their queues
+        retried_delivery_tags = list(self._retry_publishes.values())
+        self._retry_publishes = {}
+        for delivery_tag in retried_delivery_tags:
+            self._requeue_delivery(delivery_tag)
+        self._release_publish_slots(len(self._reserved_publish_tags))
+        self._reserved_publish_tags = set()
+
+    def _notify_publish_confirmed(self, on_confirm, is_ack):
+        if on_confirm is not None:
+            self._call_in_owner_thread(on_confirm, is_ack)
+
+    def _release_publish_slots(self, count):
+        if count:
+            self._call_in_owner_thread(self._publish_window.release, count)
+
+    def get_confirmation_stats(self) -> dict:
+        return self._confirmations.get_stats()
+
+    # publish window methods must be called from the owner thread
+    @property
+    def has_publish_capacity(self) -> bool:
+        return self._publish_window.has_capacity
+
+    def wait_for_publish_capacity(self):
+        """Returns Deferred which fires when publish window has free slot and connection is not blocked"""
+        return self._publish_window.wait()
+
+    def publish_message_threadsafe(
+        self,
+        message,
+        queue_name: str = None,
+        properties: pika.BasicProperties = None,
+        on_confirm=None,
+    ):
+        """Schedules publish from the owner thread. Publish holds a slot of publish window until confirmed.
+
+        on_confirm(is_ack) is called in the owner thread when broker acks or nacks the message. Publishes
+        which could not be sent or whose channel was closed before confirm are reported as nacked
+        """
+        self._publish_window.acquire()
+        self.add_callback_threadsafe(
+            functools.partial(
+                self.publish_message,
+                message=message,
+                queue_name=queue_name,
+                properties=properties,
+                reserved=True,
+                on_confirm=on_confirm,
+            )
+        )
+
+    def get_publish_window_stats(self) -> dict:
+        return self._publish_window.get_stats()
+
     def get_ready_messages_count(self, queue_name=None, callback=None):
+        """queue_name could be a list of queues (e.g. shards), then callback gets sum of their counts"""
         if queue_name is None:
             queue_name = self.queue_name
+        queue_names = [queue_name] if isinstance(queue_name, str) else list(queue_name)
         cb = functools.partial(
-            self._exec_get_ready_messages_count_issuer_callback, callback=callback
+            self._exec_get_ready_messages_count_issuer_callback,
+            callback=callback,
+            message_counts=[],
+            queues_count=len(queue_names),
         )
-        self._channel.queue_declare(queue=queue_name, callback=cb, durable=True, passive=True)
+        for name in queue_names:
+            self._channel.queue_declare(queue=name, callback=cb, durable=True, passive=True)
 
-    def _exec_get_ready_messages_count_issuer_callback(self, frame, callback):
-        message_count = frame.method.message_count
+    def _exec_get_ready_messages_count_issuer_callback(
+        self, frame, callback, message_counts=None, queues_count=1
+    ):
+        if message_counts is None:
+            message_counts = []
+        message_counts.append(frame.method.message_count)
+        if len(message_counts) < queues_count:
+            return
         if callback is not None:
-            callback(message_count=message_count)
+            callback(message_count=sum(message_counts))
 
     def publish_message(
-        self, message, queue_name: str = None, properties: pika.BasicProperties = None
+        self,
+        message,
+        queue_name: str = None,
+        properties: pika.BasicProperties = None,
+        reserved=False,
+        on_confirm=None,
     ):
         if self._channel is None or not self._channel.is_open:
+            if reserved:
+                self._release_publish_slots(1)
+            self._notify_publish_confirmed(on_confirm, False)
             return
         if queue_name is None:
             queue_name = self.queue_name
         if properties is None:
             properties = pika.BasicProperties(content_type="application/json", delivery_mode=2)
 
-        if queue_name == self.queue_name:
-            self._channel.basic_publish("", queue_name, message, properties)
-            self._message_number += 1
-            self._deliveries.append(self._message_number)
-            logger.debug("Published message # {}".format(self._message_number))
-        else:
-            cb = functools.partial(
-                self.publish_to_ensured_queue,
-                message=message,
-                queue_name=queue_name,
-                properties=properties,
+        if queue_name == self.queue_name or queue_name in self._declared_queues:
+            self._basic_publish(message, queue_name, properties, reserved, on_confirm)
+        elif queue_name in self._pending_queue_publishes:
+            # declaration of queue is already in progress, publish right after it is confirmed
+            self._pending_queue_publishes[queue_name].append(
+                (message, properties, reserved, on_confirm)
             )
+        else:
+            self._pending_queue_publishes[queue_name] = [
+                (message, properties, reserved, on_confirm)
+            ]
+            cb = functools.partial(self.on_publish_queue_declare_ok, queue_name=queue_name)
             self._channel.queue_declare(queue=queue_name, callback=cb, durable=True)
 
-    def publish_to_ensured_queue(self, _unused_frame, message, queue_name, properties):
+    def on_publish_queue_declare_ok(self, frame, queue_name):
+        self._declared_queues.add(queue_name)
+        for message, properties, reserved, on_confirm in self._pending_queue_publishes.pop(
+            queue_name, []
+        ):
+            self.publish_to_ensured_queue(
+                frame, message, queue_name, properties, reserved, on_confirm
+            )
+
+    def publish_to_ensured_queue(
+        self, _unused_frame, message, queue_name, properties, reserved=False, on_confirm=None
+    ):
+        self._basic_publish(message, queue_name, properties, reserved, on_confirm)
+
+    def _basic_publish(self, message, queue_name, properties, reserved=False, on_confirm=None):
         self._channel.basic_publish("", queue_name, message, properties)
         self._message_number += 1
-        self._deliveries.append(self._message_number)
+        self._metrics.published += 1
+        if self._is_delivery_confirmations_enabled:
+            self._confirmations.add(self._message_number)
+            if reserved:
+                self._reserved_publish_tags.add(self._message_number)
+            if on_confirm is not None:
+                self._publish_confirm_callbacks[self._message_number] = on_confirm
+        else:
+            # nothing to wait for, slot only bounds publishes buffered before sending
+            if reserved:
+                self._release_publish_slots(1)
+            self._notify_publish_confirmed(on_confirm, True)
         logger.debug("Published message # {}".format(self._message_number))
 
     def get_message(self):
@@ -323,6 +862,8 @@ class PikaSelectConnection:
         self._channel.basic_get(self.queue_name, self.on_basic_get_message, auto_ack=False)
 
     def on_basic_get_message(self, channel, method, properties, body):
+        self._accept_delivery(channel, method)
+        self._track_retry_delivery(method, properties, body)
         msg_object = {
             "channel": channel,
             "method": method,
@@ -342,6 +883,8 @@ class PikaSelectConnection:
 
     @log_current_thread
     def on_message(self, channel, method, properties, body):
+        self._accept_delivery(channel, method)
+        self._track_retry_delivery(method, properties, body)
         msg_object = {
             "channel": channel,
             "method": method,
@@ -352,6 +895,7 @@ class PikaSelectConnection:
 
     @log_current_thread
     def acknowledge_message(self, delivery_tag):
+        self._retry_deliveries.pop(delivery_tag, None)
         if self.__ignore_ack_after:
             logger.info(
                 f"Skip acknowledgement. Reason: ignore ack after is set. "
@@ -359,56 +903,272 @@ class PikaSelectConnection:
             )
             return
 
-        if self._channel is not None and self._channel.is_open:
-            self._channel.basic_ack(delivery_tag)
+        consumer_channel, channel_delivery_tag = self._resolve_delivery_tag(delivery_tag)
+        if consumer_channel is not None and consumer_channel.is_open:
+            self._metrics.acked += 1
+            if self._get_option(
+                "batch_acknowledgements"
+            ) and consumer_channel.acknowledgements.complete(channel_delivery_tag):
+                self._schedule_acknowledgements_flush(consumer_channel)
+            else:
+                consumer_channel.channel.basic_ack(channel_delivery_tag)
+                self._metrics.ack_frames += 1
+
+    def acknowledge_messages(self, delivery_tags):
+        """Acknowledges batch of deliveries, contiguous ones are sent as single basic_ack(multiple=True)"""
+        for delivery_tag in delivery_tags:
+            self.acknowledge_message(delivery_tag)
+
+    def negative_acknowledge_messages(self, delivery_tags):
+        for delivery_tag in delivery_tags:
+            self.negative_acknowledge_message(delivery_tag)
 
     def negative_acknowledge_message(self, delivery_tag):
+        retry_delivery = self._retry_deliveries.pop(delivery_tag, None)
         if self.__ignore_ack_after:
             logger.info(
                 f"Skip acknowledgement. Reason: ignore nack after is set. "
                 f"Ignore ts:{self.__ignore_ack_after} ms"
             )
             return
-        if self._channel is not None and self._channel.is_open:
-            self._channel.basic_nack(delivery_tag)
+        if retry_delivery is not None and self._move_to_retry_queue(delivery_tag, *retry_delivery):
+            return
+        self._requeue_delivery(delivery_tag)
+
+    def _requeue_delivery(self, delivery_tag):
+        consumer_channel, channel_delivery_tag = self._resolve_delivery_tag(delivery_tag)
+        if consumer_channel is not None and consumer_channel.is_open:
+            consumer_channel.channel.basic_nack(channel_delivery_tag)
+            self._metrics.nacked += 1
+            # nacked delivery could be the one which blocks acknowledgement of the following deliveries
+            consumer_channel.acknowledgements.discard(channel_delivery_tag)
+            if consumer_channel.acknowledgements.held_count:
+                self._schedule_acknowledgements_flush(consumer_channel)
+
+    def _track_retry_delivery(self, method, properties, body):
+        if self._retry_topology is None:
+            return
+        # messages published directly to consumed queue (or dead-lettered back from retry tier) are routed by
+        # queue name
+        queue_name = method.routing_key
+        if queue_name not in self.consume_queue_names:
+            queue_name = self.queue_name
+        self._retry_deliveries[method.delivery_tag] = (queue_name, properties, body)
+
+    def _move_to_retry_queue(self, delivery_tag, queue_name, properties, body) -> bool:
+        """Publishes copy of nacked delivery to its retry tier or parking queue. Delivery is acknowledged
+        once the copy is confirmed. Returns False if the copy could not be published"""
+        consumer_channel, _channel_delivery_tag = self._resolve_delivery_tag(delivery_tag)
+        if consumer_channel is None or not consumer_channel.is_open:
+            return False
+        if self._channel is None or not self._channel.is_open:
+            return False
+        if not self._is_delivery_confirmations_enabled:
+            # unconfirmed copy could be lost, delivery is requeued instead
+            return False
+        target_queue_name, attempt = self._retry_topology.route(queue_name, properties)
+        if target_queue_name not in self._declared_queues:
+            return False
+        properties.headers = dict(properties.headers or {}, **{RETRY_ATTEMPTS_HEADER: attempt})
+        self._basic_publish(body, target_queue_name, properties)
+        if target_queue_name == self._retry_topology.parking_queue_name:
+            self._metrics.parked += 1
+            logger.warning(
+                "Message of queue {} failed {} times, moved to {}".format(
+                    queue_name, attempt, target_queue_name
+                )
+            )
+        else:
+            self._metrics.retried += 1
+        self._retry_publishes[self._message_number] = delivery_tag
+        return True
+
+    def _accept_delivery(self, channel, method):
+        """Registers delivery for acknowledgement and replaces its tag with channel-aware one"""
+        consumer_channel = self._channels_by_number.get(channel.channel_number)
+        if consumer_channel is None:
+            return
+        self._metrics.deliveries += 1
+        if self._get_option("batch_acknowledgements"):
+            consumer_channel.acknowledgements.register_delivery(method.delivery_tag)
+        method.delivery_tag = compose_delivery_tag(
+            consumer_channel.index, method.delivery_tag, consumer_channel.generation
+        )
 
-    @log_current_thread
-    def run(self):
-        while (
-            self._current_connect_attempts_count < self._MAX_CONNECT_ATTEMPTS
-            and not self._stopping
+    def _resolve_delivery_tag(self, delivery_tag):
+        channel_index, generation, channel_delivery_tag = split_delivery_tag(delivery_tag)
+        if channel_index >= len(self._channels):
+            logger.warning("Delivery tag {} refers to unknown channel".format(delivery_tag))
+            return None, channel_delivery_tag
+        consumer_channel = self._channels[channel_index]
+        if generation != consumer_channel.generation:
+            # delivery was received by closed channel, broker has already requeued it
+            self._metrics.stale_acknowledgements += 1
+            logger.info(
+                "Skip acknowledgement of stale delivery tag {}. Channel #{} was reopened".format(
+                    delivery_tag, channel_index
+                )
+            )
+            return None, channel_delivery_tag
+        return consumer_channel, channel_delivery_tag
+
+    def _schedule_acknowledgements_flush(self, consumer_channel: ConsumerChannel):
+        # flush on the next ioloop iteration, so all acks of the current batch of commands are joined
+        if not consumer_channel.is_ack_flush_scheduled:
+            consumer_channel.is_ack_flush_scheduled = True
+            self.connection.ioloop.call_later(
+                0, functools.partial(self._flush_acknowledgements, consumer_channel)
+            )
+        if consumer_channel.ack_flush_timer is None:
+            consumer_channel.ack_flush_timer = self.connection.ioloop.call_later(
+                self._get_option("ack_flush_interval"),
+                functools.partial(self._flush_expired_acknowledgements, consumer_channel),
+            )
+
+    def _flush_acknowledgements(self, consumer_channel: ConsumerChannel):
+        consumer_channel.is_ack_flush_scheduled = False
+        if not consumer_channel.is_open:
+            return
+        upto = consumer_channel.acknowledgements.pop_contiguous()
+        if upto is not None:
+            logger.debug(
+                "Acknowledging deliveries up to tag {} on channel #{}".format(
+                    upto, consumer_channel.index
+                )
+            )
+            consumer_channel.channel.basic_ack(upto, multiple=True)
+            self._metrics.ack_frames += 1
+
+    def _flush_expired_acknowledgements(self, consumer_channel: ConsumerChannel, max_age=None):
+        consumer_channel.ack_flush_timer = None
+        if not consumer_channel.is_open:
+            return
+        self._flush_acknowledgements(consumer_channel)
+        if max_age is None:
+            max_age = self._get_option("ack_flush_interval")
+        for delivery_tag in consumer_channel.acknowledgements.pop_expired(max_age):
+            consumer_channel.channel.basic_ack(delivery_tag)
+            self._metrics.ack_frames += 1
+        if consumer_channel.acknowledgements.held_count:
+            consumer_channel.ack_flush_timer = self.connection.ioloop.call_later(
+                self._get_option("ack_flush_interval"),
+                functools.partial(self._flush_expired_acknowledgements, consumer_channel),
+            )
+
+    def add_callback_threadsafe(self, callback):
+        """Schedules callback execution in the ioloop thread. Can be called from any thread.
+
+        Callbacks are buffered and executed in batches, so a burst of publishes/acks
+        costs a single ioloop wakeup instead of one wakeup per callback
+        """
+        if self._outbound_commands.put(callback):
+            self._call_in_ioloop_threadsafe(self._schedule_outbound_commands_drain)
+
+    def _call_in_ioloop_threadsafe(self, callback):
+        """Wakes up ioloop of the current connection to run callback, can be called from any thread"""
+        self.connection.ioloop.add_callback_threadsafe(callback)
+
+    def _remove_timeout(self, timer):
+        """Cancels timer created with ioloop.call_later"""
+        self.connection.ioloop.remove_timeout(timer)
+
+    def _schedule_outbound_commands_drain(self):
+        linger = self._get_option("outbound_linger")
+        if linger:
+            self.connection.ioloop.call_later(linger, self._drain_outbound_commands)
+        else:
+            self._drain_outbound_commands()
+
+    def _drain_outbound_commands(self):
+        batch, has_more = self._outbound_commands.pop_batch()
+        for command in batch:
+            try:
+                command()
+            except Exception as e:
+                logger.exception(f"Outbound command {command} failed: {repr(e)}")
+        if has_more:
+            # let ioloop process io events before the next batch
+            self.connection.ioloop.call_later(0, self._drain_outbound_commands)
+
+    def get_outbound_stats(self) -> dict:
+        return self._outbound_commands.get_stats()
+
+    def get_stats(self) -> dict:
+        """Snapshot of connection metrics. Must be called in the ioloop thread"""
+        stats = self._metrics.get_stats()
+        for group, group_stats in (
+            ("confirms", self._confirmations.get_stats()),
+            ("confirm_latency", self._confirmations.get_latency_histogram()),
+            ("outbound", self._outbound_commands.get_stats()),
         ):
-            self.connection = None
-            self._deliveries = []
-            self._acked = 0
-            self._nacked = 0
-            self._message_number = 0
+            for key, value in group_stats.items():
+                stats[f"{group}/{key}"] = value
+        return stats
 
-            self.connection = self.connect()
+    def _schedule_stats_dump(self):
+        interval = self._get_option("stats_interval")
+        if interval and self._stats_timer is None:
+            self._stats_timer = self.connection.ioloop.call_later(interval, self._on_stats_timer)
 
-            if self.shutdown_event_handler is not None:
-                try:
-                    reactor.removeSystemEventTrigger(self.shutdown_event_handler)
-                except (KeyError, ValueError, TypeError):
-                    pass
-                self.shutdown_event_handler = None
-            if reactor.running:
-                cb = functools.partial(
-                    self.connection.ioloop.add_callback_threadsafe, self.stop_from_reactor_event
-                )
-                self.shutdown_event_handler = reactor.addSystemEventTrigger(
-                    "before", "shutdown", cb
-                )
+    def _cancel_stats_dump(self):
+        if self._stats_timer is not None:
+            self._remove_timeout(self._stats_timer)
+            self._stats_timer = None
+
+    def _on_stats_timer(self):
+        self._stats_timer = None
+        self._dump_stats()
+        self._schedule_stats_dump()
 
+    def _dump_stats(self):
+        if self._get_option("stats_interval"):
+            self.__owner_update_stats(self.get_stats())
+
+    @log_current_thread
+    def run(self):
+        while self._can_reconnect() and not self._stopping:
+            self._start_connection()
             self.connection.ioloop.start()
         logger.info("Stopped")
 
+    def _start_connection(self):
+        """Creates new pika connection and subscribes to reactor shutdown"""
+        self._detach_channels()
+        self.connection = None
+        self._reset_confirmations()
+        self._message_number = 0
+
+        self.connection = self.connect()
+        if self._outbound_commands.reset_drain_schedule():
+            self._call_in_ioloop_threadsafe(self._schedule_outbound_commands_drain)
+
+        if self.shutdown_event_handler is not None:
+            try:
+                reactor.removeSystemEventTrigger(self.shutdown_event_handler)
+            except (KeyError, ValueError, TypeError):
+                pass
+            self.shutdown_event_handler = None
+        if reactor.running:
+            self.shutdown_event_handler = reactor.addSystemEventTrigger(
+                "before", "shutdown", self._on_reactor_shutdown
+            )
+
+    def _on_reactor_shutdown(self):
+        # scheduled via outbound buffer, so publishes buffered before shutdown are sent first
+        self.add_callback_threadsafe(self.stop_from_reactor_event)
+
+    def _stop_ioloop(self):
+        """Stops ioloop of current connection, run loop creates a new connection unless stopping"""
+        self.connection.ioloop.stop()
+
     def stop_from_reactor_event(self):
         logger.debug("stop called from reactor event")
-        if self.options.get(
-            "enable_delivery_confirmations",
-            self._DEFAULT_OPTIONS["enable_delivery_confirmations"],
-        ) and len(self._deliveries):
+        if self._requires_delivery_confirmations and self._confirmations.in_flight:
+            logger.info(
+                "Waiting for {} outstanding delivery confirmations, oldest is {:.2f} seconds old".format(
+                    self._confirmations.in_flight, self._confirmations.oldest_unconfirmed_age
+                )
+            )
             self._current_graceful_stop_attempts_count += 1
             if self._current_graceful_stop_attempts_count < self._MAX_GRACEFUL_STOP_ATTEMPTS:
                 self.connection.ioloop.call_later(
@@ -453,6 +1213,18 @@ class PikaSelectConnection:
         self.close_channel()
 
     def close_channel(self):
+        for consumer_channel in self._channels:
+            # release held acknowledgements, otherwise completed deliveries will be redelivered
+            if consumer_channel.ack_flush_timer is not None:
+                self._remove_timeout(consumer_channel.ack_flush_timer)
+            self._flush_expired_acknowledgements(consumer_channel, max_age=0)
+        for consumer_channel in self._channels[1:]:
+            if consumer_channel.is_open:
+                logger.info("Closing consumer channel #{}".format(consumer_channel.index))
+                try:
+                    consumer_channel.channel.close()
+                except ChannelWrongStateError as cwse:
+                    logger.error(repr(cwse))
         if self._channel:
             logger.info("Closing the channel")
             try:
@@ -471,4 +1243,4 @@ class PikaSelectConnection:
                 self.connection.close()
             except ConnectionWrongStateError as cwse:
                 logger.error(repr(cwse))
-                self.connection.ioloop.stop()
+                self._stop_ioloop()
@@ -0,0 +1,74 @@
+from collections import deque
+from typing import Deque
+
+from twisted.internet import defer
+
+
+class PublishWindow:
+    """Bounds number of publishes which are scheduled by owner but not confirmed by broker yet.
+
+    Lives in the owner (reactor) thread. Slot is acquired when publish is scheduled and released
+    when broker confirms it (or when it is sent, if delivery confirmations are disabled).
+    Publishing is also paused while broker blocks the connection or the connection is being recovered.
+    Waiters are expected to publish right in their callback, so capacity is rechecked after each of them.
+    """
+
+    def __init__(self, size: int = 0):
+        # max publishes in flight, 0 - unlimited
+        self.size = size
+        self.in_flight = 0
+        self.is_blocked = False
+
+        self._waiters: Deque[defer.Deferred] = deque()
+
+        self.max_in_flight = 0
+        self.waits_count = 0
+        self.blocked_count = 0
+
+    @property
+    def has_capacity(self) -> bool:
+        return not self.is_blocked and (not self.size or self.in_flight < self.size)
+
+    def wait(self) -> defer.Deferred:
+        """Returns Deferred which fires when publishing is allowed"""
+        if self.has_capacity and not self._waiters:
+            return defer.succeed(None)
+        self.waits_count += 1
+        d = defer.Deferred()
+        self._waiters.append(d)
+        return d
+
+    def acquire(self):
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.max_in_flight = self.in_flight
+
+    def release(self, count: int = 1):
+        self.in_flight = max(self.in_flight - count, 0)
+        self._notify_waiters()
+
+    def set_blocked(self, is_blocked: bool):
+        if is_blocked and not self.is_blocked:
+            self.blocked_count += 1
+        self.is_blocked = is_blocked
+        self._notify_waiters()
+
+    def reset(self):
+        """Releases all slots and unblocks publishing, e.g. when connection is stopped"""
+        self.in_flight = 0
+        self.set_blocked(False)
+
+    def _notify_waiters(self):
+        while self._waiters and self.has_capacity:
+            self._waiters.popleft().callback(None)
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self.size,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiters": len(self._waiters),
+            "waits": self.waits_count,
+            "is_blocked": self.is_blocked,
+            "blocked": self.blocked_count,
+        }
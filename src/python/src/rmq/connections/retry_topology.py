@@ -0,0 +1,82 @@
+from typing import List, Optional, Tuple
+
+import pika
+
+# own counter of retries, x-death headers set by publisher are not trusted by every broker version
+RETRY_ATTEMPTS_HEADER = "rmq-retry-attempts"
+
+
+class RetryTopology:
+    """Names, arguments and routing of delayed retry queues of consumed queues.
+
+    Every consumed queue <name> gets retry tiers <name>.retry.0 ... <name>.retry.N-1. Tier queue has no
+    consumers, its messages expire after base_delay * delay_factor ** tier seconds and are dead-lettered
+    back to <name>, so nacked message is redelivered after the delay instead of looping hot.
+    Number of attempts is taken from x-death records of the tier queues. Message which failed
+    max_attempts times is moved to <queue_name>.parking queue for manual inspection.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        max_attempts: int,
+        base_delay: float = 5,
+        delay_factor: float = 2,
+        tiers_count: int = 5,
+    ):
+        self.queue_name = queue_name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.delay_factor = delay_factor
+        self.tiers_count = max(tiers_count, 1)
+
+    @property
+    def parking_queue_name(self) -> str:
+        return f"{self.queue_name}.parking"
+
+    def get_retry_queue_name(self, queue_name: str, tier: int) -> str:
+        return f"{queue_name}.retry.{tier}"
+
+    def get_tier_delay(self, tier: int) -> int:
+        """Message TTL of tier queue in milliseconds"""
+        return int(self.base_delay * self.delay_factor ** tier * 1000)
+
+    def get_queue_declarations(self, queue_names: List[str]) -> List[Tuple[str, Optional[dict]]]:
+        """Queues to declare with their arguments: retry tiers of each consumed queue and parking queue"""
+        declarations = []
+        for queue_name in queue_names:
+            for tier in range(self.tiers_count):
+                declarations.append(
+                    (
+                        self.get_retry_queue_name(queue_name, tier),
+                        {
+                            "x-message-ttl": self.get_tier_delay(tier),
+                            "x-dead-letter-exchange": "",
+                            "x-dead-letter-routing-key": queue_name,
+                        },
+                    )
+                )
+        declarations.append((self.parking_queue_name, None))
+        return declarations
+
+    def get_attempts(self, queue_name: str, properties: pika.BasicProperties) -> int:
+        """Number of delayed retries the message has already passed"""
+        headers = properties.headers or {}
+        retry_queue_prefix = f"{queue_name}.retry."
+        expired_count = 0
+        for death in headers.get("x-death") or []:
+            death_queue = death.get("queue")
+            if isinstance(death_queue, bytes):
+                death_queue = death_queue.decode("utf-8")
+            is_retry_queue = str(death_queue).startswith(retry_queue_prefix)
+            if is_retry_queue and death.get("reason") == "expired":
+                expired_count += death.get("count", 1)
+        return max(expired_count, headers.get(RETRY_ATTEMPTS_HEADER, 0))
+
+    def route(self, queue_name: str, properties: pika.BasicProperties) -> Tuple[str, int]:
+        """Queue the failed message of queue_name has to be moved to and its attempt number"""
+        attempt = self.get_attempts(queue_name, properties) + 1
+        if attempt >= self.max_attempts:
+            return self.parking_queue_name, attempt
+        tier = min(attempt - 1, self.tiers_count - 1)
+        return self.get_retry_queue_name(queue_name, tier), attempt
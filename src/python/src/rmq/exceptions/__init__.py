@@ -1 +1,2 @@
 from .consumed_data_corrupted import ConsumedDataCorrupted
+from .unsupported_message_codec import UnsupportedMessageCodec
@@ -0,0 +1,2 @@
+class UnsupportedMessageCodec(Exception):
+    pass
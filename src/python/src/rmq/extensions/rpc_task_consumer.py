@@ -1,5 +1,4 @@
 import functools
-import json
 import logging
 from copy import deepcopy
 from enum import IntEnum
@@ -11,20 +10,25 @@ from scrapy.core.downloader.handlers.http11 import TunnelError
 from scrapy.exceptions import CloseSpider, DontCloseSpider
 from scrapy.http import Response
 from scrapy.spidermiddlewares.httperror import HttpError
-from twisted.internet import reactor, task
+from twisted.internet import task
 from twisted.internet.error import DNSLookupError, TCPTimedOutError, TimeoutError
 from twisted.python.failure import Failure
 
 # import rmq module specific
-from rmq.connections import PikaSelectConnection
+from rmq.connections import PikaSelectConnection, get_connection_class, start_connection
 from rmq.signals import callback_completed, errback_completed, item_scheduled
 from rmq.utils import (
+    MessageCodec,
     RMQConstants,
     RMQDefaultOptions,
     Task,
     TaskObserver,
     TaskStatusCodes,
+    decode_message_body,
     extract_delivery_tag_from_failure,
+    get_connection_options,
+    get_task_queue_options,
+    set_connection_stats,
 )
 from rmq.utils.decorators import call_once, rmq_callback, rmq_errback
 
@@ -71,6 +75,8 @@ class RPCTaskConsumer(object):
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
 
         self.rmq_connection = None
+        self.connection_class = get_connection_class(crawler.settings)
+        self.message_codec = MessageCodec.from_settings(crawler.settings)
         self._can_interact = False
         self._can_get_next_message = False
         self._relieve_task = None
@@ -110,7 +116,7 @@ class RPCTaskConsumer(object):
             ),
             heartbeat=RMQDefaultOptions.CONNECTION_HEARTBEAT.value,
         )
-        reactor.callInThread(self.connect, parameters, task_queue_name)
+        start_connection(self.connection_class, self.connect, parameters, task_queue_name)
 
         """Declare fallback LoopingCall to ack/nack probably unacked messages (or before scheduled shutdown)"""
         self._relieve_task = task.LoopingCall(self._relieve)
@@ -119,8 +125,8 @@ class RPCTaskConsumer(object):
     def spider_closed(self, spider):
         self._relieve()
         if self.rmq_connection is not None and isinstance(self.rmq_connection, PikaSelectConnection):
-            if isinstance(self.rmq_connection.connection, pika.SelectConnection):
-                self.rmq_connection.connection.ioloop.add_callback_threadsafe(self.rmq_connection.stop)
+            if self.rmq_connection.connection is not None:
+                self.rmq_connection.add_callback_threadsafe(self.rmq_connection.stop)
 
     def spider_idle(self, spider):
         raise DontCloseSpider
@@ -278,13 +284,15 @@ class RPCTaskConsumer(object):
 
         payload = {**deepcopy(task.payload), **task.get_reply_payload()}
 
-        if isinstance(self.rmq_connection.connection, pika.SelectConnection):
+        if self.rmq_connection.connection is not None:
+            body, codec_properties = self.message_codec.encode(payload)
             cb = functools.partial(
                 self.rmq_connection.publish_message,
-                message=json.dumps(payload),
+                message=body,
                 queue_name=task.reply_to,
+                properties=pika.BasicProperties(delivery_mode=2, **codec_properties),
             )
-            self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
+            self.rmq_connection.add_callback_threadsafe(cb)
 
     def _ack_task(self, task: Task, spider, delivery_tag):
         """Acknowledge task or add to pending buffer if connection is not ready."""
@@ -338,6 +346,9 @@ class RPCTaskConsumer(object):
         self._can_interact = can_interact
         self._can_get_next_message = can_interact
 
+    def on_connection_stats(self, stats):
+        set_connection_stats(self.crawler.stats, stats, prefix="rabbitmq/consumer")
+
     def raise_close_spider(self):
         if self.crawler.engine.slot is None or self.crawler.engine.slot.closing:
             logger.critical("SPIDER ALREADY CLOSED")
@@ -345,14 +356,16 @@ class RPCTaskConsumer(object):
         self.crawler.engine.close_spider(self.__spider)
 
     def connect(self, parameters, queue_name):
-        c = PikaSelectConnection(
+        c = self.connection_class(
             parameters,
             queue_name,
             owner=self,
-            options={
-                "enable_delivery_confirmations": False,
-                "prefetch_count": self.__spider.settings.get("CONCURRENT_REQUESTS", 1),
-            },
+            options=get_connection_options(
+                self.__spider.settings,
+                enable_delivery_confirmations=False,
+                prefetch_count=self.__spider.settings.get("CONCURRENT_REQUESTS", 1),
+                **get_task_queue_options(self.__spider.settings, queue_name),
+            ),
             is_consumer=True,
         )
         logger.info("Pika threaded event start")
@@ -375,16 +388,16 @@ class RPCTaskConsumer(object):
     def on_basic_get_message(self, message):
         delivery_tag = message.get("method").delivery_tag
         ack_cb = nack_cb = None
-        if isinstance(self.rmq_connection.connection, pika.SelectConnection):
+        if self.rmq_connection.connection is not None:
             ack_cb = call_once(
                 functools.partial(
-                    self.rmq_connection.connection.ioloop.add_callback_threadsafe,
+                    self.rmq_connection.add_callback_threadsafe,
                     functools.partial(self.rmq_connection.acknowledge_message, delivery_tag=delivery_tag),
                 )
             )
             nack_cb = call_once(
                 functools.partial(
-                    self.rmq_connection.connection.ioloop.add_callback_threadsafe,
+                    self.rmq_connection.add_callback_threadsafe,
                     functools.partial(self.rmq_connection.negative_acknowledge_message, delivery_tag=delivery_tag),
                 )
             )
@@ -404,12 +417,18 @@ class RPCTaskConsumer(object):
                     prepared_request_meta[self.delivery_tag_meta_key] = delivery_tag
                     should_replace_meta = True
                 if self.msg_body_meta_key not in prepared_request_meta.keys():
-                    prepared_request_meta[self.msg_body_meta_key] = json.loads(message.get("body"))
+                    prepared_request_meta[self.msg_body_meta_key] = decode_message_body(
+                        message.get("body"), message.get("properties")
+                    )
                     should_replace_meta = True
                 if should_replace_meta:
                     prepared_request = prepared_request.replace(meta=prepared_request_meta)
                 if prepared_request.dont_filter is False:
                     prepared_request = prepared_request.replace(dont_filter=True)
+                # message priority is applied unless spider has set request priority itself
+                message_priority = getattr(message.get("properties"), "priority", None)
+                if message_priority and prepared_request.priority == 0:
+                    prepared_request = prepared_request.replace(priority=message_priority)
             self.crawler.engine.crawl(prepared_request)
 
     def on_message_consumed(self, message):
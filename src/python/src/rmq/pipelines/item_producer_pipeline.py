@@ -1,16 +1,19 @@
-import functools
-import json
 import logging
 
 import pika
 from scrapy import signals
 from scrapy.crawler import Crawler
 from scrapy.exceptions import CloseSpider, DontCloseSpider
-from twisted.internet import reactor
 
-from rmq.connections import PikaSelectConnection
+from rmq.connections import get_connection_class, start_connection
 from rmq.items import RMQItem
-from rmq.utils import RMQConstants, RMQDefaultOptions
+from rmq.utils import (
+    MessageCodec,
+    RMQConstants,
+    RMQDefaultOptions,
+    get_connection_options,
+    set_connection_stats,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,8 @@ class ItemProducerPipeline:
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
 
         self.rmq_connection = None
+        self.connection_class = get_connection_class(crawler.settings)
+        self.message_codec = MessageCodec.from_settings(crawler.settings)
         self._can_interact = False
 
         self.pending_items_buffer = []
@@ -69,7 +74,7 @@ class ItemProducerPipeline:
             ),
             heartbeat=RMQDefaultOptions.CONNECTION_HEARTBEAT.value,
         )
-        reactor.callInThread(self.connect, parameters, result_queue_name)
+        start_connection(self.connection_class, self.connect, parameters, result_queue_name)
 
     def spider_idle(self, spider):
         if len(self.pending_items_buffer):
@@ -79,10 +84,8 @@ class ItemProducerPipeline:
         if self.rmq_connection is not None:
             while len(self.pending_items_buffer) and self._can_interact:
                 self.send_message(self.pending_items_buffer.pop(0))
-            if isinstance(self.rmq_connection.connection, pika.SelectConnection):
-                self.rmq_connection.connection.ioloop.add_callback_threadsafe(
-                    self.rmq_connection.stop
-                )
+            if self.rmq_connection.connection is not None:
+                self.rmq_connection.add_callback_threadsafe(self.rmq_connection.stop)
 
     def _validate_spider_has_attributes(self):
         spider_attributes = [
@@ -104,6 +107,9 @@ class ItemProducerPipeline:
     def set_can_interact(self, can_interact):
         self._can_interact = can_interact
 
+    def on_connection_stats(self, stats):
+        set_connection_stats(self.crawler.stats, stats, prefix="rabbitmq/pipeline")
+
     def raise_close_spider(self):
         if self.crawler.engine.slot is None or self.crawler.engine.slot.closing:
             logger.critical("SPIDER ALREADY CLOSED")
@@ -112,32 +118,40 @@ class ItemProducerPipeline:
 
     def connect(self, parameters, queue_name):
         """Creates and runs pika select connection"""
-        c = PikaSelectConnection(
+        # publish window slots are released by confirmations, so they are enabled with window only
+        is_publish_window_enabled = self.spider.settings.getint("RABBITMQ_PUBLISH_WINDOW", 0) > 0
+        c = self.connection_class(
             parameters,
             queue_name,
             owner=self,
-            options={
-                "enable_delivery_confirmations": False,
-                "prefetch_count": self.spider.settings.get("CONCURRENT_REQUESTS", 1),
-            },
+            options=get_connection_options(
+                self.spider.settings,
+                enable_delivery_confirmations=is_publish_window_enabled,
+                prefetch_count=self.spider.settings.get("CONCURRENT_REQUESTS", 1),
+            ),
             is_consumer=False,
         )
         c.run()
 
     def send_message(self, item):
         """Sends message to rabbitmq"""
-        if isinstance(self.rmq_connection.connection, pika.SelectConnection):
+        if self.rmq_connection.connection is not None:
             item_as_dictionary = dict(item)
             if self.delivery_tag_meta_key in item_as_dictionary:
                 del item_as_dictionary[self.delivery_tag_meta_key]
-            cb = functools.partial(
-                self.rmq_connection.publish_message, message=json.dumps(item_as_dictionary)
+            body, codec_properties = self.message_codec.encode(item_as_dictionary)
+            self.rmq_connection.publish_message_threadsafe(
+                message=body, properties=pika.BasicProperties(delivery_mode=2, **codec_properties)
             )
-            self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
 
     def process_item(self, item, spider=None):
         """Invoked when item is processed"""
         if isinstance(item, RMQItem):
+            if self.rmq_connection is not None and not self.rmq_connection.has_publish_capacity:
+                # publish window is full, connection is blocked by broker or is being recovered
+                d = self.rmq_connection.wait_for_publish_capacity()
+                d.addCallback(lambda _: self.process_item(item, spider))
+                return d
             if self._can_interact:
                 while len(self.pending_items_buffer):
                     self.send_message(self.pending_items_buffer.pop(0))
@@ -1,7 +1,20 @@
+from .connection_options import get_connection_options, get_task_queue_options
+from .connection_stats import set_connection_stats
 from .constants import RMQConstants
 from .extract_delivery_tag_from_failure import extract_delivery_tag_from_failure
 from .import_full_name import get_import_full_name
+from .message_codecs import MessageCodec, decode_message_body
+from .pacing_controller import PacingController
+from .prefetch_controller import PrefetchController
+from .queue_shards import (
+    get_consumer_shard_queue_names,
+    get_shard_queue_name,
+    get_shard_queue_names,
+)
 from .rmq_default_options import RMQDefaultOptions
+from .staging_table_loader import StagingTableLoader
 from .task import Task
 from .task_observer import TaskObserver
 from .task_status_codes import TaskStatusCodes
+from .task_stream import TaskStream
+from .worker_supervisor import WorkerSupervisor, split_budget
@@ -0,0 +1,57 @@
+from typing import Optional
+
+from scrapy.settings import Settings
+
+from .queue_shards import get_consumer_shard_queue_names, get_shard_queue_names
+
+
+def get_connection_options(settings: Settings, **options) -> dict:
+    """Builds PikaSelectConnection options from project settings. Explicitly passed options take precedence.
+
+    max_priority is not taken from settings, only owners of task queues pass it explicitly
+    """
+    connection_options = {
+        "consumer_channels_count": settings.getint("RABBITMQ_CONSUMER_CHANNELS", 1),
+        "dedicated_publish_channel": settings.getbool("RABBITMQ_DEDICATED_PUBLISH_CHANNEL", False),
+        "consumer_prefetch_counts": [
+            int(prefetch_count)
+            for prefetch_count in settings.getlist("RABBITMQ_CONSUMER_PREFETCH_COUNTS")
+        ],
+        "auto_reconnect": settings.getbool("RABBITMQ_AUTO_RECONNECT", True),
+        "reconnect_max_attempts": settings.getint("RABBITMQ_RECONNECT_MAX_ATTEMPTS", 10),
+        "reconnect_backoff_base": settings.getfloat("RABBITMQ_RECONNECT_BACKOFF_BASE", 1),
+        "reconnect_backoff_max": settings.getfloat("RABBITMQ_RECONNECT_BACKOFF_MAX", 30),
+        "publish_window": settings.getint("RABBITMQ_PUBLISH_WINDOW", 0),
+        "stats_interval": settings.getfloat("RABBITMQ_STATS_INTERVAL", 60),
+        "outbound_linger": settings.getfloat("RABBITMQ_OUTBOUND_LINGER", 0),
+        "outbound_max_batch_size": settings.getint("RABBITMQ_OUTBOUND_MAX_BATCH_SIZE", 500),
+        "batch_acknowledgements": settings.getbool("RABBITMQ_BATCH_ACKNOWLEDGEMENTS", True),
+        "ack_flush_interval": settings.getfloat("RABBITMQ_ACK_FLUSH_INTERVAL", 1),
+        "retry_max_attempts": settings.getint("RABBITMQ_RETRY_MAX_ATTEMPTS", 0),
+        "retry_base_delay": settings.getfloat("RABBITMQ_RETRY_BASE_DELAY", 5),
+        "retry_delay_factor": settings.getfloat("RABBITMQ_RETRY_DELAY_FACTOR", 2),
+        "retry_tiers": settings.getint("RABBITMQ_RETRY_TIERS", 5),
+    }
+    connection_options.update(options)
+    return connection_options
+
+
+def get_task_queue_options(
+    settings: Settings, queue_name: str, shards_count: Optional[int] = None
+) -> dict:
+    """Declaration options of task queue shared by its producer and consumers. Broker refuses to redeclare
+    queue (or its shard) with different arguments, so every owner of task queue takes them from here.
+
+    Producer passes shards_count and declares all shards, consumer declares the ones it consumes
+    (RABBITMQ_CONSUMER_SHARDS)
+    """
+    if shards_count is None:
+        shard_queues = get_consumer_shard_queue_names(settings, queue_name)
+    elif shards_count > 1:
+        shard_queues = get_shard_queue_names(queue_name, shards_count)
+    else:
+        shard_queues = None
+    return {
+        "max_priority": settings.getint("RABBITMQ_MAX_PRIORITY", 0),
+        "shard_queues": shard_queues,
+    }
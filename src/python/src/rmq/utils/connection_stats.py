@@ -0,0 +1,7 @@
+from scrapy.statscollectors import StatsCollector
+
+
+def set_connection_stats(stats_collector: StatsCollector, stats: dict, prefix: str = "rabbitmq"):
+    """Copies connection stats snapshot pushed by PikaSelectConnection into crawler stats"""
+    for key, value in stats.items():
+        stats_collector.set_value(f"{prefix}/{key}", value)
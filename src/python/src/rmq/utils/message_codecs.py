@@ -0,0 +1,165 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import uuid
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from scrapy.settings import Settings
+
+from rmq.exceptions import UnsupportedMessageCodec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+ZLIB_CONTENT_ENCODING = "zlib"
+
+
+def _serialize_default(value):
+    """Values which serializers do not support natively, shared by all serializers, so encoded values do not
+    depend on installed libraries. Datetimes are sent as integer timestamps"""
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _json_dumps(data) -> bytes:
+    # compact non-ascii output, the same as orjson produces
+    return json.dumps(
+        data, default=_serialize_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _orjson_dumps(data) -> bytes:
+    # orjson serializes dates and dataclasses natively, they are passed to the shared default hook instead
+    return orjson.dumps(
+        data,
+        default=_serialize_default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+def _msgpack_dumps(data) -> bytes:
+    return msgpack.packb(data, default=_serialize_default, use_bin_type=True)
+
+
+def _msgpack_loads(body):
+    return msgpack.unpackb(body, raw=False)
+
+
+class MessageCodecRegistry:
+    """Serializers by message content_type and compressors by message content_encoding"""
+
+    def __init__(self):
+        self._serializers: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {}
+        self._compressors: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+
+    def register_serializer(self, content_type: str, dumps, loads):
+        self._serializers[content_type] = (dumps, loads)
+
+    def register_compressor(self, content_encoding: str, compress, decompress):
+        self._compressors[content_encoding] = (compress, decompress)
+
+    def get_serializer(self, content_type: str):
+        if content_type not in self._serializers:
+            raise UnsupportedMessageCodec(f"No serializer registered for content type {content_type}")
+        return self._serializers[content_type]
+
+    def get_compressor(self, content_encoding: str):
+        if content_encoding not in self._compressors:
+            raise UnsupportedMessageCodec(
+                f"No compressor registered for content encoding {content_encoding}"
+            )
+        return self._compressors[content_encoding]
+
+    def decode(self, body, content_type: str = None, content_encoding: str = None):
+        # unknown encodings (e.g. charset names) are left as is, messages without content type are json
+        if content_encoding in self._compressors:
+            body = self._compressors[content_encoding][1](body)
+        if content_type:
+            # parameters like "; charset=utf-8" do not change serializer
+            content_type = content_type.split(";", 1)[0].strip().lower()
+        _dumps, loads = self.get_serializer(content_type or JSON_CONTENT_TYPE)
+        return loads(body)
+
+
+message_codecs = MessageCodecRegistry()
+if orjson is not None:
+    message_codecs.register_serializer(JSON_CONTENT_TYPE, _orjson_dumps, orjson.loads)
+else:
+    message_codecs.register_serializer(JSON_CONTENT_TYPE, _json_dumps, json.loads)
+if msgpack is not None:
+    message_codecs.register_serializer(MSGPACK_CONTENT_TYPE, _msgpack_dumps, _msgpack_loads)
+message_codecs.register_compressor(ZLIB_CONTENT_ENCODING, zlib.compress, zlib.decompress)
+
+
+class MessageCodec:
+    """Encodes published message bodies with configured content type and optional compression.
+
+    Content type and encoding are stamped into message properties, so consumers decode messages
+    with decode_message_body regardless of their own configuration
+    """
+
+    def __init__(
+        self,
+        content_type: str = JSON_CONTENT_TYPE,
+        content_encoding: Optional[str] = None,
+        compress_min_size: int = 0,
+        registry: MessageCodecRegistry = message_codecs,
+    ):
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        # bodies smaller than this number of bytes are not compressed
+        self.compress_min_size = compress_min_size
+
+        self._dumps, _loads = registry.get_serializer(content_type)
+        self._compress = (
+            registry.get_compressor(content_encoding)[0] if content_encoding is not None else None
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(
+            content_type=settings.get("RABBITMQ_MESSAGE_CONTENT_TYPE") or JSON_CONTENT_TYPE,
+            content_encoding=settings.get("RABBITMQ_MESSAGE_CONTENT_ENCODING") or None,
+            compress_min_size=settings.getint("RABBITMQ_MESSAGE_COMPRESS_MIN_SIZE", 0),
+        )
+
+    def encode(self, data) -> Tuple[bytes, dict]:
+        """Returns encoded body and content_type/content_encoding message properties"""
+        body = self._dumps(data)
+        properties = {"content_type": self.content_type}
+        if self._compress is not None and len(body) >= self.compress_min_size:
+            body = self._compress(body)
+            properties["content_encoding"] = self.content_encoding
+        return body, properties
+
+
+def decode_message_body(body, properties=None, registry: MessageCodecRegistry = message_codecs):
+    """Decodes consumed message body according to content_type/content_encoding of its properties"""
+    return registry.decode(
+        body,
+        content_type=getattr(properties, "content_type", None),
+        content_encoding=getattr(properties, "content_encoding", None),
+    )
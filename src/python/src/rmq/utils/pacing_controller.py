@@ -0,0 +1,115 @@
+import logging
+import time
+from typing import Optional
+
+from scrapy.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class PacingController:
+    """Holds task queue depth around target by adjusting producer chunk size and poll interval.
+
+    Consumers drain rate is estimated from two successive ready messages counts and number of
+    messages published between them (exponentially smoothed). While queue is below target depth,
+    producer publishes the missing messages right away (bounded by chunk size limits); above target,
+    it waits for the time consumers need to drain the excess (bounded by poll interval limits).
+    """
+
+    def __init__(
+        self,
+        target_depth: int = 5000,
+        min_chunk_size: int = 1,
+        max_chunk_size: int = 100,
+        min_interval: float = 1,
+        max_interval: float = 300,
+        smoothing: float = 0.3,
+    ):
+        self.target_depth = target_depth
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max(max_chunk_size, min_chunk_size)
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        # weight of the latest drain rate measurement
+        self.smoothing = smoothing
+
+        self.drain_rate: Optional[float] = None
+        self.chunk_size = self.max_chunk_size
+        self.interval = 0
+        self.should_produce = True
+
+        self._last_count: Optional[int] = None
+        self._last_count_at: Optional[float] = None
+        self._published_since_count = 0
+
+        self.observations = 0
+        self.paused = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings, max_chunk_size: int):
+        return cls(
+            target_depth=settings.getint("PRODUCER_TARGET_QUEUE_DEPTH", 5000),
+            min_chunk_size=settings.getint("PRODUCER_MIN_CHUNK_SIZE", 1),
+            max_chunk_size=max_chunk_size,
+            min_interval=settings.getfloat("PRODUCER_MIN_POLL_INTERVAL", 1),
+            max_interval=settings.getfloat("PRODUCER_MAX_POLL_INTERVAL", 300),
+        )
+
+    def on_published(self, count: int = 1):
+        self._published_since_count += count
+
+    def observe(self, ready_count: int, now: Optional[float] = None):
+        """Takes the current ready messages count of task queue and decides whether to produce
+        next chunk (and its size) or to wait (and for how long)"""
+        if now is None:
+            now = time.monotonic()
+        self.observations += 1
+        self._update_drain_rate(ready_count, now)
+
+        excess = ready_count - self.target_depth
+        if excess < 0:
+            self.should_produce = True
+            self.chunk_size = min(max(-excess, self.min_chunk_size), self.max_chunk_size)
+            self.interval = 0
+        else:
+            self.should_produce = False
+            self.paused += 1
+            if self.drain_rate:
+                interval = (excess + self.chunk_size) / self.drain_rate
+            else:
+                # consumers do not drain the queue (or rate is not known yet), back off
+                interval = self.interval * 2
+            self.interval = min(max(interval, self.min_interval), self.max_interval)
+
+        logger.debug(
+            "Pacing: ready=%s target=%s drain_rate=%s produce=%s chunk_size=%s interval=%.2f",
+            ready_count,
+            self.target_depth,
+            self.drain_rate,
+            self.should_produce,
+            self.chunk_size,
+            self.interval,
+        )
+
+    def _update_drain_rate(self, ready_count: int, now: float):
+        if self._last_count is not None and now > self._last_count_at:
+            drained = self._last_count + self._published_since_count - ready_count
+            rate = max(drained, 0) / (now - self._last_count_at)
+            if self.drain_rate is None:
+                self.drain_rate = rate
+            else:
+                self.drain_rate = self.smoothing * rate + (1 - self.smoothing) * self.drain_rate
+        self._last_count = ready_count
+        self._last_count_at = now
+        self._published_since_count = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "target_depth": self.target_depth,
+            "ready_messages": self._last_count,
+            "drain_rate": round(self.drain_rate, 2) if self.drain_rate is not None else None,
+            "chunk_size": self.chunk_size,
+            "interval": round(self.interval, 2),
+            "observations": self.observations,
+            "paused": self.paused,
+        }
@@ -0,0 +1,114 @@
+import logging
+from typing import Optional
+
+from scrapy.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchController:
+    """Adjusts consumer prefetch count by observed DB latency and DB connection pool saturation.
+
+    Prefetch is increased additively while the pool has idle threads, latency is close to the baseline
+    and all prefetched messages are busy (prefetch is the bottleneck). It is decreased multiplicatively
+    when latency grows over the baseline (DB slows down) or when more interactions wait than the pool
+    could run, so messages do not pile up unacknowledged in memory.
+    Baseline is the lowest average latency observed, it slowly drifts up to follow DB changes.
+    """
+
+    def __init__(
+        self,
+        prefetch_count: int,
+        min_prefetch_count: int = 1,
+        max_prefetch_count: int = 256,
+        latency_tolerance: float = 2.0,
+        increase_step: int = 2,
+        decrease_factor: float = 0.75,
+        baseline_drift: float = 1.05,
+    ):
+        self.min_prefetch_count = min_prefetch_count
+        self.max_prefetch_count = max(max_prefetch_count, min_prefetch_count)
+        self.prefetch_count = min(max(prefetch_count, min_prefetch_count), self.max_prefetch_count)
+        # latency above baseline * latency_tolerance means DB is overloaded
+        self.latency_tolerance = latency_tolerance
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.baseline_drift = baseline_drift
+
+        self.baseline_latency: Optional[float] = None
+        self.last_latency: Optional[float] = None
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._max_unacked = 0
+
+        self.increases = 0
+        self.decreases = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings, prefetch_count: int):
+        return cls(
+            prefetch_count,
+            min_prefetch_count=settings.getint("CONSUMER_MIN_PREFETCH_COUNT", 1),
+            max_prefetch_count=settings.getint("CONSUMER_MAX_PREFETCH_COUNT", 256),
+            latency_tolerance=settings.getfloat("CONSUMER_PREFETCH_LATENCY_TOLERANCE", 2.0),
+        )
+
+    def on_processed(self, latency: float):
+        self._latency_total += latency
+        self._latency_count += 1
+
+    def on_unacked_count(self, unacked_count: int):
+        self._max_unacked = max(self._max_unacked, unacked_count)
+
+    def update(self, running_interactions: int, pool_size: int) -> Optional[int]:
+        """Called periodically, returns new prefetch count if it has to be changed"""
+        max_unacked, self._max_unacked = self._max_unacked, 0
+        if not self._latency_count:
+            return None
+        latency = self._latency_total / self._latency_count
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self.last_latency = latency
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            self.baseline_latency *= self.baseline_drift
+
+        prefetch_count = self.prefetch_count
+        if (
+            latency > self.baseline_latency * self.latency_tolerance
+            or running_interactions > pool_size
+        ):
+            prefetch_count = int(prefetch_count * self.decrease_factor)
+        elif running_interactions < pool_size and max_unacked >= prefetch_count:
+            prefetch_count += self.increase_step
+        prefetch_count = min(max(prefetch_count, self.min_prefetch_count), self.max_prefetch_count)
+        if prefetch_count == self.prefetch_count:
+            return None
+
+        if prefetch_count > self.prefetch_count:
+            self.increases += 1
+        else:
+            self.decreases += 1
+        logger.info(
+            "Prefetch count %s -> %s: latency %.4f s (baseline %.4f s), %s of %s pool threads busy",
+            self.prefetch_count,
+            prefetch_count,
+            latency,
+            self.baseline_latency,
+            running_interactions,
+            pool_size,
+        )
+        self.prefetch_count = prefetch_count
+        return prefetch_count
+
+    def get_stats(self) -> dict:
+        return {
+            "prefetch_count": self.prefetch_count,
+            "latency": round(self.last_latency, 6) if self.last_latency is not None else None,
+            "baseline_latency": (
+                round(self.baseline_latency, 6) if self.baseline_latency is not None else None
+            ),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
@@ -0,0 +1,45 @@
+import zlib
+from typing import List, Optional
+
+from scrapy.settings import Settings
+
+
+def get_shard_queue_names(
+    queue_name: str, shards_count: int, shards: List[int] = None
+) -> List[str]:
+    """Names of queue shards <queue_name>.0 ... <queue_name>.<shards_count - 1>, or only of given shards"""
+    if shards is None:
+        shards = range(shards_count)
+    return [f"{queue_name}.{shard}" for shard in shards if 0 <= shard < shards_count]
+
+
+def get_shard_queue_name(queue_name: str, shards_count: int, shard_key) -> str:
+    """Shard of queue the message with given key belongs to. crc32 is stable across processes
+    unlike builtin hash of strings"""
+    shard = zlib.crc32(str(shard_key).encode("utf-8")) % shards_count
+    return f"{queue_name}.{shard}"
+
+
+def parse_shard_set(value: str) -> Optional[List[int]]:
+    """Parses shard set like "0,2-4" into list of shard numbers, empty value means all shards"""
+    if not value:
+        return None
+    shards = []
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            shards.extend(range(int(first), int(last) + 1))
+        elif part:
+            shards.append(int(part))
+    return sorted(set(shards))
+
+
+def get_consumer_shard_queue_names(settings: Settings, queue_name: str) -> Optional[List[str]]:
+    """Queue shards consumed by this process according to RABBITMQ_TASK_QUEUE_SHARDS and
+    RABBITMQ_CONSUMER_SHARDS, None if task queue is not sharded"""
+    shards_count = settings.getint("RABBITMQ_TASK_QUEUE_SHARDS", 0)
+    if shards_count <= 1:
+        return None
+    shards = parse_shard_set(settings.get("RABBITMQ_CONSUMER_SHARDS", ""))
+    return get_shard_queue_names(queue_name, shards_count, shards)
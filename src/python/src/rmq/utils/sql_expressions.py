@@ -1,8 +1,100 @@
+import threading
+from collections import OrderedDict
+
 from sqlalchemy.dialects import mysql
 from sqlalchemy.engine import Dialect
 from sqlalchemy.sql import ClauseElement
 
 
+class CompiledExpressionCache:
+    """LRU cache of compiled SQLAlchemy expressions keyed by expression structure.
+
+    Statements which differ only by bound values (e.g. the same update of different task ids) share
+    SQLAlchemy cache key, so compiled SQL is reused and only the new bound parameters are extracted.
+    Expressions without cache key (e.g. custom constructs not marked as cacheable) are compiled each time.
+    Cache is shared by threads of DB connection pool, so its entries are accessed under lock.
+    """
+
+    def __init__(self, maxsize: int = 500):
+        # 0 - caching is disabled
+        self.maxsize = maxsize
+        self._compiled: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def compile(self, expression: ClauseElement, dialect: Dialect) -> tuple[str, tuple]:
+        cache_key = expression._generate_cache_key() if self.maxsize else None
+        if cache_key is None:
+            self.uncacheable += 1
+            return _compile_uncached(expression, dialect)
+
+        key = (dialect.name, dialect.driver, cache_key.key)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._compiled.move_to_end(key)
+        if compiled is None:
+            # compiled outside of lock, expression compiled by concurrent thread meanwhile is kept
+            compiled = expression.compile(dialect=dialect, cache_key=cache_key)
+            with self._lock:
+                compiled = self._compiled.setdefault(key, compiled)
+                self._compiled.move_to_end(key)
+                while len(self._compiled) > self.maxsize:
+                    self._compiled.popitem(last=False)
+        return _expand_compiled(
+            compiled, compiled.construct_params(extracted_parameters=cache_key.bindparams)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._compiled),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+        }
+
+
+class StatementTemplate:
+    """Statement declared once with named bindparam() placeholders and compiled once.
+
+    stmt = StatementTemplate(
+        update(DBModel).where(DBModel.id.in_(bindparam("ids", expanding=True))).values(status=bindparam("status"))
+    )
+    transaction.execute(*stmt.compile(ids=[1, 2, 3], status=TaskStatusCodes.IN_QUEUE.value))
+    """
+
+    def __init__(self, expression: ClauseElement, dialect: Dialect = mysql.dialect()):
+        self._compiled = expression.compile(dialect=dialect)
+
+    def compile(self, **params) -> tuple[str, tuple]:
+        return _expand_compiled(self._compiled, self._compiled.construct_params(params))
+
+
+def _compile_uncached(expression: ClauseElement, dialect: Dialect) -> tuple[str, tuple]:
+    compiled = expression.compile(dialect=dialect)
+    return _expand_compiled(compiled, compiled.construct_params())
+
+
+def _expand_compiled(compiled, params: dict) -> tuple[str, tuple]:
+    # renders "post compile" parameters (e.g. IN lists) for the actual values
+    expanded_state = compiled.construct_expanded_state(params)
+    return expanded_state.statement, tuple(expanded_state.positional_parameters or ())
+
+
+compiled_expression_cache = CompiledExpressionCache()
+
+
 def stringify_expression(expression: ClauseElement, dialect: Dialect = mysql.dialect()) -> str:
     """Complies, binds parameters and stringifies SQLAlchemy expression.
 
@@ -18,19 +110,24 @@ def stringify_expression(expression: ClauseElement, dialect: Dialect = mysql.dia
     return str(expression_compiled)
 
 
-def compile_expression(expression: ClauseElement, dialect: Dialect = mysql.dialect()) -> tuple[str, tuple]:
+def compile_expression(
+    expression: ClauseElement,
+    dialect: Dialect = mysql.dialect(),
+    cache: CompiledExpressionCache = compiled_expression_cache,
+) -> tuple[str, tuple]:
     """Complies SQLAlchemy expression without binds parameters.
 
+    Compiled expressions are cached by structure, see CompiledExpressionCache.
+
     Args:
         expression (ClauseElement): Source SQLAlchemy expression.
         dialect (Dialect): Specific sql dialect. Default mysql.
+        cache (CompiledExpressionCache): Cache of compiled expressions, None disables caching.
 
     Returns:
         tuple[str, tuple[...]]: Complied and stringified expression and tuple of parameters.
 
     """
-    expression_compiled = expression.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
-    params = tuple(expression_compiled.params.values())
-    if position_tup := getattr(expression_compiled, "positiontup", []):
-        params = tuple(expression_compiled.params[pos] for pos in position_tup)
-    return str(expression_compiled), params
+    if cache is None:
+        return _compile_uncached(expression, dialect)
+    return cache.compile(expression, dialect)
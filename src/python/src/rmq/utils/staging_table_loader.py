@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import tempfile
+from enum import Enum
+from itertools import chain
+from typing import Iterable, List, Optional
+
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects import mysql
+from sqlalchemy.engine import Dialect
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.sql.elements import BindParameter, ClauseElement, ColumnClause
+from sqlalchemy.sql.visitors import replacement_traverse
+
+from rmq.utils.sql_expressions import compile_expression
+
+logger = logging.getLogger(__name__)
+
+
+def _escape_load_data_value(value) -> bytes:
+    """Value in default LOAD DATA format: tab separated fields, backslash escapes, \\N is NULL"""
+    if value is None:
+        return b"\\N"
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    raw = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    return (
+        raw.replace(b"\\", b"\\\\")
+        .replace(b"\t", b"\\t")
+        .replace(b"\n", b"\\n")
+        .replace(b"\r", b"\\r")
+        .replace(b"\0", b"\\0")
+    )
+
+
+class StagingTableLoader:
+    """Stores rows of INSERT statement table in bulk.
+
+    Rows are streamed into a spill file, loaded with LOAD DATA LOCAL INFILE into a temporary staging table
+    (columns of the target table without indexes) and merged into the target table with single
+    INSERT ... SELECT, which keeps ON DUPLICATE KEY UPDATE clause of the given insert statement.
+    All statements run in the caller's transaction, so rows are visible in the target table only after commit.
+    DB connection must allow local infile (local_infile=True for MySQLdb, local_infile=ON on the server).
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, dialect: Dialect = mysql.dialect()):
+        # directory of spill files, None - system temporary directory
+        self.spill_dir = spill_dir
+        self.dialect = dialect
+
+        self.loads_count = 0
+        self.loaded_rows_count = 0
+
+    def load(self, transaction, insert_stmt: Insert, rows: Iterable[dict]) -> int:
+        """Loads rows (column name -> value) into the table of insert_stmt, returns number of loaded rows.
+        All rows must have the same columns, missing value would be loaded as NULL instead of column default"""
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+        target_table = insert_stmt.table
+        columns = list(first_row.keys())
+        quote = self.dialect.identifier_preparer.quote
+        staging_table_name = f"_staging_{target_table.name}"
+        quoted_columns = ", ".join(quote(name) for name in columns)
+
+        transaction.execute(f"DROP TEMPORARY TABLE IF EXISTS {quote(staging_table_name)}")
+        transaction.execute(
+            f"CREATE TEMPORARY TABLE {quote(staging_table_name)} "
+            f"SELECT {quoted_columns} FROM {quote(target_table.name)} LIMIT 0"
+        )
+        spill_file = tempfile.NamedTemporaryFile(
+            mode="wb",
+            dir=self.spill_dir,
+            prefix=f"{target_table.name}_",
+            suffix=".tsv",
+            delete=False,
+        )
+        try:
+            with spill_file:
+                written_count = self._write_rows(spill_file, columns, first_row, rows)
+            transaction.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {quote(staging_table_name)} "
+                f"CHARACTER SET utf8mb4 ({quoted_columns})",
+                (spill_file.name,),
+            )
+            loaded_count = transaction.rowcount
+            if loaded_count != written_count:
+                raise ValueError(
+                    f"Loaded {loaded_count} of {written_count} rows into {staging_table_name}"
+                )
+            transaction.execute(
+                *compile_expression(
+                    self.build_merge_stmt(insert_stmt, staging_table_name, columns), self.dialect
+                )
+            )
+            transaction.execute(f"DROP TEMPORARY TABLE {quote(staging_table_name)}")
+        finally:
+            os.unlink(spill_file.name)
+
+        self.loads_count += 1
+        self.loaded_rows_count += written_count
+        logger.debug(f"Loaded {written_count} rows into {target_table.name}")
+        return written_count
+
+    @staticmethod
+    def get_row(insert_stmt: Insert) -> dict:
+        """Column values of single row INSERT statement, taken from its VALUES without compiling.
+        Python side defaults of table columns are applied to missing values like on execution"""
+        if insert_stmt._multi_values:
+            raise ValueError("Only single row INSERT statement could be loaded as row")
+        target_table = insert_stmt.table
+        row = {}
+        for key, value in (insert_stmt._values or {}).items():
+            table_column = target_table.c[key] if isinstance(key, str) else key
+            if not isinstance(value, BindParameter):
+                raise NotImplementedError(
+                    f"Value of column {table_column.name} is SQL expression, it can't be loaded"
+                )
+            row[table_column.name] = value.effective_value
+        for table_column in target_table.columns:
+            default = table_column.default
+            if table_column.name in row or default is None:
+                continue
+            if default.is_scalar:
+                row[table_column.name] = default.arg
+            elif default.is_callable:
+                row[table_column.name] = default.arg(None)
+        return row
+
+    @staticmethod
+    def _write_rows(spill_file, columns: List[str], first_row: dict, rows: Iterable[dict]) -> int:
+        written_count = 0
+        for row in chain((first_row,), rows):
+            if row.keys() != first_row.keys():
+                raise ValueError(
+                    f"Row columns {sorted(row)} differ from the first row columns {columns}"
+                )
+            spill_file.write(
+                b"\t".join(_escape_load_data_value(row[name]) for name in columns) + b"\n"
+            )
+            written_count += 1
+        return written_count
+
+    @staticmethod
+    def build_merge_stmt(
+        insert_stmt: Insert, staging_table_name: str, columns: List[str]
+    ) -> Insert:
+        """INSERT ... SELECT of staging table rows with ON DUPLICATE KEY UPDATE clause of insert_stmt"""
+        staging_table = table(staging_table_name, *(column(name) for name in columns))
+        # columns are named like in DB, column keys of the table could differ from their names
+        table_columns = {table_column.name: table_column for table_column in insert_stmt.table.c}
+        merge_stmt = mysql.insert(insert_stmt.table).from_select(
+            [table_columns[name] for name in columns],
+            select(*(staging_table.c[name] for name in columns)),
+            # python side defaults are already applied to the loaded rows, see get_row
+            include_defaults=False,
+        )
+        on_duplicate = getattr(insert_stmt, "_post_values_clause", None)
+        if on_duplicate is None:
+            return merge_stmt
+        inserted = merge_stmt.inserted
+
+        def replace_inserted_column(element):
+            # insert_stmt.inserted columns are rendered as VALUES() only within their own statement
+            if isinstance(element, ColumnClause) and element.table is on_duplicate.inserted_alias:
+                return inserted[element.key]
+            return None
+
+        update = [
+            (
+                key,
+                replacement_traverse(value, {}, replace_inserted_column)
+                if isinstance(value, ClauseElement)
+                else value,
+            )
+            for key, value in on_duplicate.update.items()
+        ]
+        # dictionary is updated in order of table columns, list - in the given order
+        return merge_stmt.on_duplicate_key_update(
+            update if on_duplicate._parameter_ordering else dict(update)
+        )
+
+    def get_stats(self) -> dict:
+        return {"loads": self.loads_count, "loaded_rows": self.loaded_rows_count}
@@ -2,6 +2,8 @@ import json
 
 from rmq.exceptions import ConsumedDataCorrupted
 
+from .message_codecs import decode_message_body
+
 
 class Task:
     def __init__(self, consumed_data, ack_callback=None, nack_callback=None):
@@ -15,7 +17,9 @@ class Task:
             raise ConsumedDataCorrupted('Consumed data has no "body" key')
         self.__consumed_data = consumed_data
 
-        self.payload = json.loads(self.__consumed_data.get("body"))
+        self.payload = decode_message_body(
+            self.__consumed_data.get("body"), self.__consumed_data.get("properties")
+        )
         self.delivery_tag = self.__consumed_data.get("method").delivery_tag
         self.reply_to = self.__consumed_data.get("properties").reply_to
         self.status = 1
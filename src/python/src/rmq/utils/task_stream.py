@@ -0,0 +1,84 @@
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+from twisted.internet import reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStream:
+    """Reads rows of single task query in chunks from server-side cursor of a dedicated DB connection.
+
+    Rows of unbuffered cursor (e.g. MySQLdb SSDictCursor) are transferred as they are fetched, so memory use
+    is bounded by chunk size whatever the backlog is. Connection with unread result could not run other
+    queries, so it is used only by the stream, in its own thread, and DB connection pool is left buffered.
+    When the result is read to the end, the next fetch re-runs the query built by build_query.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        build_query: Callable[[], Tuple[str, Optional[tuple]]],
+    ):
+        # returns DB-API connection whose cursor() is unbuffered
+        self.connect = connect
+        # returns SQL and parameters of the task query, called in the stream thread
+        self.build_query = build_query
+
+        self._connection = None
+        self._cursor = None
+        self._threadpool = ThreadPool(1, 1, name="TaskStream")
+
+        self.queries_count = 0
+        self.fetched_rows_count = 0
+
+    def start(self):
+        self._threadpool.start()
+        reactor.addSystemEventTrigger("during", "shutdown", self.stop)
+
+    def stop(self):
+        self._threadpool.callInThread(self._close)
+        self._threadpool.stop()
+
+    def fetch(self, size: int):
+        """Deferred firing with list of up to size rows, empty list if there are no tasks"""
+        return threads.deferToThreadPool(reactor, self._threadpool, self.fetch_rows, size)
+
+    def fetch_rows(self, size: int) -> List[dict]:
+        try:
+            if self._cursor is None:
+                if self._connection is None:
+                    self._connection = self.connect()
+                self._cursor = self._connection.cursor()
+                self._cursor.execute(*self.build_query())
+                self.queries_count += 1
+            rows = list(self._cursor.fetchmany(size))
+        except Exception:
+            # connection state is unknown, the next fetch reconnects and re-runs the query
+            self._close()
+            raise
+        if len(rows) < size:
+            self._close_cursor()
+        self.fetched_rows_count += len(rows)
+        return rows
+
+    def _close_cursor(self):
+        cursor, self._cursor = self._cursor, None
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception as error:
+                logger.warning(f"Failed to close task stream cursor: {error}")
+
+    def _close(self):
+        self._close_cursor()
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception as error:
+                logger.warning(f"Failed to close task stream connection: {error}")
+
+    def get_stats(self) -> dict:
+        return {"queries": self.queries_count, "fetched_rows": self.fetched_rows_count}
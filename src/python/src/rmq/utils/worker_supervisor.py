@@ -0,0 +1,141 @@
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from twisted.internet import defer, protocol, reactor
+from twisted.internet.error import ProcessExitedAlready
+
+logger = logging.getLogger(__name__)
+
+
+class _WorkerProcessProtocol(protocol.ProcessProtocol):
+    def __init__(self, supervisor: "WorkerSupervisor", index: int):
+        self.supervisor = supervisor
+        self.index = index
+        self.started_at = time.monotonic()
+
+    def processEnded(self, reason):
+        exit_code = getattr(reason.value, "exitCode", None)
+        self.supervisor.on_worker_ended(self.index, exit_code, getattr(reason.value, "signal", None))
+
+    def send_signal(self, signal_name: str):
+        try:
+            self.transport.signalProcess(signal_name)
+        except ProcessExitedAlready:
+            pass
+
+
+class WorkerSupervisor:
+    """Runs workers_count worker processes and restarts crashed ones. Lives in the reactor thread.
+
+    build_worker_command(index) returns (args, env) of the worker process, args[0] is the executable.
+    Worker which exits with code 0 is done and is not restarted, reactor is stopped when all workers are done.
+    Worker which crashes (non zero exit code or signal) is restarted after a delay, which doubles while
+    the worker keeps crashing within stable_uptime seconds after start.
+    On reactor shutdown workers get SIGTERM, the ones still running after stop_timeout seconds are killed.
+    """
+
+    def __init__(
+        self,
+        workers_count: int,
+        build_worker_command: Callable[[int], Tuple[List[str], Dict[str, str]]],
+        restart_backoff_base: float = 1,
+        restart_backoff_max: float = 30,
+        stable_uptime: float = 60,
+        stop_timeout: float = 30,
+    ):
+        self.workers_count = workers_count
+        self.build_worker_command = build_worker_command
+        self.restart_backoff_base = restart_backoff_base
+        self.restart_backoff_max = restart_backoff_max
+        self.stable_uptime = stable_uptime
+        self.stop_timeout = stop_timeout
+
+        self._workers: Dict[int, _WorkerProcessProtocol] = {}
+        self._restart_timers = {}
+        self._crashes_in_row = {}
+        self._done_workers = set()
+        self._stopping = False
+        self._stopped = None
+
+        self.restarts = 0
+
+    def start(self):
+        reactor.addSystemEventTrigger("before", "shutdown", self.stop)
+        for index in range(self.workers_count):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        self._restart_timers.pop(index, None)
+        args, env = self.build_worker_command(index)
+        worker = _WorkerProcessProtocol(self, index)
+        # workers write logs to the same stdout/stderr as supervisor
+        reactor.spawnProcess(
+            worker, args[0], args, env=env, path=os.getcwd(), childFDs={0: 0, 1: 1, 2: 2}
+        )
+        self._workers[index] = worker
+        logger.info("Started worker #{} (pid {})".format(index, worker.transport.pid))
+
+    def on_worker_ended(self, index: int, exit_code, signal_number):
+        worker = self._workers.pop(index, None)
+        if self._stopping:
+            logger.info("Worker #{} stopped".format(index))
+            if not self._workers and self._stopped is not None:
+                self._stopped.callback(None)
+            return
+        if exit_code == 0:
+            logger.info("Worker #{} is done".format(index))
+            self._done_workers.add(index)
+            if len(self._done_workers) == self.workers_count and reactor.running:
+                reactor.stop()
+            return
+
+        uptime = time.monotonic() - worker.started_at if worker is not None else 0
+        if uptime >= self.stable_uptime:
+            self._crashes_in_row[index] = 0
+        crashes_in_row = self._crashes_in_row.get(index, 0)
+        self._crashes_in_row[index] = crashes_in_row + 1
+        delay = min(self.restart_backoff_base * 2 ** crashes_in_row, self.restart_backoff_max)
+        logger.warning(
+            "Worker #{} crashed (exit code {}, signal {}) after {:.1f} seconds, "
+            "restart in {} seconds".format(index, exit_code, signal_number, uptime, delay)
+        )
+        self.restarts += 1
+        self._restart_timers[index] = reactor.callLater(delay, self._spawn, index)
+
+    def stop(self):
+        """Terminates workers, returned Deferred fires when all of them have exited"""
+        self._stopping = True
+        for timer in self._restart_timers.values():
+            if timer.active():
+                timer.cancel()
+        self._restart_timers = {}
+        if not self._workers:
+            return None
+        self._stopped = defer.Deferred()
+        for worker in self._workers.values():
+            worker.send_signal("TERM")
+        kill_timer = reactor.callLater(self.stop_timeout, self._kill_workers)
+        self._stopped.addBoth(lambda result: kill_timer.cancel() if kill_timer.active() else None)
+        return self._stopped
+
+    def _kill_workers(self):
+        for index, worker in self._workers.items():
+            logger.warning(
+                "Worker #{} did not stop in {} seconds, killing it".format(index, self.stop_timeout)
+            )
+            worker.send_signal("KILL")
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "done": len(self._done_workers),
+            "restarts": self.restarts,
+        }
+
+
+def split_budget(total: int, parts_count: int) -> List[int]:
+    """Splits total (e.g. prefetch count) between parts as evenly as possible, each part gets at least 1"""
+    share, remainder = divmod(max(total, parts_count), parts_count)
+    return [share + 1 if index < remainder else share for index in range(parts_count)]
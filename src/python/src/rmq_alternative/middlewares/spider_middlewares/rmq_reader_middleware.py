@@ -9,11 +9,15 @@ from scrapy.crawler import Crawler
 from scrapy.exceptions import CloseSpider, DontCloseSpider
 from scrapy.http import Response
 from scrapy.spidermiddlewares.httperror import HttpError
-from twisted.internet import reactor
 from twisted.python.failure import Failure
 
-from rmq.connections import PikaSelectConnection
-from rmq.utils import RMQDefaultOptions
+from rmq.connections import PikaSelectConnection, get_connection_class, start_connection
+from rmq.utils import (
+    RMQDefaultOptions,
+    get_connection_options,
+    get_task_queue_options,
+    set_connection_stats,
+)
 from rmq_alternative.base_rmq_spider import BaseRmqSpider
 from rmq_alternative.schemas.messages.base_rmq_message import BaseRmqMessage
 
@@ -59,6 +63,7 @@ class RmqReaderMiddleware(object):
         logging.getLogger("pika").setLevel(self.__spider.settings.get("PIKA_LOG_LEVEL", "WARNING"))
 
         self.rmq_connection = None
+        self.connection_class = get_connection_class(crawler.settings)
 
         """Build pika connection parameters and start connection in separate twisted thread"""
         self.parameters = pika.ConnectionParameters(
@@ -73,14 +78,16 @@ class RmqReaderMiddleware(object):
         )
 
     def connect(self, parameters, queue_name):
-        c = PikaSelectConnection(
+        c = self.connection_class(
             parameters,
             queue_name,
             owner=self,
-            options={
-                "enable_delivery_confirmations": False,
-                "prefetch_count": self.__spider.settings.get("CONCURRENT_REQUESTS", 1),
-            },
+            options=get_connection_options(
+                self.__spider.settings,
+                enable_delivery_confirmations=False,
+                prefetch_count=self.__spider.settings.get("CONCURRENT_REQUESTS", 1),
+                **get_task_queue_options(self.__spider.settings, queue_name),
+            ),
             is_consumer=True,
         )
         self.logger.info("Pika threaded event start")
@@ -93,15 +100,16 @@ class RmqReaderMiddleware(object):
     def spider_idle(self, spider: BaseRmqSpider):
         if not self.rmq_connection:
             task_queue_name = self.__spider.task_queue_name
-            reactor.callInThread(self.connect, self.parameters, task_queue_name)
+            start_connection(self.connection_class, self.connect, self.parameters, task_queue_name)
         raise DontCloseSpider
 
     def spider_closed(self, spider: BaseRmqSpider):
         if self.rmq_connection is not None and isinstance(self.rmq_connection, PikaSelectConnection):
-            if isinstance(self.rmq_connection.connection, pika.SelectConnection):
-                self.rmq_connection.connection.ioloop.add_callback_threadsafe(
-                    self.rmq_connection.stop
-                )
+            if self.rmq_connection.connection is not None:
+                self.rmq_connection.add_callback_threadsafe(self.rmq_connection.stop)
+
+    def on_connection_stats(self, stats):
+        set_connection_stats(self.crawler.stats, stats, prefix="rabbitmq/reader")
 
     def raise_close_spider(self):
         # TODO: does it work?
@@ -1,13 +1,14 @@
 import functools
 import logging
-from typing import Callable
+from typing import Any, Callable
 
 from pika.channel import Channel
 from pika.spec import Basic, BasicProperties
-from pydantic import BaseModel, Json, PrivateAttr, Extra
+from pydantic import BaseModel, PrivateAttr, Extra, ValidationInfo, field_validator
 from scrapy.crawler import Crawler
 
 from rmq.connections import PikaSelectConnection
+from rmq.utils import decode_message_body
 from rmq_alternative.utils import signals as CustomSignals
 
 logger = logging.getLogger(name='BaseRmqMessage')
@@ -17,7 +18,7 @@ class BaseRmqMessage(BaseModel):
     channel: Channel
     deliver: Basic.Deliver
     basic_properties: BasicProperties
-    body: Json
+    body: Any
 
     _rmq_connection: PikaSelectConnection = PrivateAttr()
     _crawler: Crawler = PrivateAttr()
@@ -28,6 +29,14 @@ class BaseRmqMessage(BaseModel):
         self._crawler = data.pop('_crawler')
         super().__init__(**data)
 
+    @field_validator('body', mode='before')
+    @classmethod
+    def decode_body(cls, body: Any, info: ValidationInfo) -> Any:
+        # raw body is decoded by content type/encoding of message properties
+        if isinstance(body, (bytes, str)):
+            return decode_message_body(body, info.data.get('basic_properties'))
+        return body
+
     def ack(self):
         if self._is_acknowledged_message is False:
             self._is_acknowledged_message = True
@@ -35,7 +44,7 @@ class BaseRmqMessage(BaseModel):
             ack_function: Callable = functools.partial(
                 self._rmq_connection.acknowledge_message, delivery_tag=self.deliver.delivery_tag
             )
-            self._rmq_connection.connection.ioloop.add_callback_threadsafe(ack_function)
+            self._rmq_connection.add_callback_threadsafe(ack_function)
             logger.info(f'ACK message with delivery tag {self.deliver.delivery_tag}')
             self._crawler.signals.send_catch_log(CustomSignals.message_ack, rmq_message=self)
 
@@ -46,7 +55,7 @@ class BaseRmqMessage(BaseModel):
             nack_function: Callable = functools.partial(
                 self._rmq_connection.negative_acknowledge_message, delivery_tag=self.deliver.delivery_tag
             )
-            self._rmq_connection.connection.ioloop.add_callback_threadsafe(nack_function)
+            self._rmq_connection.add_callback_threadsafe(nack_function)
             logger.info(f'NACK message with delivery tag {self.deliver.delivery_tag}')
             self._crawler.signals.send_catch_log(CustomSignals.message_nack, rmq_message=self)
 
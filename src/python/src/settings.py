@@ -68,6 +68,75 @@ RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", "5672"))
 RABBITMQ_USERNAME = os.getenv("RABBITMQ_USERNAME", "guest")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "guest")
 RABBITMQ_VIRTUAL_HOST = os.getenv("RABBITMQ_VIRTUAL_HOST", "/")
+# rmq.connections.PikaAsyncioConnection runs pika on the reactor's asyncio loop without a dedicated thread
+RABBITMQ_CONNECTION_CLASS = os.getenv("RABBITMQ_CONNECTION_CLASS", "rmq.connections.PikaSelectConnection")
+# number of channels consuming tasks per connection and their prefetch counts (comma separated, one per channel)
+RABBITMQ_CONSUMER_CHANNELS = int(os.getenv("RABBITMQ_CONSUMER_CHANNELS", "1"))
+RABBITMQ_CONSUMER_PREFETCH_COUNTS = list(
+    map(int, (s for s in os.getenv("RABBITMQ_CONSUMER_PREFETCH_COUNTS", "").split(",") if s))
+)
+# publish replies/results through separate channel, which never consumes
+RABBITMQ_DEDICATED_PUBLISH_CHANNEL = strtobool(os.getenv("RABBITMQ_DEDICATED_PUBLISH_CHANNEL", "False"))
+# reopen connection/channel with exponential backoff instead of closing spider, 0 attempts - unlimited
+RABBITMQ_AUTO_RECONNECT = strtobool(os.getenv("RABBITMQ_AUTO_RECONNECT", "True"))
+RABBITMQ_RECONNECT_MAX_ATTEMPTS = int(os.getenv("RABBITMQ_RECONNECT_MAX_ATTEMPTS", "10"))
+RABBITMQ_RECONNECT_BACKOFF_BASE = float(os.getenv("RABBITMQ_RECONNECT_BACKOFF_BASE", "1"))
+RABBITMQ_RECONNECT_BACKOFF_MAX = float(os.getenv("RABBITMQ_RECONNECT_BACKOFF_MAX", "30"))
+# max published and not yet confirmed messages of producer/pipeline, publishing waits when it is full. 0 - unlimited
+RABBITMQ_PUBLISH_WINDOW = int(os.getenv("RABBITMQ_PUBLISH_WINDOW", "0"))
+# seconds between connection metrics updates in crawler stats (command logs), 0 - disabled
+RABBITMQ_STATS_INTERVAL = float(os.getenv("RABBITMQ_STATS_INTERVAL", "60"))
+# seconds the connection thread waits after wakeup before sending commands scheduled from other threads (publishes,
+# acks), so more of them are sent in one batch, and max number of commands sent per ioloop iteration
+RABBITMQ_OUTBOUND_LINGER = float(os.getenv("RABBITMQ_OUTBOUND_LINGER", "0"))
+RABBITMQ_OUTBOUND_MAX_BATCH_SIZE = int(os.getenv("RABBITMQ_OUTBOUND_MAX_BATCH_SIZE", "500"))
+# acknowledge contiguous completed deliveries with single multiple ack, out of order completed ones are acknowledged
+# one by one after RABBITMQ_ACK_FLUSH_INTERVAL seconds
+RABBITMQ_BATCH_ACKNOWLEDGEMENTS = strtobool(os.getenv("RABBITMQ_BATCH_ACKNOWLEDGEMENTS", "True"))
+RABBITMQ_ACK_FLUSH_INTERVAL = float(os.getenv("RABBITMQ_ACK_FLUSH_INTERVAL", "1"))
+# published message codec: application/json (orjson is used when installed) or application/msgpack (requires msgpack),
+# bodies of at least RABBITMQ_MESSAGE_COMPRESS_MIN_SIZE bytes are compressed with RABBITMQ_MESSAGE_CONTENT_ENCODING (zlib)
+RABBITMQ_MESSAGE_CONTENT_TYPE = os.getenv("RABBITMQ_MESSAGE_CONTENT_TYPE", "application/json")
+RABBITMQ_MESSAGE_CONTENT_ENCODING = os.getenv("RABBITMQ_MESSAGE_CONTENT_ENCODING", "")
+RABBITMQ_MESSAGE_COMPRESS_MIN_SIZE = int(os.getenv("RABBITMQ_MESSAGE_COMPRESS_MIN_SIZE", "1024"))
+# task queues are declared with x-max-priority by producer and RPCTaskConsumer, producer maps priority column of tasks
+# to message priority (capped with this value). 0 - disabled, existing queue must be re-created to change it
+RABBITMQ_MAX_PRIORITY = int(os.getenv("RABBITMQ_MAX_PRIORITY", "0"))
+# task queues are split into <name>.0 ... <name>.N-1 shards by producer (hash of task column), consumers consume
+# RABBITMQ_CONSUMER_SHARDS set (e.g. "0-3,7", empty - all shards). 0 or 1 - task queue is not sharded
+RABBITMQ_TASK_QUEUE_SHARDS = int(os.getenv("RABBITMQ_TASK_QUEUE_SHARDS", "0"))
+RABBITMQ_CONSUMER_SHARDS = os.getenv("RABBITMQ_CONSUMER_SHARDS", "")
+# nacked messages of consumers are moved to <queue>.retry.N queues, which return them to <queue> after
+# RABBITMQ_RETRY_BASE_DELAY * RABBITMQ_RETRY_DELAY_FACTOR ** N seconds (N < RABBITMQ_RETRY_TIERS). Message which
+# failed RABBITMQ_RETRY_MAX_ATTEMPTS times is moved to <queue>.parking. 0 - nacked messages are requeued immediately
+# Consumer connection publishes the moved copies with delivery confirmations and acks the original when confirmed
+RABBITMQ_RETRY_MAX_ATTEMPTS = int(os.getenv("RABBITMQ_RETRY_MAX_ATTEMPTS", "0"))
+RABBITMQ_RETRY_BASE_DELAY = float(os.getenv("RABBITMQ_RETRY_BASE_DELAY", "5"))
+RABBITMQ_RETRY_DELAY_FACTOR = float(os.getenv("RABBITMQ_RETRY_DELAY_FACTOR", "2"))
+RABBITMQ_RETRY_TIERS = int(os.getenv("RABBITMQ_RETRY_TIERS", "5"))
+
+# producer holds ready messages count of task queue around PRODUCER_TARGET_QUEUE_DEPTH: chunk size is adjusted
+# between PRODUCER_MIN_CHUNK_SIZE and --chunk_size, waits between queue checks are bounded by min/max poll interval
+PRODUCER_TARGET_QUEUE_DEPTH = int(os.getenv("PRODUCER_TARGET_QUEUE_DEPTH", "5000"))
+PRODUCER_MIN_CHUNK_SIZE = int(os.getenv("PRODUCER_MIN_CHUNK_SIZE", "1"))
+PRODUCER_MIN_POLL_INTERVAL = float(os.getenv("PRODUCER_MIN_POLL_INTERVAL", "1"))
+PRODUCER_MAX_POLL_INTERVAL = float(os.getenv("PRODUCER_MAX_POLL_INTERVAL", "300"))
+# consumer --adaptive-prefetch: every CONSUMER_PREFETCH_ADJUST_INTERVAL seconds prefetch count is increased while
+# DB connection pool has idle threads and decreased when DB latency grows over CONSUMER_PREFETCH_LATENCY_TOLERANCE
+# times the baseline latency or interactions wait for the pool, staying between min and max prefetch count.
+# consumer --workers N splits --prefetch_count and CONSUMER_MAX_PREFETCH_COUNT between worker processes, each worker
+# gets CONSUMER_WORKER_INDEX environment variable
+CONSUMER_MIN_PREFETCH_COUNT = int(os.getenv("CONSUMER_MIN_PREFETCH_COUNT", "1"))
+CONSUMER_MAX_PREFETCH_COUNT = int(os.getenv("CONSUMER_MAX_PREFETCH_COUNT", "256"))
+CONSUMER_PREFETCH_LATENCY_TOLERANCE = float(os.getenv("CONSUMER_PREFETCH_LATENCY_TOLERANCE", "2.0"))
+CONSUMER_PREFETCH_ADJUST_INTERVAL = float(os.getenv("CONSUMER_PREFETCH_ADJUST_INTERVAL", "5"))
+# directory of consumer --load-data spill files, empty - system temporary directory
+CONSUMER_LOAD_DATA_SPILL_DIR = os.getenv("CONSUMER_LOAD_DATA_SPILL_DIR", "")
+
+# directory of producer task cursors (producer --keyset)
+PRODUCER_CURSOR_STORAGE_PATH = os.getenv(
+    "PRODUCER_CURSOR_STORAGE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage")
+)
 
 try:
     HTTPCACHE_ENABLED = strtobool(os.getenv("HTTPCACHE_ENABLED", "False"))
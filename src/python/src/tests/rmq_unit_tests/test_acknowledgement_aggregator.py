@@ -0,0 +1,54 @@
+import time
+
+from rmq.connections.acknowledgement_aggregator import AcknowledgementAggregator
+
+
+def _aggregator(*delivery_tags):
+    aggregator = AcknowledgementAggregator()
+    for delivery_tag in delivery_tags:
+        aggregator.register_delivery(delivery_tag)
+    return aggregator
+
+
+class TestAcknowledgementAggregator:
+    def test_contiguous_prefix_is_coalesced(self):
+        aggregator = _aggregator(1, 2, 3, 4)
+        assert aggregator.complete(2) and aggregator.complete(1)
+        assert aggregator.pop_contiguous() == 2
+        assert aggregator.held_count == 0
+        assert aggregator.outstanding_count == 2
+
+    def test_gap_holds_completed_deliveries(self):
+        aggregator = _aggregator(1, 2, 3)
+        aggregator.complete(2)
+        aggregator.complete(3)
+        assert aggregator.pop_contiguous() is None
+        assert aggregator.held_count == 2
+        aggregator.complete(1)
+        assert aggregator.pop_contiguous() == 3
+
+    def test_unknown_delivery_is_not_held(self):
+        aggregator = _aggregator(1)
+        assert aggregator.complete(5) is False
+        assert aggregator.held_count == 0
+
+    def test_discarded_delivery_unblocks_prefix(self):
+        aggregator = _aggregator(1, 2)
+        aggregator.complete(2)
+        aggregator.discard(1)
+        assert aggregator.pop_contiguous() == 2
+
+    def test_pop_expired(self):
+        aggregator = _aggregator(1, 2, 3)
+        aggregator.complete(2)
+        assert aggregator.pop_expired(max_age=60) == []
+        time.sleep(0.01)
+        assert aggregator.pop_expired(max_age=0) == [2]
+        assert aggregator.held_count == 0
+        assert aggregator.outstanding_count == 2
+
+    def test_reset(self):
+        aggregator = _aggregator(1, 2)
+        aggregator.complete(1)
+        aggregator.reset()
+        assert aggregator.held_count == 0 and aggregator.outstanding_count == 0
@@ -0,0 +1,20 @@
+from rmq.connections.channel_delivery_tag import compose_delivery_tag, split_delivery_tag
+
+
+class TestChannelDeliveryTag:
+    def test_first_channel_of_first_generation_keeps_raw_tag(self):
+        assert compose_delivery_tag(0, 42) == 42
+        assert split_delivery_tag(42) == (0, 0, 42)
+
+    def test_round_trip(self):
+        for channel_index, delivery_tag, generation in ((1, 7, 0), (3, 2**39, 5), (255, 1, 200)):
+            composed = compose_delivery_tag(channel_index, delivery_tag, generation)
+            assert split_delivery_tag(composed) == (channel_index, generation, delivery_tag)
+
+    def test_tags_of_different_channels_and_generations_do_not_collide(self):
+        tags = {
+            compose_delivery_tag(channel_index, 1, generation)
+            for channel_index in range(4)
+            for generation in range(4)
+        }
+        assert len(tags) == 16
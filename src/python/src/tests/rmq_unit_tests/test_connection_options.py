@@ -0,0 +1,39 @@
+from scrapy.settings import Settings
+
+from rmq.connections import PikaSelectConnection
+from rmq.utils import get_connection_options
+
+
+class TestConnectionOptions:
+    def test_defaults_match_connection_defaults(self):
+        options = get_connection_options(Settings())
+        for name in (
+            'outbound_linger',
+            'outbound_max_batch_size',
+            'batch_acknowledgements',
+            'ack_flush_interval',
+        ):
+            assert options[name] == PikaSelectConnection._DEFAULT_OPTIONS[name]
+
+    def test_outbound_buffer_options_are_taken_from_settings(self):
+        settings = Settings(
+            {'RABBITMQ_OUTBOUND_LINGER': '0.005', 'RABBITMQ_OUTBOUND_MAX_BATCH_SIZE': '50'}
+        )
+        connection = PikaSelectConnection(
+            None, 'queue', owner=None, options=get_connection_options(settings)
+        )
+        assert connection._get_option('outbound_linger') == 0.005
+        assert connection._outbound_commands.max_batch_size == 50
+
+    def test_acknowledgement_batching_is_taken_from_settings(self):
+        settings = Settings(
+            {'RABBITMQ_BATCH_ACKNOWLEDGEMENTS': 'False', 'RABBITMQ_ACK_FLUSH_INTERVAL': '0.5'}
+        )
+        options = get_connection_options(settings)
+        assert options['batch_acknowledgements'] is False
+        assert options['ack_flush_interval'] == 0.5
+
+    def test_explicit_options_take_precedence(self):
+        settings = Settings({'RABBITMQ_OUTBOUND_MAX_BATCH_SIZE': '50'})
+        options = get_connection_options(settings, outbound_max_batch_size=10)
+        assert options['outbound_max_batch_size'] == 10
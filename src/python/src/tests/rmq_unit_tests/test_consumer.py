@@ -0,0 +1,193 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert
+from sqlalchemy.dialects import mysql
+from twisted.internet import defer, task
+
+pytest.importorskip('MySQLdb')
+
+from rmq.commands import consumer as consumer_module  # noqa: E402
+from rmq.commands.consumer import Consumer  # noqa: E402
+
+metadata = MetaData()
+results = Table(
+    'results',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String(255)),
+)
+failures = Table(
+    'failures',
+    metadata,
+    Column('id', Integer, primary_key=True),
+)
+
+
+class FakeTransaction:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.executemany(sql, [params])
+        self.statements[-1] = ('execute', sql, params)
+
+    def executemany(self, sql, params_list):
+        if any(params is not None and 'bad' in params for params in params_list):
+            raise ValueError('bad message')
+        self.statements.append(('executemany', sql, params_list))
+
+
+class FakeConnectionPool:
+    """Runs interactions synchronously, transaction is kept only when interaction succeeds"""
+
+    def __init__(self):
+        self.committed = []
+
+    def runInteraction(self, interaction, *args):
+        transaction = FakeTransaction()
+        d = defer.maybeDeferred(interaction, transaction, *args)
+        d.addCallback(lambda result: self.committed.append(transaction) or result)
+        return d
+
+
+class FakeRMQConnection:
+    def __init__(self):
+        self.acked = []
+        self.nacked = []
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def acknowledge_messages(self, delivery_tags):
+        self.acked.extend(delivery_tags)
+
+    def negative_acknowledge_messages(self, delivery_tags):
+        self.nacked.extend(delivery_tags)
+
+
+class ResultsConsumer(Consumer):
+    def __init__(self):
+        super().__init__()
+        self.mode = Consumer.CommandModes.WORKER.value
+        self.db_connection_pool = FakeConnectionPool()
+        self.rmq_connection = FakeRMQConnection()
+
+    def short_desc(self):
+        return 'Results consumer'
+
+    def build_message_store_stmt(self, message_body):
+        if message_body.get('failed'):
+            return insert(failures).values(id=message_body['id'])
+        stmt = mysql.insert(results).values(message_body)
+        return stmt.on_duplicate_key_update({'title': stmt.inserted.title})
+
+
+class ProcessingConsumer(ResultsConsumer):
+    def process_message(self, transaction, message_body):
+        transaction.execute(
+            'UPDATE results SET title = %s WHERE id = %s',
+            (message_body['title'], message_body['id']),
+        )
+        return message_body['title'] != 'skipped'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = task.Clock()
+    monkeypatch.setattr(consumer_module, 'reactor', clock)
+    return clock
+
+
+def add_messages(consumer, *titles):
+    for delivery_tag, title in enumerate(titles, len(consumer._batch) + 1):
+        consumer._unacked_count += 1
+        consumer._add_to_batch(delivery_tag, {'id': delivery_tag, 'title': title})
+
+
+class TestConsumerBatching:
+    @pytest.fixture
+    def consumer(self, clock):
+        consumer = ResultsConsumer()
+        consumer.batch_size = 3
+        return consumer
+
+    def test_batch_is_stored_when_full(self, consumer):
+        add_messages(consumer, 'first', 'second')
+        assert consumer.db_connection_pool.committed == []
+        add_messages(consumer, 'third')
+        assert len(consumer.db_connection_pool.committed) == 1
+        assert consumer.rmq_connection.acked == [1, 2, 3]
+        assert consumer._unacked_count == 0
+        assert consumer.batches_count == 1
+
+    def test_batch_is_stored_on_timeout(self, consumer, clock):
+        add_messages(consumer, 'first')
+        clock.advance(consumer.batch_timeout / 1000)
+        assert consumer.rmq_connection.acked == [1]
+        # the next message starts the timer again
+        add_messages(consumer, 'second')
+        assert clock.getDelayedCalls()
+
+    def test_timer_is_cancelled_when_batch_is_full(self, consumer, clock):
+        add_messages(consumer, 'first', 'second', 'third')
+        assert not clock.getDelayedCalls()
+
+    def test_same_statements_are_sent_with_executemany(self, consumer):
+        transaction = FakeTransaction()
+        message_bodies = [
+            {'id': 1, 'title': 'first'},
+            {'id': 2, 'title': 'second'},
+            {'id': 3, 'failed': True},
+            {'id': 4, 'title': 'fourth'},
+        ]
+        assert consumer.process_messages(transaction, message_bodies) is True
+        assert [(method, params) for method, _sql, params in transaction.statements] == [
+            ('executemany', [(1, 'first'), (2, 'second')]),
+            ('execute', (3,)),
+            ('execute', (4, 'fourth')),
+        ]
+        assert transaction.statements[0][1].startswith('INSERT INTO results')
+        assert transaction.statements[1][1].startswith('INSERT INTO failures')
+
+    def test_batch_statement_is_used_when_implemented(self, consumer):
+        consumer.build_messages_store_stmt = lambda message_bodies: insert(results).values(
+            message_bodies
+        )
+        transaction = FakeTransaction()
+        message_bodies = [{'id': 1, 'title': 'first'}, {'id': 2, 'title': 'second'}]
+        assert consumer.process_messages(transaction, message_bodies) is True
+        assert [method for method, _sql, _params in transaction.statements] == ['execute']
+
+    def test_failing_message_is_found_by_bisection(self, consumer):
+        consumer.batch_size = 4
+        add_messages(consumer, 'first', 'bad', 'third', 'fourth')
+        assert sorted(consumer.rmq_connection.acked) == [1, 3, 4]
+        assert consumer.rmq_connection.nacked == [2]
+        assert consumer._unacked_count == 0
+        # [1, 2, 3, 4] -> [1, 2] -> [1] and [2], [3, 4] is stored at once
+        assert consumer.batch_bisections_count == 2
+        assert len(consumer.db_connection_pool.committed) == 2
+
+
+class TestConsumerOverriddenProcessMessage:
+    @pytest.fixture
+    def consumer(self, clock):
+        consumer = ProcessingConsumer()
+        consumer.batch_size = 3
+        return consumer
+
+    def test_process_message_is_called_for_each_message(self, consumer):
+        add_messages(consumer, 'first', 'second', 'third')
+        (transaction,) = consumer.db_connection_pool.committed
+        assert [params for _method, _sql, params in transaction.statements] == [
+            ('first', 1),
+            ('second', 2),
+            ('third', 3),
+        ]
+        assert consumer.rmq_connection.acked == [1, 2, 3]
+
+    def test_messages_are_acked_by_their_own_results(self, consumer):
+        add_messages(consumer, 'first', 'skipped', 'third')
+        assert consumer.rmq_connection.acked == [1, 3]
+        assert consumer.rmq_connection.nacked == [2]
+        assert consumer._unacked_count == 0
+        assert consumer.batch_bisections_count == 0
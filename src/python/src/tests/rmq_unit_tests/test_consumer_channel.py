@@ -0,0 +1,147 @@
+import types
+
+from rmq.connections import PikaSelectConnection
+from rmq.connections.consumer_channel import ConsumerChannel
+
+
+class FakeIOLoop:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        timer = (delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        self.timers.remove(timer)
+
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self, channel_number):
+        self.channel_number = channel_number
+        self.acks = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+class TestConsumerChannel:
+    def test_detach_cancels_ack_flush_timer(self):
+        removed = []
+        consumer_channel = ConsumerChannel(0)
+        consumer_channel.attach(FakeChannel(1))
+        consumer_channel.ack_flush_timer = 'timer'
+        consumer_channel.is_ack_flush_scheduled = True
+        consumer_channel.detach(removed.append)
+        assert removed == ['timer']
+        assert consumer_channel.ack_flush_timer is None
+        assert consumer_channel.is_ack_flush_scheduled is False
+
+    def test_attach_forgets_timer_of_previous_channel(self):
+        consumer_channel = ConsumerChannel(0)
+        consumer_channel.attach(FakeChannel(1))
+        consumer_channel.ack_flush_timer = 'stale timer'
+        consumer_channel.attach(FakeChannel(2))
+        assert consumer_channel.ack_flush_timer is None
+        assert consumer_channel.generation == 1
+
+    def test_held_acks_are_flushed_after_reconnect(self):
+        connection = PikaSelectConnection(None, 'queue', owner=None, options={}, is_consumer=True)
+        connection.connection = types.SimpleNamespace(ioloop=FakeIOLoop())
+        consumer_channel = connection._channels[0]
+        connection._attach_channel(consumer_channel, FakeChannel(1))
+        consumer_channel.acknowledgements.register_delivery(1)
+        connection._schedule_acknowledgements_flush(consumer_channel)
+        assert consumer_channel.ack_flush_timer is not None
+
+        # connection is lost, the new one has its own ioloop
+        connection._detach_channels()
+        ioloop = FakeIOLoop()
+        connection.connection = types.SimpleNamespace(ioloop=ioloop)
+        channel = FakeChannel(1)
+        connection._attach_channel(consumer_channel, channel)
+        consumer_channel.acknowledgements.register_delivery(1)
+        consumer_channel.acknowledgements.register_delivery(2)
+        consumer_channel.acknowledgements.complete(2)
+        connection._schedule_acknowledgements_flush(consumer_channel)
+        assert consumer_channel.ack_flush_timer in ioloop.timers
+
+        connection.options['ack_flush_interval'] = 0
+        _delay, flush_expired = consumer_channel.ack_flush_timer
+        flush_expired()
+        assert channel.acks == [(2, False)]
+
+
+class FakeConsumingChannel(FakeChannel):
+    """Prefetch count of consumer is taken at basic_consume like per-consumer QoS of RabbitMQ"""
+
+    def __init__(self, channel_number):
+        super().__init__(channel_number)
+        self.prefetch_count = None
+        self.consumers = {}
+        self.cancel_callbacks = []
+
+    def basic_qos(self, prefetch_count, callback=None):
+        self.prefetch_count = prefetch_count
+        if callback is not None:
+            callback(None)
+
+    def basic_consume(self, queue_name, on_message):
+        consumer_tag = 'ctag{}'.format(len(self.consumers) + len(self.cancel_callbacks))
+        self.consumers[consumer_tag] = (queue_name, self.prefetch_count)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag, callback):
+        # like pika, cancel of consumer which is already being cancelled is ignored
+        if self.consumers.pop(consumer_tag, None) is None:
+            return
+        self.cancel_callbacks.append(callback)
+
+    def confirm_cancels(self):
+        callbacks, self.cancel_callbacks = self.cancel_callbacks, []
+        for callback in callbacks:
+            callback(None)
+
+
+class TestPrefetchCount:
+    def start_consuming(self):
+        connection = PikaSelectConnection(None, 'queue', owner=None, options={}, is_consumer=True)
+        consumer_channel = connection._channels[0]
+        channel = FakeConsumingChannel(1)
+        connection._attach_channel(consumer_channel, channel)
+        channel.basic_qos(consumer_channel.prefetch_count)
+        connection._basic_consume(consumer_channel)
+        return connection, consumer_channel, channel
+
+    def test_new_prefetch_count_reaches_active_consumer(self):
+        connection, consumer_channel, channel = self.start_consuming()
+        assert list(channel.consumers.values()) == [('queue', 1)]
+
+        connection.set_prefetch_count(8)
+        # consumer is restarted once its cancel is confirmed
+        assert channel.consumers == {}
+        channel.confirm_cancels()
+        assert list(channel.consumers.values()) == [('queue', 8)]
+        assert list(consumer_channel.consumer_tags.values()) == list(channel.consumers)
+        assert consumer_channel.consuming
+
+    def test_consumer_is_not_restarted_for_the_same_prefetch_count(self):
+        connection, _consumer_channel, channel = self.start_consuming()
+        consumers = dict(channel.consumers)
+        connection.set_prefetch_count(1)
+        assert channel.consumers == consumers
+        assert channel.cancel_callbacks == []
+
+    def test_consumer_is_not_restarted_while_consuming_is_stopped(self):
+        connection, consumer_channel, channel = self.start_consuming()
+        stopped = []
+        connection.stop = lambda: stopped.append(True)
+        connection.set_prefetch_count(8)
+        connection.stop_consuming()
+        channel.confirm_cancels()
+        assert channel.consumers == {}
+        assert consumer_channel.consumer_tags == {}
+        assert stopped == [True]
@@ -0,0 +1,38 @@
+from rmq.connections.delivery_confirmation_tracker import DeliveryConfirmationTracker
+
+
+class TestDeliveryConfirmationTracker:
+    def test_single_confirm(self):
+        tracker = DeliveryConfirmationTracker()
+        for tag in range(1, 4):
+            tracker.add(tag)
+        assert tracker.confirm(2) == [2]
+        assert tracker.confirm(2) == []
+        assert tracker.in_flight == 2
+        assert tracker.acked == 1
+
+    def test_multiple_confirm_pops_head_up_to_tag(self):
+        tracker = DeliveryConfirmationTracker()
+        for tag in range(1, 6):
+            tracker.add(tag)
+        tracker.confirm(2)
+        assert tracker.confirm(4, multiple=True, is_ack=False) == [1, 3, 4]
+        assert tracker.in_flight == 1
+        assert tracker.nacked == 3 and tracker.acked == 1
+
+    def test_reset_drops_unconfirmed(self):
+        tracker = DeliveryConfirmationTracker()
+        tracker.add(1)
+        tracker.reset()
+        assert tracker.in_flight == 0
+        assert tracker.oldest_unconfirmed_age == 0.0
+        assert tracker.confirm(1) == []
+
+    def test_stats_and_histogram(self):
+        tracker = DeliveryConfirmationTracker()
+        tracker.add(1)
+        tracker.add(2)
+        tracker.confirm(2, multiple=True)
+        stats = tracker.get_stats()
+        assert stats["published"] == 2 and stats["acked"] == 2 and stats["in_flight"] == 0
+        assert sum(tracker.get_latency_histogram().values()) == 2
@@ -0,0 +1,94 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import uuid
+
+import pytest
+from pika import BasicProperties
+
+import rmq.utils.message_codecs as message_codecs
+from rmq.exceptions import UnsupportedMessageCodec
+from rmq.utils import MessageCodec, decode_message_body
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+SAMPLE = {
+    'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+    'date': datetime.date(2024, 1, 2),
+    'time': datetime.time(3, 4, 5),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'decimal': decimal.Decimal('1.10'),
+    'enum': Color.RED,
+    'dataclass': Point(1, 2),
+    'nested': [{'datetime': datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)}],
+    'text': 'привіт',
+}
+
+
+class TestMessageCodecs:
+    def test_default_hook_converts_unsupported_values(self):
+        assert json.loads(message_codecs._json_dumps(SAMPLE)) == {
+            'datetime': 1704164645,
+            'date': '2024-01-02',
+            'time': '03:04:05',
+            'uuid': '12345678-1234-5678-1234-567812345678',
+            'decimal': '1.10',
+            'enum': 'red',
+            'dataclass': {'x': 1, 'y': 2},
+            'nested': [{'datetime': 1704153600}],
+            'text': 'привіт',
+        }
+
+    @pytest.mark.skipif(message_codecs.orjson is None, reason='orjson is not installed')
+    def test_orjson_and_json_produce_the_same_bytes(self):
+        assert message_codecs._orjson_dumps(SAMPLE) == message_codecs._json_dumps(SAMPLE)
+
+    @pytest.mark.skipif(message_codecs.msgpack is None, reason='msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        codec = MessageCodec(content_type='application/msgpack')
+        body, properties = codec.encode(SAMPLE)
+        assert properties == {'content_type': 'application/msgpack'}
+        decoded = decode_message_body(body, BasicProperties(**properties))
+        assert decoded == json.loads(message_codecs._json_dumps(SAMPLE))
+
+    def test_unsupported_value_raises(self):
+        with pytest.raises(TypeError):
+            message_codecs._json_dumps({'value': object()})
+
+    def test_compressed_round_trip(self):
+        codec = MessageCodec(content_encoding='zlib', compress_min_size=10)
+        body, properties = codec.encode({'text': 'x' * 100})
+        assert properties == {'content_type': 'application/json', 'content_encoding': 'zlib'}
+        assert decode_message_body(body, BasicProperties(**properties)) == {'text': 'x' * 100}
+
+    def test_small_bodies_are_not_compressed(self):
+        codec = MessageCodec(content_encoding='zlib', compress_min_size=1000)
+        body, properties = codec.encode({'a': 1})
+        assert 'content_encoding' not in properties
+        assert decode_message_body(body, BasicProperties(**properties)) == {'a': 1}
+
+    def test_messages_without_content_type_are_json(self):
+        assert decode_message_body(b'{"a": 1}') == {'a': 1}
+        assert decode_message_body(b'{"a": 1}', BasicProperties(content_type='')) == {'a': 1}
+
+    def test_content_type_parameters_are_ignored(self):
+        properties = BasicProperties(content_type='Application/JSON; charset=utf-8')
+        assert decode_message_body(b'{"a": 1}', properties) == {'a': 1}
+
+    def test_unregistered_content_type_raises(self):
+        registry = message_codecs.MessageCodecRegistry()
+        registry.register_serializer('application/json', message_codecs._json_dumps, json.loads)
+        properties = BasicProperties(content_type='application/msgpack')
+        with pytest.raises(UnsupportedMessageCodec):
+            decode_message_body(b'\x81\xa1a\x01', properties, registry=registry)
@@ -0,0 +1,61 @@
+import threading
+
+from rmq.connections.outbound_command_buffer import OutboundCommandBuffer
+
+
+class TestOutboundCommandBuffer:
+    def test_only_first_put_requests_wakeup(self):
+        buffer = OutboundCommandBuffer()
+        assert buffer.put(lambda: 1) is True
+        assert buffer.put(lambda: 2) is False
+        assert buffer.put(lambda: 3) is False
+        assert len(buffer) == 3
+
+    def test_pop_batch_keeps_order_and_rearms_wakeup(self):
+        buffer = OutboundCommandBuffer()
+        for value in range(3):
+            buffer.put(lambda value=value: value)
+        batch, has_more = buffer.pop_batch()
+        assert [command() for command in batch] == [0, 1, 2]
+        assert has_more is False
+        assert buffer.put(lambda: 3) is True
+
+    def test_pop_batch_is_bounded_by_max_batch_size(self):
+        buffer = OutboundCommandBuffer(max_batch_size=2)
+        for value in range(5):
+            buffer.put(lambda value=value: value)
+        batch, has_more = buffer.pop_batch()
+        assert len(batch) == 2 and has_more is True
+        # drain is still scheduled while commands are left
+        assert buffer.put(lambda: 5) is False
+        batch, has_more = buffer.pop_batch()
+        assert len(batch) == 2 and has_more is True
+        batch, has_more = buffer.pop_batch()
+        assert [command() for command in batch] == [4, 5]
+        assert has_more is False
+
+    def test_reset_drain_schedule(self):
+        buffer = OutboundCommandBuffer()
+        assert buffer.reset_drain_schedule() is False
+        buffer.put(lambda: 1)
+        assert buffer.reset_drain_schedule() is True
+        assert buffer.put(lambda: 2) is False
+
+    def test_concurrent_puts_request_single_wakeup(self):
+        buffer = OutboundCommandBuffer(max_batch_size=0)
+        wakeups = []
+
+        def put_many():
+            for _ in range(1000):
+                if buffer.put(lambda: None):
+                    wakeups.append(1)
+
+        threads = [threading.Thread(target=put_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(wakeups) == 1
+        batch, has_more = buffer.pop_batch()
+        assert len(batch) == 8000 and has_more is False
+        assert buffer.get_stats()["commands"] == 8000
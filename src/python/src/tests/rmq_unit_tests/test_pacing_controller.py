@@ -0,0 +1,67 @@
+import pytest
+from scrapy.settings import Settings
+
+from rmq.utils.pacing_controller import PacingController
+
+
+class TestPacingController:
+    def test_produces_missing_messages_below_target(self):
+        controller = PacingController(target_depth=100, max_chunk_size=50)
+        controller.observe(80, now=0)
+        assert controller.should_produce
+        assert controller.chunk_size == 20
+        assert controller.interval == 0
+
+    def test_chunk_size_is_bounded(self):
+        controller = PacingController(target_depth=1000, min_chunk_size=5, max_chunk_size=50)
+        controller.observe(0, now=0)
+        assert controller.chunk_size == 50
+        controller.observe(998, now=1)
+        assert controller.chunk_size == 5
+
+    def test_drain_rate_counts_published_messages(self):
+        controller = PacingController(target_depth=1000)
+        controller.observe(100, now=0)
+        controller.on_published(50)
+        controller.observe(110, now=2)
+        # 100 + 50 published - 110 left = 40 drained in 2 seconds
+        assert controller.drain_rate == 20
+
+    def test_drain_rate_is_smoothed(self):
+        controller = PacingController(target_depth=1000, smoothing=0.5)
+        controller.observe(100, now=0)
+        controller.observe(80, now=1)
+        controller.observe(80, now=2)
+        assert controller.drain_rate == 10
+
+    def test_waits_for_excess_to_drain(self):
+        controller = PacingController(target_depth=100, max_chunk_size=10, max_interval=300)
+        controller.observe(200, now=0)
+        controller.observe(190, now=1)
+        assert not controller.should_produce
+        # (90 excess + 10 chunk) / 10 msg/s
+        assert controller.interval == pytest.approx(10)
+        assert controller.get_stats()["paused"] == 2
+
+    def test_backs_off_while_queue_is_not_drained(self):
+        controller = PacingController(target_depth=100, min_interval=1, max_interval=5)
+        intervals = []
+        for now in range(5):
+            controller.observe(200, now=now)
+            intervals.append(controller.interval)
+        assert intervals == [1, 2, 4, 5, 5]
+
+    def test_from_settings(self):
+        settings = Settings(
+            {
+                "PRODUCER_TARGET_QUEUE_DEPTH": 10,
+                "PRODUCER_MIN_CHUNK_SIZE": 2,
+                "PRODUCER_MIN_POLL_INTERVAL": 0.5,
+                "PRODUCER_MAX_POLL_INTERVAL": 60,
+            }
+        )
+        controller = PacingController.from_settings(settings, max_chunk_size=1)
+        assert controller.target_depth == 10
+        # max chunk size is never below min chunk size
+        assert controller.max_chunk_size == 2
+        assert (controller.min_interval, controller.max_interval) == (0.5, 60)
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import types
+
+from rmq.connections import PikaAsyncioConnection
+
+
+def _connection(event_loop):
+    connection = PikaAsyncioConnection(None, 'queue', owner=None, options={'stats_interval': 1})
+    connection.connection = types.SimpleNamespace(ioloop=event_loop)
+    return connection
+
+
+class TestPikaAsyncioConnection:
+    def test_add_callback_threadsafe_runs_callbacks_on_event_loop(self):
+        event_loop = asyncio.new_event_loop()
+        connection = _connection(event_loop)
+        executed = []
+
+        def schedule():
+            for value in range(3):
+                connection.add_callback_threadsafe(lambda value=value: executed.append(value))
+            event_loop.call_soon_threadsafe(event_loop.stop)
+
+        try:
+            thread = threading.Thread(target=schedule)
+            thread.start()
+            event_loop.run_forever()
+            thread.join()
+            # drain is scheduled before the stop callback, it could be left for the next iteration
+            event_loop.run_until_complete(asyncio.sleep(0))
+        finally:
+            event_loop.close()
+        assert executed == [0, 1, 2]
+
+    def test_timers_are_cancelled_with_handles(self):
+        event_loop = asyncio.new_event_loop()
+        connection = _connection(event_loop)
+        try:
+            connection._schedule_stats_dump()
+            stats_timer = connection._stats_timer
+            connection._cancel_stats_dump()
+            assert stats_timer.cancelled()
+            assert connection._stats_timer is None
+        finally:
+            event_loop.close()
@@ -0,0 +1,60 @@
+from scrapy.settings import Settings
+
+from rmq.utils.prefetch_controller import PrefetchController
+
+
+def _update(controller, latency, unacked_count, running_interactions, pool_size=10):
+    controller.on_processed(latency)
+    controller.on_unacked_count(unacked_count)
+    return controller.update(running_interactions, pool_size)
+
+
+class TestPrefetchController:
+    def test_no_change_without_processed_messages(self):
+        controller = PrefetchController(10)
+        controller.on_unacked_count(10)
+        assert controller.update(0, 10) is None
+
+    def test_increases_while_prefetch_is_bottleneck(self):
+        controller = PrefetchController(10, increase_step=2)
+        assert _update(controller, 0.01, unacked_count=10, running_interactions=5) == 12
+        assert _update(controller, 0.01, unacked_count=12, running_interactions=5) == 14
+        assert controller.get_stats()['increases'] == 2
+
+    def test_keeps_prefetch_while_not_all_messages_are_busy(self):
+        controller = PrefetchController(10)
+        assert _update(controller, 0.01, unacked_count=4, running_interactions=4) is None
+
+    def test_decreases_when_latency_grows(self):
+        controller = PrefetchController(20, latency_tolerance=2, decrease_factor=0.5)
+        assert _update(controller, 0.01, unacked_count=0, running_interactions=1) is None
+        assert _update(controller, 0.05, unacked_count=20, running_interactions=1) == 10
+        assert controller.get_stats()['decreases'] == 1
+
+    def test_decreases_when_interactions_wait_for_pool(self):
+        controller = PrefetchController(20, decrease_factor=0.5)
+        assert _update(controller, 0.01, unacked_count=20, running_interactions=15) == 10
+
+    def test_prefetch_count_is_bounded(self):
+        controller = PrefetchController(
+            3, min_prefetch_count=2, max_prefetch_count=4, decrease_factor=0.1
+        )
+        assert _update(controller, 0.01, unacked_count=3, running_interactions=0) == 4
+        assert _update(controller, 0.01, unacked_count=4, running_interactions=0) is None
+        assert _update(controller, 0.01, unacked_count=4, running_interactions=20) == 2
+
+    def test_baseline_follows_the_lowest_latency_and_drifts_up(self):
+        controller = PrefetchController(10, baseline_drift=2)
+        _update(controller, 0.04, unacked_count=0, running_interactions=0)
+        _update(controller, 0.01, unacked_count=0, running_interactions=0)
+        assert controller.baseline_latency == 0.01
+        _update(controller, 0.01, unacked_count=0, running_interactions=0)
+        assert controller.baseline_latency == 0.02
+
+    def test_from_settings(self):
+        settings = Settings(
+            {'CONSUMER_MIN_PREFETCH_COUNT': 5, 'CONSUMER_MAX_PREFETCH_COUNT': 50}
+        )
+        controller = PrefetchController.from_settings(settings, 100)
+        assert controller.prefetch_count == 50
+        assert controller.min_prefetch_count == 5
@@ -0,0 +1,206 @@
+import argparse
+
+import pytest
+from scrapy.exceptions import UsageError
+from scrapy.settings import Settings
+from twisted.internet import defer, task
+
+pytest.importorskip('MySQLdb')
+
+from rmq.commands import producer as producer_module  # noqa: E402
+from rmq.commands.producer import Producer  # noqa: E402
+from rmq.utils import TaskStatusCodes  # noqa: E402
+
+
+class FakeConnection:
+    has_publish_capacity = True
+
+
+class FakePacingController:
+    def __init__(self):
+        self.published = 0
+
+    def on_published(self, count):
+        self.published += count
+
+
+class TasksProducer(Producer):
+    def __init__(self):
+        super().__init__()
+        self.mode = Producer.CommandModes.WORKER.value
+        self.rmq_connection = FakeConnection()
+        self.pacing_controller = FakePacingController()
+        self.sent = []
+        self.updates = []
+        self.update_result = None
+        self.fetches = 0
+
+    def short_desc(self):
+        return 'Tasks producer'
+
+    def _send_message(self, msg_body, on_confirm=None, priority=None, queue_name=None):
+        self.sent.append((msg_body, on_confirm))
+
+    def update_tasks_status(self, db_tasks, status):
+        self.updates.append(([db_task['id'] for db_task in db_tasks], status))
+        if isinstance(self.update_result, Exception):
+            return defer.fail(self.update_result)
+        return defer.succeed(self.update_result)
+
+    def produce_tasks(self, is_message_count_validated=False):
+        self.fetches += 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = task.Clock()
+    monkeypatch.setattr(producer_module, 'reactor', clock)
+    return clock
+
+
+@pytest.fixture
+def producer(clock):
+    producer = TasksProducer()
+    producer._chunks_in_progress = 1
+    return producer
+
+
+def build_chunk(*task_ids):
+    return [{'id': task_id} for task_id in task_ids], [{'task': task_id} for task_id in task_ids]
+
+
+class TestProducerOptions:
+    def parse_options(self, *args):
+        producer = TasksProducer()
+        producer.settings = Settings()
+        parser = argparse.ArgumentParser()
+        producer.add_options(parser)
+        opts = parser.parse_args(list(args))
+        producer.process_options([], opts)
+        return opts
+
+    def test_confirmed_is_rejected_with_claim(self, clock):
+        with pytest.raises(UsageError):
+            self.parse_options('--claim', '--confirmed')
+
+    def test_confirmed_and_claim_are_accepted_separately(self, clock):
+        assert self.parse_options('--confirmed').confirm_publishes
+        assert self.parse_options('--claim').claim_tasks
+
+
+class TestProducerTaskUpdates:
+    def test_tasks_are_marked_in_queue_after_publishing(self, producer, clock):
+        producer._send_tasks(*build_chunk(1, 2))
+        assert producer.updates == [([1, 2], TaskStatusCodes.IN_QUEUE.value)]
+        assert producer._chunks_in_progress == 0
+        clock.advance(0)
+        assert producer.fetches == 1
+
+    def test_claimed_tasks_are_not_updated_again(self, producer):
+        producer.claim_tasks = True
+        producer._send_tasks(*build_chunk(1, 2))
+        assert producer.updates == []
+        assert producer._chunks_in_progress == 0
+
+    def test_update_failure_releases_chunk_slot(self, producer, clock):
+        producer.update_result = RuntimeError('lost connection')
+        producer._send_tasks(*build_chunk(1))
+        assert producer._chunks_in_progress == 0
+        clock.advance(0)
+        assert producer.fetches == 1
+
+
+class TestProducerConfirmedTasks:
+    @pytest.fixture
+    def producer(self, producer):
+        producer.confirm_publishes = True
+        return producer
+
+    def test_tasks_are_updated_only_after_confirmation(self, producer):
+        producer._send_tasks(*build_chunk(1, 2))
+        assert producer.updates == []
+        for _msg_body, on_confirm in producer.sent:
+            on_confirm(True)
+        assert producer.updates == [([1, 2], TaskStatusCodes.IN_QUEUE.value)]
+        assert producer._chunks_in_progress == 0
+
+    def test_nacked_tasks_are_republished(self, producer, clock):
+        producer._send_tasks(*build_chunk(1, 2))
+        producer.sent[0][1](True)
+        producer.sent[1][1](False)
+        assert producer.updates == [([1], TaskStatusCodes.IN_QUEUE.value)]
+        # chunk slot is held until nacked task is confirmed
+        assert producer._chunks_in_progress == 1
+
+        clock.advance(producer.check_interact_ready_delay)
+        assert [msg_body for msg_body, _on_confirm in producer.sent] == [
+            {'task': 1},
+            {'task': 2},
+            {'task': 2},
+        ]
+        producer.sent[2][1](True)
+        assert producer.updates[-1] == ([2], TaskStatusCodes.IN_QUEUE.value)
+        assert producer._chunks_in_progress == 0
+
+    def test_confirmation_error_keeps_status_and_releases_chunk_slot(self, producer, clock):
+        producer._send_tasks(*build_chunk(1, 2))
+        producer.sent[0][1](True)
+        producer.sent[1][1].__self__.errback(RuntimeError('channel closed'))
+        assert producer.updates == []
+        assert producer._chunks_in_progress == 0
+        clock.advance(0)
+        assert producer.fetches == 1
+
+
+class TestProducerPipeline:
+    @pytest.fixture
+    def producer(self, producer):
+        # chunks stay in progress until their publishes are confirmed
+        producer.confirm_publishes = True
+        producer._chunks_in_progress = 0
+        return producer
+
+    def confirm_chunk(self, producer, position):
+        producer.sent[position][1](True)
+
+    @pytest.mark.parametrize(
+        'claim_tasks, keyset_cursor, pipeline_depth, expected',
+        [
+            (False, False, 3, 1),
+            (True, False, 3, 3),
+            (False, True, 3, 3),
+            (True, False, 0, 1),
+        ],
+    )
+    def test_pipeline_depth(self, producer, claim_tasks, keyset_cursor, pipeline_depth, expected):
+        producer.claim_tasks = claim_tasks
+        producer.keyset_cursor = keyset_cursor
+        opts = argparse.Namespace(pipeline_depth=pipeline_depth)
+        assert producer.init_pipeline_depth(opts) == expected
+        assert producer.pipeline_depth == expected
+
+    def test_next_chunk_is_fetched_while_chunks_are_published(self, producer, clock):
+        producer.pipeline_depth = 2
+        producer.process_tasks(build_chunk(1))
+        clock.advance(0)
+        assert producer.fetches == 1
+
+        producer.process_tasks(build_chunk(2))
+        clock.advance(0)
+        # pipeline is full
+        assert producer.fetches == 1
+        assert producer._chunks_in_progress == 2
+
+        self.confirm_chunk(producer, 0)
+        clock.advance(0)
+        assert producer.fetches == 2
+        assert producer._chunks_in_progress == 1
+
+    def test_chunks_are_produced_sequentially_by_default(self, producer, clock):
+        producer.process_tasks(build_chunk(1))
+        clock.advance(0)
+        assert producer.fetches == 0
+
+        self.confirm_chunk(producer, 0)
+        clock.advance(0)
+        assert producer.fetches == 1
@@ -0,0 +1,54 @@
+from rmq.connections.publish_window import PublishWindow
+
+
+class TestPublishWindow:
+    def test_unlimited_window_never_waits(self):
+        window = PublishWindow(0)
+        for _ in range(100):
+            window.acquire()
+        assert window.has_capacity
+        assert window.wait().called
+
+    def test_waiter_fires_when_slot_is_released(self):
+        window = PublishWindow(2)
+        window.acquire()
+        window.acquire()
+        waiter = window.wait()
+        assert not waiter.called
+        window.release()
+        assert waiter.called
+        assert window.get_stats()["waits"] == 1
+
+    def test_waiters_fire_in_order_while_capacity_lasts(self):
+        window = PublishWindow(1)
+        window.acquire()
+        fired = []
+
+        def publish(_result, name):
+            fired.append(name)
+            window.acquire()
+
+        for name in ('first', 'second'):
+            window.wait().addCallback(publish, name)
+        window.release()
+        assert fired == ['first']
+        window.release()
+        assert fired == ['first', 'second']
+
+    def test_blocked_window_has_no_capacity(self):
+        window = PublishWindow(0)
+        window.set_blocked(True)
+        waiter = window.wait()
+        assert not waiter.called
+        window.set_blocked(False)
+        assert waiter.called
+        assert window.blocked_count == 1
+
+    def test_reset_releases_slots_and_unblocks(self):
+        window = PublishWindow(1)
+        window.acquire()
+        window.set_blocked(True)
+        waiter = window.wait()
+        window.reset()
+        assert waiter.called
+        assert window.in_flight == 0
@@ -0,0 +1,155 @@
+import types
+
+import pika
+
+from rmq.connections import PikaSelectConnection
+from rmq.connections.retry_topology import RETRY_ATTEMPTS_HEADER, RetryTopology
+
+
+def _properties(x_death=None, **headers):
+    if x_death is not None:
+        headers['x-death'] = x_death
+    return pika.BasicProperties(headers=headers)
+
+
+class FakeChannel:
+    is_open = True
+    channel_number = 1
+
+    def __init__(self):
+        self.published = []
+        self.acks = []
+        self.nacks = []
+
+    def confirm_delivery(self, callback):
+        self.on_confirm = callback
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties.headers))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag):
+        self.nacks.append(delivery_tag)
+
+
+def _connection(channel, enable_confirmations=True):
+    connection = PikaSelectConnection(
+        None,
+        'tasks',
+        owner=None,
+        options={'retry_max_attempts': 2, 'batch_acknowledgements': False},
+        is_consumer=True,
+    )
+    connection._channel = channel
+    connection._attach_channel(connection._channels[0], channel)
+    connection._declared_queues = {
+        queue_name
+        for queue_name, _arguments in connection._retry_topology.get_queue_declarations(['tasks'])
+    }
+    if enable_confirmations:
+        connection.enable_delivery_confirmations()
+    return connection
+
+
+def _deliver(connection, channel, properties):
+    method = types.SimpleNamespace(delivery_tag=1, routing_key='tasks')
+    connection._accept_delivery(channel, method)
+    connection._track_retry_delivery(method, properties, b'body')
+    return method.delivery_tag
+
+
+def _confirmation(name):
+    return types.SimpleNamespace(
+        method=types.SimpleNamespace(NAME=name, delivery_tag=1, multiple=False)
+    )
+
+
+class TestRetryTopology:
+    def test_queue_declarations(self):
+        topology = RetryTopology(
+            'tasks', max_attempts=3, base_delay=2, delay_factor=3, tiers_count=2
+        )
+        assert topology.get_queue_declarations(['tasks.0']) == [
+            (
+                'tasks.0.retry.0',
+                {
+                    'x-message-ttl': 2000,
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': 'tasks.0',
+                },
+            ),
+            (
+                'tasks.0.retry.1',
+                {
+                    'x-message-ttl': 6000,
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': 'tasks.0',
+                },
+            ),
+            ('tasks.parking', None),
+        ]
+
+    def test_attempts_are_counted_by_expirations_in_retry_tiers(self):
+        topology = RetryTopology('tasks', max_attempts=5)
+        properties = _properties(
+            [
+                {'queue': b'tasks.retry.1', 'reason': 'expired', 'count': 1},
+                {'queue': 'tasks.retry.0', 'reason': 'expired', 'count': 2},
+                {'queue': 'tasks', 'reason': 'rejected', 'count': 4},
+            ]
+        )
+        assert topology.get_attempts('tasks', properties) == 3
+        assert topology.get_attempts('tasks', _properties(**{RETRY_ATTEMPTS_HEADER: 4})) == 4
+        assert topology.get_attempts('tasks', pika.BasicProperties()) == 0
+
+    def test_route_through_tiers_to_parking_queue(self):
+        topology = RetryTopology('tasks', max_attempts=4, tiers_count=2)
+        routes = [
+            topology.route('tasks', _properties(**{RETRY_ATTEMPTS_HEADER: attempts}))
+            for attempts in range(4)
+        ]
+        assert routes == [
+            ('tasks.retry.0', 1),
+            ('tasks.retry.1', 2),
+            ('tasks.retry.1', 3),
+            ('tasks.parking', 4),
+        ]
+
+
+class TestRetryQueueConnection:
+    def test_retry_enables_delivery_confirmations(self):
+        connection = PikaSelectConnection(
+            None,
+            'tasks',
+            owner=None,
+            options={'enable_delivery_confirmations': False, 'retry_max_attempts': 2},
+            is_consumer=True,
+        )
+        assert connection._requires_delivery_confirmations
+
+    def test_nacked_delivery_is_acked_after_retry_copy_is_confirmed(self):
+        channel = FakeChannel()
+        connection = _connection(channel)
+        delivery_tag = _deliver(connection, channel, pika.BasicProperties())
+        connection.negative_acknowledge_message(delivery_tag)
+        assert channel.published == [('tasks.retry.0', b'body', {RETRY_ATTEMPTS_HEADER: 1})]
+        assert (channel.acks, channel.nacks) == ([], [])
+
+        connection.on_delivery_confirmation(_confirmation('Basic.Ack'))
+        assert (channel.acks, channel.nacks) == ([1], [])
+
+    def test_nacked_retry_copy_requeues_delivery(self):
+        channel = FakeChannel()
+        connection = _connection(channel)
+        connection.negative_acknowledge_message(_deliver(connection, channel, _properties()))
+        connection.on_delivery_confirmation(_confirmation('Basic.Nack'))
+        assert (channel.acks, channel.nacks) == ([], [1])
+
+    def test_delivery_is_requeued_without_delivery_confirmations(self):
+        channel = FakeChannel()
+        connection = _connection(channel, enable_confirmations=False)
+        connection.negative_acknowledge_message(_deliver(connection, channel, _properties()))
+        assert channel.published == []
+        assert (channel.acks, channel.nacks) == ([], [1])
@@ -0,0 +1,62 @@
+import sys
+import threading
+
+from sqlalchemy import column, table, update
+from sqlalchemy.dialects import mysql
+
+from rmq.utils.sql_expressions import CompiledExpressionCache
+
+tasks = table('tasks', column('id'), column('status'), column('attempts'))
+
+
+def _update(column_name, task_id):
+    return update(tasks).where(tasks.c.id == task_id).values({column_name: 1})
+
+
+class TestCompiledExpressionCache:
+    def test_statements_differing_by_values_share_compiled_sql(self):
+        cache = CompiledExpressionCache()
+        first = cache.compile(_update('status', 1), mysql.dialect())
+        second = cache.compile(_update('status', 2), mysql.dialect())
+        assert first[0] == second[0]
+        assert (first[1], second[1]) == ((1, 1), (1, 2))
+        assert cache.get_stats()['hits'] == 1
+
+    def test_least_recently_used_expression_is_evicted(self):
+        cache = CompiledExpressionCache(maxsize=2)
+        for column_name in ('status', 'attempts', 'status', 'id'):
+            cache.compile(_update(column_name, 1), mysql.dialect())
+        cache.compile(_update('status', 1), mysql.dialect())
+        stats = cache.get_stats()
+        assert stats['size'] == 2
+        assert (stats['hits'], stats['misses']) == (2, 3)
+
+    def test_cache_is_shared_by_threads(self):
+        # frequent thread switches interleave lookups and evictions of the same keys
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        cache = CompiledExpressionCache(maxsize=2)
+        errors = []
+
+        def compile_updates(thread_index):
+            try:
+                for index in range(200):
+                    column_name = ('id', 'status', 'attempts')[(index + thread_index) % 3]
+                    sql, params = cache.compile(_update(column_name, index), mysql.dialect())
+                    assert params == (1, index)
+                    assert f'SET {column_name}=' in sql
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=compile_updates, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert errors == []
+        stats = cache.get_stats()
+        assert stats['size'] <= 2
+        assert stats['hits'] + stats['misses'] == 8 * 200
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, func
+from sqlalchemy.dialects import mysql
+
+from rmq.utils.sql_expressions import stringify_expression
+from rmq.utils.staging_table_loader import StagingTableLoader, _escape_load_data_value
+
+metadata = MetaData()
+results = Table(
+    'results',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title_', String(255), key='title'),
+    Column('status', Integer, default=0),
+)
+
+
+def _insert_stmt(**values):
+    stmt = mysql.insert(results).values(values)
+    return stmt.on_duplicate_key_update({'title': stmt.inserted.title})
+
+
+class FakeTransaction:
+    def __init__(self):
+        self.statements = []
+        self.spill_file_content = None
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if sql.startswith('LOAD DATA'):
+            spill_file_name = params[0]
+            with open(spill_file_name, 'rb') as spill_file:
+                self.spill_file_content = spill_file.read()
+            self.rowcount = self.spill_file_content.count(b'\n')
+            self.spill_file_name = spill_file_name
+
+
+class TestStagingTableLoader:
+    def test_get_row_takes_values_without_compiling(self):
+        row = StagingTableLoader.get_row(_insert_stmt(id=1, title='first'))
+        assert row == {'id': 1, 'title_': 'first', 'status': 0}
+        row = StagingTableLoader.get_row(_insert_stmt(id=2, title=None, status=2))
+        assert row == {'id': 2, 'title_': None, 'status': 2}
+
+    def test_get_row_refuses_sql_expressions(self):
+        with pytest.raises(NotImplementedError):
+            StagingTableLoader.get_row(_insert_stmt(id=1, title=func.upper('first')))
+
+    def test_merge_stmt_keeps_on_duplicate_key_update(self):
+        merge_stmt = StagingTableLoader.build_merge_stmt(
+            _insert_stmt(id=1, title='first'), '_staging_results', ['id', 'title_']
+        )
+        assert ' '.join(stringify_expression(merge_stmt).split()) == (
+            'INSERT INTO results (id, title_) SELECT _staging_results.id, _staging_results.title_ '
+            'FROM _staging_results ON DUPLICATE KEY UPDATE title_ = VALUES(title_)'
+        )
+
+    def test_merge_stmt_keeps_update_expressions_and_their_order(self):
+        stmt = mysql.insert(results).values(id=1, title='first')
+        stmt = stmt.on_duplicate_key_update(
+            [
+                ('status', func.greatest(results.c.status, stmt.inserted.status)),
+                ('title', 'updated'),
+            ]
+        )
+        merge_stmt = StagingTableLoader.build_merge_stmt(
+            stmt, '_staging_results', ['id', 'title_', 'status']
+        )
+        assert stringify_expression(merge_stmt).endswith(
+            'ON DUPLICATE KEY UPDATE status = greatest(results.status, VALUES(status)), '
+            'title_ = %s'
+        )
+
+    def test_escape_load_data_value(self):
+        assert _escape_load_data_value(None) == b'\\N'
+        assert _escape_load_data_value(True) == b'1'
+        assert _escape_load_data_value('a\tb\\c\nd') == b'a\\tb\\\\c\\nd'
+        assert _escape_load_data_value({'key': 1}) == b'{"key": 1}'
+
+    def test_load_spills_rows_and_merges_them(self):
+        loader = StagingTableLoader()
+        transaction = FakeTransaction()
+        rows = map(
+            StagingTableLoader.get_row,
+            [_insert_stmt(id=1, title='first'), _insert_stmt(id=2, title=None)],
+        )
+        assert loader.load(transaction, _insert_stmt(id=1, title='first'), rows) == 2
+        assert transaction.spill_file_content == b'1\tfirst\t0\n2\t\\N\t0\n'
+        assert not os.path.exists(transaction.spill_file_name)
+        assert transaction.statements[:2] == [
+            'DROP TEMPORARY TABLE IF EXISTS _staging_results',
+            'CREATE TEMPORARY TABLE _staging_results '
+            'SELECT id, title_, status FROM results LIMIT 0',
+        ]
+        assert transaction.statements[3].startswith('INSERT INTO results (id, title_, status)')
+        assert transaction.statements[4] == 'DROP TEMPORARY TABLE _staging_results'
+        assert loader.get_stats() == {'loads': 1, 'loaded_rows': 2}
+
+    def test_load_fails_when_rows_are_skipped(self):
+        transaction = FakeTransaction()
+        execute = transaction.execute
+
+        def execute_skipping_row(sql, params=None):
+            execute(sql, params)
+            if sql.startswith('LOAD DATA'):
+                transaction.rowcount -= 1
+
+        transaction.execute = execute_skipping_row
+        rows = [{'id': 1, 'title_': 'first'}, {'id': 2, 'title_': 'second'}]
+        with pytest.raises(ValueError):
+            StagingTableLoader().load(transaction, _insert_stmt(id=1, title='first'), rows)
+        assert not os.path.exists(transaction.spill_file_name)
+
+    def test_load_fails_when_rows_have_different_columns(self):
+        transaction = FakeTransaction()
+        rows = [{'id': 1, 'title_': 'first'}, {'id': 2}]
+        with pytest.raises(ValueError):
+            StagingTableLoader().load(transaction, _insert_stmt(id=1, title='first'), rows)
+        assert not any(sql.startswith('LOAD DATA') for sql in transaction.statements)
+
+    def test_nothing_is_loaded_without_rows(self):
+        transaction = FakeTransaction()
+        assert StagingTableLoader().load(transaction, _insert_stmt(id=1), []) == 0
+        assert transaction.statements == []
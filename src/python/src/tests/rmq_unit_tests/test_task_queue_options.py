@@ -0,0 +1,71 @@
+import logging
+import types
+
+import pytest
+from scrapy.settings import Settings
+
+from rmq.connections import PikaSelectConnection
+from rmq.extensions.rpc_task_consumer import RPCTaskConsumer
+from rmq.utils import get_task_queue_options
+from rmq_alternative.middlewares.spider_middlewares.rmq_reader_middleware import (
+    RmqReaderMiddleware,
+)
+
+SETTINGS = {'RABBITMQ_MAX_PRIORITY': 10, 'RABBITMQ_TASK_QUEUE_SHARDS': 4}
+
+
+class RecordingConnection(PikaSelectConnection):
+    connections = []
+
+    def run(self):
+        RecordingConnection.connections.append(self)
+
+
+def _connect(owner_class, settings):
+    """Connection the owner creates for task queue, owner is not fully initialized"""
+    owner = object.__new__(owner_class)
+    spider = types.SimpleNamespace(settings=settings)
+    setattr(owner, f'_{owner_class.__name__}__spider', spider)
+    owner.connection_class = RecordingConnection
+    owner.logger = logging.getLogger(__name__)
+    RecordingConnection.connections = []
+    owner.connect(None, 'tasks')
+    return RecordingConnection.connections[0]
+
+
+def _declarations(connection):
+    queue_names = [connection.queue_name] + (connection._get_option('shard_queues') or [])
+    return {queue_name: connection._get_queue_arguments() for queue_name in queue_names}
+
+
+class TestTaskQueueOptions:
+    def test_consumer_declares_consumed_shards(self):
+        settings = Settings(dict(SETTINGS, RABBITMQ_CONSUMER_SHARDS='1-2'))
+        assert get_task_queue_options(settings, 'tasks') == {
+            'max_priority': 10,
+            'shard_queues': ['tasks.1', 'tasks.2'],
+        }
+
+    def test_producer_declares_all_shards(self):
+        settings = Settings(dict(SETTINGS, RABBITMQ_CONSUMER_SHARDS='1-2'))
+        options = get_task_queue_options(settings, 'tasks', shards_count=4)
+        assert options['shard_queues'] == ['tasks.0', 'tasks.1', 'tasks.2', 'tasks.3']
+
+    def test_queue_without_shards(self):
+        options = get_task_queue_options(Settings(), 'tasks', shards_count=1)
+        assert options == {'max_priority': 0, 'shard_queues': None}
+
+    @pytest.mark.parametrize('owner_class', [RPCTaskConsumer, RmqReaderMiddleware])
+    def test_consumers_declare_queues_like_producer(self, owner_class):
+        settings = Settings(SETTINGS)
+        producer_connection = PikaSelectConnection(
+            None,
+            'tasks',
+            owner=None,
+            options=get_task_queue_options(settings, 'tasks', shards_count=4),
+            is_consumer=False,
+        )
+        consumer_connection = _connect(owner_class, settings)
+        assert consumer_connection.is_consumer
+        assert _declarations(consumer_connection) == _declarations(producer_connection)
+        assert _declarations(consumer_connection)['tasks.3'] == {'x-max-priority': 10}
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from rmq.utils.task_stream import TaskStream
+
+
+class RecordingConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+
+
+def _stream(rows_count, connections=None, build_query=None):
+    database = sqlite3.connect(':memory:')
+    database.execute('CREATE TABLE tasks (id INTEGER PRIMARY KEY)')
+    database.executemany('INSERT INTO tasks VALUES (?)', [(i,) for i in range(1, rows_count + 1)])
+    connections = [] if connections is None else connections
+
+    def connect():
+        connections.append(RecordingConnection(database))
+        return connections[-1]
+
+    return TaskStream(connect, build_query or (lambda: ('SELECT id FROM tasks ORDER BY id', ())))
+
+
+class TestTaskStream:
+    def test_rows_of_single_query_are_read_by_chunks(self):
+        connections = []
+        stream = _stream(5, connections)
+        chunks = [stream.fetch_rows(2) for _ in range(3)]
+        assert chunks == [[(1,), (2,)], [(3,), (4,)], [(5,)]]
+        assert len(connections) == 1
+        assert len(connections[0].cursors) == 1
+        assert stream.get_stats() == {'queries': 1, 'fetched_rows': 5}
+
+    def test_query_is_rerun_after_result_is_exhausted(self):
+        last_ids = [0]
+        sql = 'SELECT id FROM tasks WHERE id > ? ORDER BY id'
+        stream = _stream(3, build_query=lambda: (sql, (last_ids[-1],)))
+        assert stream.fetch_rows(2) == [(1,), (2,)]
+        assert stream.fetch_rows(2) == [(3,)]
+        last_ids.append(2)
+        assert stream.fetch_rows(2) == [(3,)]
+        assert stream.get_stats()['queries'] == 2
+
+    def test_connection_is_reopened_after_error(self):
+        connections = []
+        queries = iter([('SELECT missing FROM tasks', ()), ('SELECT id FROM tasks', ())])
+        stream = _stream(1, connections, build_query=lambda: next(queries))
+        with pytest.raises(sqlite3.OperationalError):
+            stream.fetch_rows(10)
+        assert connections[0].closed
+        assert stream.fetch_rows(10) == [(1,)]
+        assert len(connections) == 2
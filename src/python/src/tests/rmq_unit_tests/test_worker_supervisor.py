@@ -0,0 +1,129 @@
+from twisted.internet.error import ProcessDone, ProcessExitedAlready, ProcessTerminated
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from rmq.utils import worker_supervisor
+from rmq.utils.worker_supervisor import WorkerSupervisor, split_budget
+
+
+class FakeTransport:
+    def __init__(self, pid):
+        self.pid = pid
+        self.signals = []
+        self.exited = False
+
+    def signalProcess(self, signal_name):
+        if self.exited:
+            raise ProcessExitedAlready()
+        self.signals.append(signal_name)
+
+
+class FakeReactor(Clock):
+    running = True
+
+    def __init__(self):
+        super().__init__()
+        self.spawned = []
+        self.stopped = False
+
+    def spawnProcess(self, process_protocol, executable, args, env, path, childFDs):
+        process_protocol.transport = FakeTransport(len(self.spawned) + 1)
+        self.spawned.append((process_protocol, args, env))
+
+    def addSystemEventTrigger(self, phase, event_type, callable_):
+        pass
+
+    def stop(self):
+        self.stopped = True
+
+
+def _supervisor(monkeypatch, workers_count=2, **kwargs):
+    fake_reactor = FakeReactor()
+    monkeypatch.setattr(worker_supervisor, 'reactor', fake_reactor)
+    supervisor = WorkerSupervisor(
+        workers_count,
+        lambda index: (['worker', str(index)], {'CONSUMER_WORKER_INDEX': str(index)}),
+        **kwargs,
+    )
+    supervisor.start()
+    return supervisor, fake_reactor
+
+
+def _end(worker, exit_code=0, signal=None):
+    worker.transport.exited = True
+    if exit_code == 0 and signal is None:
+        reason = ProcessDone(None)
+    else:
+        reason = ProcessTerminated(exitCode=exit_code, signal=signal)
+    worker.processEnded(Failure(reason))
+
+
+class TestWorkerSupervisor:
+    def test_starts_workers(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(monkeypatch)
+        assert [args for _worker, args, _env in fake_reactor.spawned] == [
+            ['worker', '0'],
+            ['worker', '1'],
+        ]
+        assert supervisor.get_stats() == {'workers': 2, 'done': 0, 'restarts': 0}
+
+    def test_reactor_is_stopped_when_all_workers_are_done(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(monkeypatch)
+        first, second = [worker for worker, _args, _env in fake_reactor.spawned]
+        _end(first)
+        assert not fake_reactor.stopped
+        _end(second)
+        assert fake_reactor.stopped
+        assert supervisor.get_stats()['done'] == 2
+
+    def test_crashed_worker_is_restarted_with_growing_delay(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(
+            monkeypatch, workers_count=1, restart_backoff_base=1, restart_backoff_max=3
+        )
+        delays = []
+        for _ in range(4):
+            worker = fake_reactor.spawned[-1][0]
+            _end(worker, exit_code=1)
+            delays.append(fake_reactor.getDelayedCalls()[0].getTime() - fake_reactor.seconds())
+            fake_reactor.advance(delays[-1])
+        assert delays == [1, 2, 3, 3]
+        assert len(fake_reactor.spawned) == 5
+        assert supervisor.get_stats() == {'workers': 1, 'done': 0, 'restarts': 4}
+
+    def test_backoff_is_reset_after_stable_uptime(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(monkeypatch, workers_count=1, stable_uptime=60)
+        _end(fake_reactor.spawned[-1][0], signal=9)
+        fake_reactor.advance(1)
+        worker = fake_reactor.spawned[-1][0]
+        worker.started_at -= 60
+        _end(worker, exit_code=1)
+        assert fake_reactor.getDelayedCalls()[0].getTime() - fake_reactor.seconds() == 1
+
+    def test_stop_terminates_and_then_kills_workers(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(monkeypatch, stop_timeout=30)
+        first, second = [worker for worker, _args, _env in fake_reactor.spawned]
+        stopped = supervisor.stop()
+        assert first.transport.signals == second.transport.signals == ['TERM']
+
+        _end(first, signal=15)
+        assert not stopped.called
+        fake_reactor.advance(30)
+        assert second.transport.signals == ['TERM', 'KILL']
+        _end(second, signal=9)
+        assert stopped.called
+        assert not fake_reactor.getDelayedCalls()
+
+    def test_stop_cancels_pending_restarts(self, monkeypatch):
+        supervisor, fake_reactor = _supervisor(monkeypatch, workers_count=1)
+        _end(fake_reactor.spawned[-1][0], exit_code=1)
+        assert supervisor.stop() is None
+        assert not fake_reactor.getDelayedCalls()
+
+
+class TestSplitBudget:
+    def test_budget_is_split_evenly(self):
+        assert split_budget(10, 3) == [4, 3, 3]
+        assert split_budget(9, 3) == [3, 3, 3]
+
+    def test_every_part_gets_at_least_one(self):
+        assert split_budget(2, 4) == [1, 1, 1, 1]